@@ -0,0 +1,355 @@
+"""
+Timeouts, retries, circuit breaking and hedging shared by every LLM call.
+
+The timeout of a call is derived from the latencies observed for its model (a high percentile
+times a safety multiplier), clamped between CALL_TIMEOUT_MIN and the client's `request_timeout`,
+and doubled on each retry after a timeout. It is set on the attempt's HTTP request (async attempts
+are cancelled), so a timed-out request is closed and Ollama stops generating for it. Failed attempts
+are retried with exponential backoff and full jitter. Each Ollama endpoint has a circuit breaker
+that opens after consecutive failures and lets a single probe through once its cooldown ends. With
+CALL_HEDGE_PERCENTILE set, a request still running past that latency percentile is issued a second
+time and the first answer wins. Every attempt is classified and counted in `call_policy.counts`.
+Clients of the endpoint pool are routed to a host per attempt, preferring hosts whose breaker is
+closed and that have not failed this call yet.
+"""
+import time
+import random
+import asyncio
+import threading
+import concurrent.futures
+from collections import Counter, defaultdict, deque
+import httpx
+from .config import (CALL_TIMEOUT_MIN, CALL_TIMEOUT_PERCENTILE, CALL_TIMEOUT_MULTIPLIER, CALL_LATENCY_WINDOW,
+                     CALL_LATENCY_MIN_SAMPLES, CALL_MAX_ATTEMPTS, CALL_BACKOFF_BASE, CALL_BACKOFF_MAX,
+                     CALL_HEDGE_PERCENTILE, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_COOLDOWN, OLLAMA_MAX_CONNECTIONS)
+from .tracing import span
+from .endpoint_pool import endpoint_pool
+from .llm_clients import PooledLLM, attempt_timeout
+
+# Outcomes worth another attempt; anything else (e.g. a 404 for a missing model) fails immediately
+RETRYABLE = {'timeout', 'connection_error', 'server_error', 'circuit_open'}
+# Outcomes that count against an endpoint's circuit breaker
+ENDPOINT_FAILURES = {'timeout', 'connection_error', 'server_error'}
+
+class LLMCallError(Exception):
+    """
+    Raised when an LLM call failed for good; `outcome` says why (timeout, connection_error, ...).
+    """
+    def __init__(self, outcome, message):
+        super().__init__(message)
+        self.outcome = outcome
+
+class CallTimeout(LLMCallError):
+    def __init__(self, message):
+        super().__init__('timeout', message)
+
+class CircuitOpen(LLMCallError):
+    def __init__(self, message):
+        super().__init__('circuit_open', message)
+
+def classify(error):
+    """
+    Maps an exception raised by a call to an outcome name.
+    """
+    if isinstance(error, LLMCallError):
+        return error.outcome
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, concurrent.futures.TimeoutError, httpx.TimeoutException)):
+        return 'timeout'
+    if isinstance(error, (httpx.TransportError, ConnectionError)):
+        return 'connection_error'
+    status = getattr(error, 'status_code', None)
+    if isinstance(status, int) and status > 0:
+        return 'server_error' if status >= 500 or status == 429 else 'client_error'
+    return 'error'
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class CircuitBreaker:
+    """
+    Per-endpoint breaker: closed, open for `cooldown` seconds after `threshold` consecutive
+    failures, then half-open until a single probe succeeds or fails.
+    """
+    def __init__(self, threshold=CIRCUIT_FAILURE_THRESHOLD, cooldown=CIRCUIT_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Returns 0 if a request may go out now, or the seconds left until the breaker lets one through.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return 0
+            remaining = self.opened_at + self.cooldown - time.monotonic()
+            if remaining > 0:
+                return remaining
+            if self.probing:
+                return self.cooldown
+            self.probing = True
+            return 0
+
+    def blocked(self):
+        """
+        Whether `acquire` would turn a request away now, without claiming the probe.
+        """
+        with self.lock:
+            if self.opened_at is None:
+                return False
+            return self.probing or self.opened_at + self.cooldown > time.monotonic()
+
+    def success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.probing = 0, None, False
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+class CallPolicy:
+    def __init__(self, max_attempts=CALL_MAX_ATTEMPTS, hedge_percentile=CALL_HEDGE_PERCENTILE):
+        self.max_attempts = max_attempts
+        self.hedge_percentile = hedge_percentile
+        self.latencies = defaultdict(lambda: deque(maxlen=CALL_LATENCY_WINDOW))
+        self.breakers = defaultdict(CircuitBreaker)
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.executor = None
+
+    def count(self, model, outcome):
+        with self.lock:
+            self.counts[(model, outcome)] += 1
+
+    def observe(self, model, latency):
+        with self.lock:
+            self.latencies[model].append(latency)
+
+    def latency_percentile(self, model, q):
+        with self.lock:
+            samples = list(self.latencies[model])
+        return percentile(samples, q) if len(samples) >= CALL_LATENCY_MIN_SAMPLES else None
+
+    def timeout(self, llm, attempt=0, timed_out=False):
+        """
+        Timeout for one attempt: the observed percentile latency times the multiplier, within
+        [CALL_TIMEOUT_MIN, request_timeout]. Until enough calls are observed it is `request_timeout`.
+        """
+        ceiling = float(llm.request_timeout)
+        observed = self.latency_percentile(llm.model, CALL_TIMEOUT_PERCENTILE)
+        if observed is None:
+            return ceiling
+        timeout = max(CALL_TIMEOUT_MIN, observed * CALL_TIMEOUT_MULTIPLIER)
+        if timed_out:
+            timeout *= 2 ** attempt
+        return min(timeout, ceiling)
+
+    def hedge_delay(self, llm, timeout):
+        if not self.hedge_percentile:
+            return None
+        delay = self.latency_percentile(llm.model, self.hedge_percentile)
+        return delay if delay is not None and delay < timeout else None
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(CALL_BACKOFF_MAX, CALL_BACKOFF_BASE * 2 ** attempt))
+
+    def pool(self):
+        # Hedged copies run here; each one's HTTP request times out with its attempt
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=OLLAMA_MAX_CONNECTIONS, thread_name_prefix='llm-call')
+        return self.executor
+
+    def route(self, llm, tried):
+        """
+        Returns (client, pool endpoint) for one attempt; the endpoint is None outside the pool. Hosts whose
+        breaker is open are avoided, so the call only waits out a cooldown when no other host serves the model.
+        """
+        if not isinstance(llm, PooledLLM):
+            return llm, None
+        blocked = [url for url, breaker in list(self.breakers.items()) if breaker.blocked()]
+        endpoint = endpoint_pool.acquire(llm.model, exclude=tried, blocked=blocked)
+        return llm.client(endpoint.url), endpoint
+
+    def finish(self, llm, breaker, outcome, latency=None, hedged=False, endpoint=None):
+        if endpoint is not None:
+            endpoint_pool.release(endpoint, llm.model, outcome, latency)
+        self.count(llm.model, outcome)
+        if hedged:
+            self.count(llm.model, 'hedged')
+        if outcome in ENDPOINT_FAILURES:
+            breaker.failure()
+        else:
+            breaker.success()  # the endpoint answered, even if with an error for this request
+        if outcome == 'ok':
+            self.observe(llm.model, latency)
+
+    def complete_within(self, llm, prompt, timeout):
+        """
+        Completes a prompt with `timeout` as the HTTP request's own timeout, so the connection is
+        closed when it runs out instead of the request running on until `request_timeout`.
+        """
+        token = attempt_timeout.set(timeout)
+        try:
+            return llm.complete(prompt)
+        finally:
+            attempt_timeout.reset(token)
+
+    def attempt_sync(self, llm, prompt, timeout):
+        """
+        Runs one attempt, hedging it if it outlives the hedge delay. Returns (response, hedged).
+        """
+        hedge_delay = self.hedge_delay(llm, timeout)
+        if hedge_delay is None:
+            return self.complete_within(llm, prompt, timeout), False
+
+        start = time.monotonic()
+        futures = [self.pool().submit(self.complete_within, llm, prompt, timeout)]
+        done, _ = concurrent.futures.wait(futures, timeout=hedge_delay)
+        if not done:
+            futures.append(self.pool().submit(self.complete_within, llm, prompt, timeout - hedge_delay))
+        hedged = len(futures) > 1
+
+        error = None
+        remaining = timeout - (time.monotonic() - start)
+        while futures and remaining > 0:
+            done, _ = concurrent.futures.wait(futures, timeout=remaining, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                futures.remove(future)
+                if future.exception() is None:
+                    return future.result(), hedged
+                error = future.exception()
+            remaining = timeout - (time.monotonic() - start)
+        if error is not None and not futures:
+            raise error
+        raise CallTimeout(f'{llm.model} did not answer within {timeout:.0f}s')
+
+    async def attempt_async(self, llm, prompt, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        hedge_delay = self.hedge_delay(llm, timeout)
+        tasks = [asyncio.ensure_future(llm.acomplete(prompt))]
+        try:
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    tasks.append(asyncio.ensure_future(llm.acomplete(prompt)))
+            hedged = len(tasks) > 1
+
+            error = None
+            while tasks and deadline > loop.time():
+                done, _ = await asyncio.wait(tasks, timeout=deadline - loop.time(), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        return task.result(), hedged
+                    error = task.exception()
+            if error is not None and not tasks:
+                raise error
+            raise CallTimeout(f'{llm.model} did not answer within {timeout:.0f}s')
+        finally:
+            # Cancelling closes the HTTP request, so Ollama stops generating for the losing copy
+            for task in tasks:
+                task.cancel()
+
+    def call(self, llm, prompt):
+        """
+        Completes a prompt under the policy, raising LLMCallError once every attempt has failed.
+        """
+        timed_out = False
+        tried = []
+        for attempt in range(self.max_attempts):
+            client, endpoint = self.route(llm, tried)
+            breaker = self.breakers[client.base_url]
+            wait = breaker.acquire()
+            if wait:
+                # Wait out the breaker's cooldown (within the backoff cap) instead of calling a failing endpoint
+                error = CircuitOpen(f'circuit open for {client.base_url}')
+                self.count(llm.model, 'circuit_open')
+                if endpoint is not None:
+                    endpoint_pool.release(endpoint, llm.model, 'circuit_open')
+                    tried.append(client.base_url)
+            else:
+                timeout = self.timeout(llm, attempt, timed_out)
+                with span('llm.attempt', model=llm.model, attempt=attempt, timeout=round(timeout, 1), endpoint=client.base_url) as event:
+                    start = time.monotonic()
+                    try:
+                        response, hedged = self.attempt_sync(client, prompt, timeout)
+                        self.finish(client, breaker, 'ok', time.monotonic() - start, hedged, endpoint)
+                        event['outcome'] = 'ok'
+                        return response
+                    except Exception as e:
+                        error = e
+                        outcome = event['outcome'] = classify(e)
+                        self.finish(client, breaker, outcome, endpoint=endpoint)
+                        if outcome not in RETRYABLE:
+                            raise LLMCallError(outcome, f'{llm.model}: {e}') from e
+                        timed_out = outcome == 'timeout'
+                        tried.append(client.base_url)
+                wait = self.backoff(attempt)
+            if attempt + 1 < self.max_attempts:
+                time.sleep(min(wait, CALL_BACKOFF_MAX))
+        outcome = classify(error)
+        raise LLMCallError(outcome, f'{llm.model} failed after {self.max_attempts} attempts: {error}') from error
+
+    async def acall(self, llm, prompt):
+        """
+        Async counterpart of `call` for the concurrent scheduler.
+        """
+        timed_out = False
+        tried = []
+        for attempt in range(self.max_attempts):
+            client, endpoint = self.route(llm, tried)
+            breaker = self.breakers[client.base_url]
+            wait = breaker.acquire()
+            if wait:
+                # Wait out the breaker's cooldown (within the backoff cap) instead of calling a failing endpoint
+                error = CircuitOpen(f'circuit open for {client.base_url}')
+                self.count(llm.model, 'circuit_open')
+                if endpoint is not None:
+                    endpoint_pool.release(endpoint, llm.model, 'circuit_open')
+                    tried.append(client.base_url)
+            else:
+                timeout = self.timeout(llm, attempt, timed_out)
+                with span('llm.attempt', model=llm.model, attempt=attempt, timeout=round(timeout, 1), endpoint=client.base_url) as event:
+                    start = time.monotonic()
+                    try:
+                        response, hedged = await self.attempt_async(client, prompt, timeout)
+                        self.finish(client, breaker, 'ok', time.monotonic() - start, hedged, endpoint)
+                        event['outcome'] = 'ok'
+                        return response
+                    except Exception as e:
+                        error = e
+                        outcome = event['outcome'] = classify(e)
+                        self.finish(client, breaker, outcome, endpoint=endpoint)
+                        if outcome not in RETRYABLE:
+                            raise LLMCallError(outcome, f'{llm.model}: {e}') from e
+                        timed_out = outcome == 'timeout'
+                        tried.append(client.base_url)
+                wait = self.backoff(attempt)
+            if attempt + 1 < self.max_attempts:
+                await asyncio.sleep(min(wait, CALL_BACKOFF_MAX))
+        outcome = classify(error)
+        raise LLMCallError(outcome, f'{llm.model} failed after {self.max_attempts} attempts: {error}') from error
+
+    def report(self):
+        """
+        Returns {model: {outcome: count}} for every call made so far.
+        """
+        with self.lock:
+            report = defaultdict(dict)
+            for (model, outcome), count in sorted(self.counts.items()):
+                report[model][outcome] = count
+        return dict(report)
+
+    def print_report(self):
+        for model, outcomes in self.report().items():
+            print(f"{model}: " + ', '.join(f'{outcome} {count}' for outcome, count in outcomes.items()))
+
+call_policy = CallPolicy()
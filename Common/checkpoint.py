@@ -0,0 +1,73 @@
+import os
+import json
+import time
+from .config import CHECKPOINT_FSYNC_EVERY, CHECKPOINT_FSYNC_INTERVAL
+from .utils import write_json_atomic
+
+def checkpoint_path(output_file):
+    return f'{output_file}.ckpt.jsonl'
+
+class Checkpoint:
+    """
+    Append-only JSONL log of per-chunk results kept next to an output file.
+
+    Every line is {"key", "status", "record"}; negative results such as 'NA' responses are logged with a
+    null record so a resume does not query them again. Lines are flushed as they are written and fsynced
+    every `fsync_every` records or `fsync_interval` seconds. A torn last line from a crash is ignored.
+    """
+    def __init__(self, path, fsync_every=CHECKPOINT_FSYNC_EVERY, fsync_interval=CHECKPOINT_FSYNC_INTERVAL):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.file = None
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """
+        Returns {key: {"status", "record"}} for every completed chunk, later lines winning.
+        """
+        entries = {}
+        if not self.exists():
+            return entries
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[entry['key']] = {'status': entry['status'], 'record': entry['record']}
+        return entries
+
+    def append(self, key, record, status='ok'):
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(json.dumps({'key': key, 'status': status, 'record': record}, ensure_ascii=False) + '\n')
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.fsync_every or time.monotonic() - self.last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        if self.file is not None and self.unsynced:
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def compact(self, output_file, keys, entries=None):
+        """
+        Writes the successful records for `keys`, in that order, as today's pretty-printed JSON list.
+        """
+        entries = self.load() if entries is None else entries
+        records = [entries[key]['record'] for key in keys if key in entries and entries[key]['status'] == 'ok']
+        write_json_atomic(output_file, records)
+        return records
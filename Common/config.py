@@ -0,0 +1,63 @@
+import os
+import json
+
+# Policy metadata
+FINAL_DF_PATH = './data/final_df.json'
+METADATA_FIELDS = ['name', 'state_name', 'program_category_name', 'sector_name', 'summary', 'incentive_amount_data']
+METADATA_INDEX_PATH = None  # e.g. './data/final_df.index.json' to let worker processes skip parsing final_df.json
+
+# Ollama clients
+OLLAMA_BASE_URL = os.environ.get('OLLAMA_HOST', 'http://localhost:11434')
+OLLAMA_KEEP_ALIVE = '30m'  # how long Ollama keeps a model resident after the last request
+OLLAMA_MAX_CONNECTIONS = 32
+OLLAMA_MAX_KEEPALIVE_CONNECTIONS = 16
+
+# Ollama endpoint pool (see Common/endpoint_pool.py): {host URL: [models it serves]}, an empty list serving any
+# model, e.g. QA_OLLAMA_ENDPOINTS='{"http://gpu1:11434": ["qwen3:8b"], "http://gpu2:11434": []}'. None sends
+# everything to OLLAMA_BASE_URL.
+OLLAMA_ENDPOINTS = json.loads(os.environ['QA_OLLAMA_ENDPOINTS']) if os.environ.get('QA_OLLAMA_ENDPOINTS') else None
+ENDPOINT_LATENCY_ALPHA = 0.2  # weight of the latest call in a host's latency average
+ENDPOINT_DEFAULT_LATENCY = 1.0  # seconds assumed before a host has answered
+ENDPOINT_LOAD_PENALTY = 30.0  # seconds added for a host that does not have the model loaded
+ENDPOINT_EJECT_FAILURES = 3  # consecutive failures that eject a host
+ENDPOINT_EJECT_SECONDS = 30.0  # first ejection; doubled on each further one
+ENDPOINT_EJECT_MAX = 600.0
+ENDPOINT_LOADED_REFRESH = 30.0  # seconds between /api/ps polls of every host (0 disables)
+
+# LLM response cache (set RESPONSE_CACHE_PATH to None to always call Ollama); generation prompts repeat,
+# and so hit the cache, only while Generation's EXAMPLE_SEED is set
+RESPONSE_CACHE_PATH = './cache/llm_responses.sqlite'
+RESPONSE_CACHE_MAX_BYTES = 2 * 1024 ** 3
+RESPONSE_CACHE_MAX_AGE = 90 * 24 * 3600  # seconds
+RESPONSE_CACHE_EVICT_EVERY = 1000  # writes between eviction passes
+RESPONSE_CACHE_TOUCH_INTERVAL = 24 * 3600  # seconds before a hit refreshes an entry's access time
+
+# Per-chunk checkpoints
+CHECKPOINT_FSYNC_EVERY = 16  # records between fsyncs
+CHECKPOINT_FSYNC_INTERVAL = 5.0  # max seconds between fsyncs
+
+# Tracing (see Common/tracing.py); both off by default
+TRACE_PATH = os.environ.get('QA_TRACE_PATH')  # JSONL of finished spans, shared by all processes of a run
+METRICS_PATH = os.environ.get('QA_METRICS_PATH')  # Prometheus text snapshot written at exit
+
+# LLM call policy (see Common/call_policy.py)
+CALL_TIMEOUT_MIN = 30.0  # seconds; derived timeouts never go below this
+CALL_TIMEOUT_MAX = 1800.0  # HTTP timeout of the generation clients, and so the longest any call may run
+CALL_TIMEOUT_PERCENTILE = 0.99  # observed latency percentile the timeout is derived from
+CALL_TIMEOUT_MULTIPLIER = 3.0
+CALL_LATENCY_WINDOW = 200  # recent successful calls kept per model
+CALL_LATENCY_MIN_SAMPLES = 20  # below this the client's request_timeout is used as is
+CALL_MAX_ATTEMPTS = 3
+CALL_BACKOFF_BASE = 1.0  # seconds; attempt n waits uniform(0, min(CALL_BACKOFF_MAX, base * 2**n))
+CALL_BACKOFF_MAX = 60.0
+CALL_HEDGE_PERCENTILE = None  # e.g. 0.95 re-issues requests still running past the p95 latency
+CIRCUIT_FAILURE_THRESHOLD = 5  # consecutive failures that open an endpoint's breaker
+CIRCUIT_COOLDOWN = 30.0  # seconds before a probe request is let through
+
+# Job ledger for cooperating workers (see Common/job_ledger.py); off unless a path is given
+JOB_LEDGER_PATH = os.environ.get('QA_JOB_LEDGER')
+JOB_LEDGER_JOURNAL_MODE = 'WAL'  # 'DELETE' for a ledger on a network filesystem, where WAL does not work
+JOB_LEASE_SECONDS = 600.0  # a job whose worker misses heartbeats for this long is leased again
+JOB_HEARTBEAT_INTERVAL = 60.0
+JOB_MAX_ATTEMPTS = 3  # leases of a job before it is marked failed
+JOB_POLL_INTERVAL = 15.0  # seconds between lease attempts while only other workers' jobs remain
@@ -0,0 +1,155 @@
+"""
+Routing of Ollama requests across several hosts.
+
+OLLAMA_ENDPOINTS maps each host to the models it serves (an empty list serves any model). Every
+request for a model goes to the serving host with the lowest expected wait: its in-flight requests
+plus this one, times the host's average latency for the model, plus ENDPOINT_LOAD_PENALTY when the
+model is not loaded there. Loaded models are read from each host's /api/ps every
+ENDPOINT_LOADED_REFRESH seconds and noted after each successful call.
+
+A host failing ENDPOINT_EJECT_FAILURES requests in a row (timeouts, connection or server errors) is
+ejected for ENDPOINT_EJECT_SECONDS, doubled on each further ejection up to ENDPOINT_EJECT_MAX. Once
+that time is up it gets requests again; one success re-admits it for good. When every serving host
+is ejected the one due back first is tried.
+
+LLM calls go through the pool via Common.call_policy, which retries a failed attempt on another
+host; embeddings via Filtering.embedding_cache.
+"""
+import time
+import threading
+import httpx
+from .config import (OLLAMA_ENDPOINTS, ENDPOINT_LATENCY_ALPHA, ENDPOINT_DEFAULT_LATENCY, ENDPOINT_LOAD_PENALTY,
+                     ENDPOINT_EJECT_FAILURES, ENDPOINT_EJECT_SECONDS, ENDPOINT_EJECT_MAX, ENDPOINT_LOADED_REFRESH)
+
+# Outcomes that count against a host's health, as in Common.call_policy
+FAILURES = {'timeout', 'connection_error', 'server_error'}
+
+class Endpoint:
+    def __init__(self, url, models):
+        self.url = url.rstrip('/')
+        self.models = set(models or [])
+        self.in_flight = 0
+        self.failures = 0  # consecutive
+        self.ejections = 0  # consecutive
+        self.ejected_until = 0.0
+        self.latency = {}  # model -> moving average of successful calls, seconds
+        self.loaded = set()
+        self.calls = 0
+        self.errors = 0
+
+    def serves(self, model):
+        return not self.models or model in self.models
+
+    def expected_wait(self, model):
+        latency = self.latency.get(model)
+        if latency is None:
+            latency = sum(self.latency.values()) / len(self.latency) if self.latency else ENDPOINT_DEFAULT_LATENCY
+        wait = (self.in_flight + 1) * latency
+        if model not in self.loaded:
+            wait += ENDPOINT_LOAD_PENALTY
+        return wait
+
+class EndpointPool:
+    def __init__(self, endpoints, refresh_interval=ENDPOINT_LOADED_REFRESH):
+        self.endpoints = [Endpoint(url, models) for url, models in endpoints.items()]
+        self.refresh_interval = refresh_interval
+        self.lock = threading.Lock()
+        self.refresher = None
+
+    def start_refresher(self):
+        # Started on first use so worker processes forked before it each run their own
+        if self.refresher is None and self.refresh_interval:
+            self.refresher = threading.Thread(target=self.refresh_loop, daemon=True, name='endpoint-refresh')
+            self.refresher.start()
+
+    def refresh_loop(self):
+        while True:
+            self.refresh_loaded()
+            time.sleep(self.refresh_interval)
+
+    def refresh_loaded(self):
+        """
+        Reads the loaded models of every host from /api/ps; unreachable hosts keep what was known.
+        """
+        for endpoint in self.endpoints:
+            try:
+                response = httpx.get(f'{endpoint.url}/api/ps', timeout=5)
+                response.raise_for_status()
+                loaded = {model['name'] for model in response.json().get('models', [])}
+            except (httpx.HTTPError, ValueError):
+                continue
+            # /api/ps reports 'llama3:latest' for a request that named 'llama3'
+            loaded |= {name[:-len(':latest')] for name in loaded if name.endswith(':latest')}
+            with self.lock:
+                endpoint.loaded = loaded
+
+    def acquire(self, model, exclude=(), blocked=()):
+        """
+        Picks the host for one request, counting it as in flight until `release`.
+        Hosts in `exclude`, e.g. ones that already failed this request, are used only if nothing else serves the model,
+        and hosts in `blocked`, e.g. ones whose circuit breaker is open, only if nothing but excluded hosts does.
+        """
+        self.start_refresher()
+        now = time.monotonic()
+        with self.lock:
+            serving = [endpoint for endpoint in self.endpoints if endpoint.serves(model)]
+            if not serving:
+                raise ValueError(f'No Ollama endpoint serves {model}')
+            healthy = [endpoint for endpoint in serving if endpoint.ejected_until <= now]
+            if healthy:
+                available = [endpoint for endpoint in healthy if endpoint.url not in blocked]
+                candidates = [endpoint for endpoint in available if endpoint.url not in exclude] or available or healthy
+                endpoint = min(candidates, key=lambda endpoint: endpoint.expected_wait(model))
+            else:
+                endpoint = min(serving, key=lambda endpoint: endpoint.ejected_until)
+            endpoint.in_flight += 1
+            endpoint.calls += 1
+            return endpoint
+
+    def release(self, endpoint, model, outcome, latency=None):
+        """
+        Records how a request routed to `endpoint` ended ('ok', an outcome from Common.call_policy, or
+        'circuit_open' for one that was never sent).
+        """
+        with self.lock:
+            endpoint.in_flight -= 1
+            if outcome == 'ok':
+                endpoint.failures = endpoint.ejections = 0
+                endpoint.loaded.add(model)
+                if latency is not None:
+                    previous = endpoint.latency.get(model)
+                    endpoint.latency[model] = latency if previous is None else (
+                        ENDPOINT_LATENCY_ALPHA * latency + (1 - ENDPOINT_LATENCY_ALPHA) * previous)
+            elif outcome in FAILURES:
+                endpoint.errors += 1
+                endpoint.failures += 1
+                if endpoint.failures >= ENDPOINT_EJECT_FAILURES:
+                    seconds = min(ENDPOINT_EJECT_MAX, ENDPOINT_EJECT_SECONDS * 2 ** endpoint.ejections)
+                    endpoint.ejected_until = time.monotonic() + seconds
+                    endpoint.ejections += 1
+                    endpoint.failures = 0
+                    print(f'Ejected Ollama endpoint {endpoint.url} for {seconds:.0f}s')
+            elif outcome != 'circuit_open':
+                endpoint.failures = 0  # the host answered, even if with an error for this request
+
+    def report(self):
+        """
+        Returns {url: {calls, errors, in_flight, ejected, loaded, latency}}.
+        """
+        now = time.monotonic()
+        with self.lock:
+            return {endpoint.url: {
+                'calls': endpoint.calls,
+                'errors': endpoint.errors,
+                'in_flight': endpoint.in_flight,
+                'ejected': endpoint.ejected_until > now,
+                'loaded': sorted(endpoint.loaded),
+                'latency': {model: round(latency, 3) for model, latency in sorted(endpoint.latency.items())},
+            } for endpoint in self.endpoints}
+
+    def print_report(self):
+        for url, stats in self.report().items():
+            state = ' (ejected)' if stats['ejected'] else ''
+            print(f"{url}{state}: {stats['calls']} calls, {stats['errors']} errors, loaded {', '.join(stats['loaded']) or '-'}")
+
+endpoint_pool = EndpointPool(OLLAMA_ENDPOINTS) if OLLAMA_ENDPOINTS else None
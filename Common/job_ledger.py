@@ -0,0 +1,325 @@
+"""
+Durable ledger of pipeline jobs, so any number of workers on any number of machines can share a run.
+
+A stage's CLI enumerates its jobs into the ledger (adding only keys not seen before) and then works
+through them: each worker leases the oldest available job, renews the lease with a heartbeat while
+it runs, and records the job as done, or as failed with the error once JOB_MAX_ATTEMPTS are used up.
+A job whose lease expires without a heartbeat, because its worker died, is leased again by another
+worker, or marked failed once it has used up its attempts, so a job that kills its worker every time
+does not cycle forever. A worker whose heartbeat fails has lost its lease: the stage loops call
+`check_lease` between LLM calls and abandon the job, leaving it to the worker that took it over.
+Status, attempts, the worker holding the job and its timings are kept per job.
+
+The ledger is a SQLite file. For workers on several machines put it on a shared filesystem with
+JOB_LEDGER_JOURNAL_MODE = 'DELETE', since WAL needs shared memory that network filesystems lack.
+
+Run from the repository root: python -m Common.job_ledger LEDGER [--stage generation] [--reset failed|leased|all]
+"""
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from .config import (JOB_LEDGER_PATH, JOB_LEDGER_JOURNAL_MODE, JOB_LEASE_SECONDS, JOB_HEARTBEAT_INTERVAL,
+                     JOB_MAX_ATTEMPTS, JOB_POLL_INTERVAL)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    stage TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_expires REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    heartbeat_at REAL,
+    finished_at REAL,
+    duration REAL,
+    UNIQUE (stage, key)
+);
+CREATE INDEX IF NOT EXISTS jobs_stage_status ON jobs (stage, status);
+'''
+
+STATUSES = ['pending', 'leased', 'done', 'failed']
+
+# Lease of the job running in this thread, checked by `check_lease`
+active = threading.local()
+
+class LeaseLost(Exception):
+    pass
+
+def lease_lost():
+    """
+    True when the job running in this thread has lost its lease to another worker.
+    """
+    lease = getattr(active, 'lease', None)
+    return lease is not None and lease.lost.is_set()
+
+def check_lease():
+    """
+    Raises LeaseLost when the job running in this thread has lost its lease, so the stage stops
+    spending LLM calls on a job another worker is running.
+    """
+    if lease_lost():
+        raise LeaseLost(f'lost the lease on {active.lease.stage} job {active.lease.key}')
+
+def worker_id():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+class Lease:
+    def __init__(self, job_id, stage, key, payload, attempt, worker):
+        self.job_id = job_id
+        self.stage = stage
+        self.key = key
+        self.payload = payload
+        self.attempt = attempt
+        self.worker = worker
+        self.started = time.monotonic()
+        self.lost = threading.Event()
+
+class JobLedger:
+    """
+    SQLite-backed job table shared by cooperating workers; see the module docstring.
+    """
+    def __init__(self, path=JOB_LEDGER_PATH, lease_seconds=JOB_LEASE_SECONDS, heartbeat_interval=JOB_HEARTBEAT_INTERVAL,
+                 max_attempts=JOB_MAX_ATTEMPTS, poll_interval=JOB_POLL_INTERVAL, journal_mode=JOB_LEDGER_JOURNAL_MODE):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.journal_mode = journal_mode
+        self.worker = worker_id()
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            conn.execute(f'PRAGMA journal_mode={self.journal_mode}')
+            conn.executescript(SCHEMA)
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never lease the same job
+        conn = self.connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def add(self, stage, jobs):
+        """
+        Enumerates (key, payload) jobs for a stage in order; keys already in the ledger keep their state.
+        Returns the number of new jobs.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO jobs (stage, key, payload, created_at) VALUES (?, ?, ?, ?)',
+                             [(stage, key, json.dumps(payload, ensure_ascii=False), now) for key, payload in jobs])
+            return conn.total_changes - before
+
+    def lease(self, stage):
+        """
+        Leases the oldest pending job of a stage, or one whose lease has expired with attempts left.
+        Expired jobs without attempts left are marked failed. Returns a Lease or None.
+        """
+        now = time.time()
+        with self.transaction() as conn:
+            conn.execute('''
+                UPDATE jobs SET status = 'failed', error = 'lease expired on the last attempt', lease_expires = NULL,
+                                finished_at = ?
+                WHERE stage = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?''',
+                (now, stage, now, self.max_attempts))
+            row = conn.execute('''
+                SELECT id, key, payload, attempts FROM jobs
+                WHERE stage = ? AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                ORDER BY id LIMIT 1''', (stage, now)).fetchone()
+            if row is None:
+                return None
+            job_id, key, payload, attempts = row
+            conn.execute('''
+                UPDATE jobs SET status = 'leased', worker = ?, lease_expires = ?, attempts = ?,
+                                started_at = ?, heartbeat_at = ?, finished_at = NULL, duration = NULL
+                WHERE id = ?''', (self.worker, now + self.lease_seconds, attempts + 1, now, now, job_id))
+        return Lease(job_id, stage, key, json.loads(payload), attempts + 1, self.worker)
+
+    def heartbeat(self, lease):
+        """
+        Extends a lease. Returns False if the job is no longer leased to this worker.
+        """
+        now = time.time()
+        cursor = self.connection().execute('''
+            UPDATE jobs SET lease_expires = ?, heartbeat_at = ?
+            WHERE id = ? AND status = 'leased' AND worker = ?''', (now + self.lease_seconds, now, lease.job_id, lease.worker))
+        return cursor.rowcount == 1
+
+    def finish(self, lease, status, error=None):
+        """
+        Records the end of a leased job, unless its lease has already passed to another worker.
+        """
+        self.connection().execute('''
+            UPDATE jobs SET status = ?, error = ?, lease_expires = NULL, finished_at = ?, duration = ?
+            WHERE id = ? AND status = 'leased' AND worker = ?''',
+            (status, error, time.time(), time.monotonic() - lease.started, lease.job_id, lease.worker))
+
+    def complete(self, lease):
+        self.finish(lease, 'done')
+
+    def fail(self, lease, error):
+        """
+        Returns a failed job to the queue, or marks it failed once it has used all its attempts.
+        """
+        self.finish(lease, 'failed' if lease.attempt >= self.max_attempts else 'pending', str(error))
+
+    def release(self, lease):
+        """
+        Hands an interrupted job back without counting the attempt.
+        """
+        self.connection().execute('''
+            UPDATE jobs SET status = 'pending', attempts = attempts - 1, worker = NULL, lease_expires = NULL
+            WHERE id = ? AND status = 'leased' AND worker = ?''', (lease.job_id, lease.worker))
+
+    @contextmanager
+    def heartbeats(self, lease):
+        """
+        Renews the lease from a background thread while the body runs. A renewal that fails, including
+        a failed write, sets `lease.lost`.
+        """
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.heartbeat_interval):
+                try:
+                    renewed = self.heartbeat(lease)
+                except sqlite3.Error as e:
+                    print(f'Heartbeat for {lease.stage} job {lease.key} failed: {e}')
+                    renewed = False
+                if not renewed:
+                    print(f'Lost the lease on {lease.stage} job {lease.key}')
+                    lease.lost.set()
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True, name='job-heartbeat')
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def in_flight(self, stage):
+        return self.connection().execute(
+            "SELECT COUNT(*) FROM jobs WHERE stage = ? AND status = 'leased'", (stage,)).fetchone()[0]
+
+    def run(self, stage, handler, wait=True):
+        """
+        Leases and runs jobs of a stage as `handler(**payload)` until none are left. With `wait`, a
+        worker that finds nothing to lease while other workers hold jobs keeps polling, so jobs of
+        workers that die are picked up once their leases expire. Returns the number of jobs this worker finished.
+        """
+        finished = 0
+        while True:
+            lease = self.lease(stage)
+            if lease is None:
+                if wait and self.in_flight(stage):
+                    time.sleep(self.poll_interval)
+                    continue
+                return finished
+
+            active.lease = lease
+            try:
+                with self.heartbeats(lease):
+                    handler(**lease.payload)
+            except KeyboardInterrupt:
+                self.release(lease)
+                raise
+            except LeaseLost as e:
+                # Another worker holds the job now; its outcome is theirs to record
+                print(f'{stage} job {lease.key} abandoned: {e}')
+                continue
+            except Exception as e:
+                print(f'{stage} job {lease.key} failed (attempt {lease.attempt}): {e.__class__.__name__}: {e}')
+                self.fail(lease, f'{e.__class__.__name__}: {e}')
+                continue
+            finally:
+                active.lease = None
+            self.complete(lease)
+            finished += 1
+
+    def status(self, stage=None):
+        """
+        Returns {stage: {status: count}}.
+        """
+        query = 'SELECT stage, status, COUNT(*) FROM jobs'
+        params = ()
+        if stage is not None:
+            query += ' WHERE stage = ?'
+            params = (stage,)
+        report = {}
+        for job_stage, status, count in self.connection().execute(query + ' GROUP BY stage, status', params):
+            report.setdefault(job_stage, dict.fromkeys(STATUSES, 0))[status] = count
+        return report
+
+    def print_status(self, stage=None):
+        for job_stage, counts in self.status(stage).items():
+            print(f'{job_stage}: ' + ', '.join(f'{status} {count}' for status, count in counts.items()))
+        for job_stage, key, attempts, error in self.connection().execute('''
+                SELECT stage, key, attempts, error FROM jobs WHERE status = 'failed' AND (? IS NULL OR stage = ?)
+                ORDER BY id''', (stage, stage)):
+            print(f'  failed {job_stage} {key} after {attempts} attempts: {error}')
+
+    def reset(self, stage=None, status='failed'):
+        """
+        Puts jobs with the given status ('failed', 'leased' or 'all') back to pending with no attempts used.
+        """
+        query = "UPDATE jobs SET status = 'pending', attempts = 0, worker = NULL, lease_expires = NULL, error = NULL WHERE 1"
+        params = []
+        if status != 'all':
+            query += ' AND status = ?'
+            params.append(status)
+        if stage is not None:
+            query += ' AND stage = ?'
+            params.append(stage)
+        return self.connection().execute(query, params).rowcount
+
+def run_jobs(path, stage, jobs, handler):
+    """
+    Enumerates a stage's jobs into the ledger at `path` and works through them as one of its workers.
+    """
+    ledger = JobLedger(path)
+    added = ledger.add(stage, jobs)
+    print(f'{stage}: {added} new jobs in {path}; working as {ledger.worker}')
+    finished = ledger.run(stage, handler)
+    print(f'{stage}: this worker finished {finished} jobs')
+    ledger.print_status(stage)
+    return ledger
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show or reset the jobs of a pipeline job ledger")
+    parser.add_argument("ledger", help="Path to the ledger SQLite file")
+    parser.add_argument("--stage", help="Only this stage (generation, evaluation, local_filter)")
+    parser.add_argument("--reset", choices=['failed', 'leased', 'all'],
+                        help="Put failed, leased (e.g. after killing every worker) or all jobs back to pending")
+
+    args = parser.parse_args()
+    ledger = JobLedger(args.ledger)
+    if args.reset:
+        print(f'Reset {ledger.reset(args.stage, args.reset)} jobs')
+    ledger.print_status(args.stage)
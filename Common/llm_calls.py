@@ -0,0 +1,66 @@
+import time
+from . import response_cache as cache_module
+from .response_cache import cache_key, llm_options
+from .tracing import span, record_llm_response
+from .call_policy import call_policy
+
+def token_counts(response):
+    """
+    Returns the Ollama-reported (prompt, completion) token counts of a response, if present.
+    """
+    raw = getattr(response, 'raw', None) or {}
+    return raw.get('prompt_eval_count'), raw.get('eval_count')
+
+def response_text(response):
+    return response.text if hasattr(response, "text") else str(response)
+
+def lookup(llm, prompt, refresh=False):
+    """
+    Returns (cache key, cached text) for a prompt; both are None when caching is disabled.
+    With `refresh` the cached text is ignored so a fresh response replaces it.
+    """
+    cache = cache_module.response_cache
+    if cache is None:
+        return None, None
+    key = cache_key(llm.model, llm_options(llm), prompt)
+    if refresh:
+        return key, None
+    hit = cache.get(key)
+    return key, hit['response'] if hit is not None else None
+
+def store(llm, key, response, latency):
+    text = response_text(response)
+    if key is not None:
+        cache_module.response_cache.put(key, llm.model, text, *token_counts(response), latency=latency)
+    return text
+
+def complete(llm, prompt, refresh=False):
+    """
+    Completes a prompt, answering from the response cache when the same (model, options, prompt) was seen before.
+    Calls go through `call_policy`, which raises LLMCallError once its retries are exhausted.
+    """
+    with span('llm.complete', model=llm.model, prompt_chars=len(prompt)) as event:
+        key, text = lookup(llm, prompt, refresh)
+        event['cache_hit'] = text is not None
+        if text is not None:
+            return text
+
+        start = time.perf_counter()
+        response = call_policy.call(llm, prompt)
+        record_llm_response(event, response)
+        return store(llm, key, response, time.perf_counter() - start)
+
+async def acomplete(llm, prompt, refresh=False):
+    """
+    Async counterpart of `complete` for the concurrent scheduler.
+    """
+    with span('llm.complete', model=llm.model, prompt_chars=len(prompt)) as event:
+        key, text = lookup(llm, prompt, refresh)
+        event['cache_hit'] = text is not None
+        if text is not None:
+            return text
+
+        start = time.perf_counter()
+        response = await call_policy.acall(llm, prompt)
+        record_llm_response(event, response)
+        return store(llm, key, response, time.perf_counter() - start)
@@ -0,0 +1,105 @@
+import json
+import asyncio
+import weakref
+import contextvars
+import httpx
+from ollama import Client, AsyncClient
+from llama_index.llms.ollama import Ollama
+from .config import OLLAMA_BASE_URL, OLLAMA_KEEP_ALIVE, OLLAMA_MAX_CONNECTIONS, OLLAMA_MAX_KEEPALIVE_CONNECTIONS
+from .endpoint_pool import endpoint_pool
+
+# (base_url, timeout) -> ollama Client shared by every model on that host
+http_clients = {}
+# (model, options) -> Ollama, for synchronous callers
+llm_clients = {}
+# (model, options) -> PooledLLM when OLLAMA_ENDPOINTS is set
+pooled_clients = {}
+# event loop -> {(base_url, timeout): AsyncClient} and {(model, options): Ollama}, since httpx async pools are bound to their loop
+loop_http_clients = weakref.WeakKeyDictionary()
+loop_llm_clients = weakref.WeakKeyDictionary()
+# Timeout of the synchronous attempt running in this thread, applied to its HTTP request
+attempt_timeout = contextvars.ContextVar('attempt_timeout', default=None)
+
+def connection_limits():
+    return httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS, max_keepalive_connections=OLLAMA_MAX_KEEPALIVE_CONNECTIONS)
+
+def running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+def apply_attempt_timeout(request):
+    """
+    httpx request hook giving the request the current attempt's timeout, so a timed-out attempt
+    closes its connection and Ollama stops generating for it.
+    """
+    timeout = attempt_timeout.get()
+    if timeout is not None:
+        request.extensions['timeout'] = httpx.Timeout(timeout).as_dict()
+
+def http_client(base_url, timeout):
+    """
+    Returns the keep-alive ollama client pool for a host.
+    """
+    key = (base_url, timeout)
+    if key not in http_clients:
+        http_clients[key] = Client(host=base_url, timeout=timeout, limits=connection_limits(),
+                                   event_hooks={'request': [apply_attempt_timeout]})
+    return http_clients[key]
+
+def async_http_client(base_url, timeout, loop):
+    clients = loop_http_clients.setdefault(loop, {})
+    key = (base_url, timeout)
+    if key not in clients:
+        clients[key] = AsyncClient(host=base_url, timeout=timeout, limits=connection_limits())
+    return clients[key]
+
+class PooledLLM:
+    """
+    Stand-in client for a model served by the endpoint pool. Common.call_policy asks `client(url)`
+    for the chosen host's own Ollama client on each attempt; other attributes (temperature, json_mode,
+    ...) are read from a host client, as they are the same on every host.
+    """
+    base_url = 'pool'
+
+    def __init__(self, model, request_timeout, keep_alive, options):
+        self.model = model
+        self.request_timeout = request_timeout
+        self.keep_alive = keep_alive
+        self.options = options
+
+    def client(self, base_url):
+        return get_llm(self.model, base_url, self.request_timeout, self.keep_alive, **self.options)
+
+    def __getattr__(self, name):
+        return getattr(self.client(endpoint_pool.endpoints[0].url), name)
+
+def get_llm(model, base_url=None, request_timeout=100, keep_alive=OLLAMA_KEEP_ALIVE, **options):
+    """
+    Returns the shared Ollama client for a (model, options) pair, creating it on first use.
+
+    All models on a host share one pooled HTTP connection set, and `keep_alive` asks Ollama to keep the
+    model loaded between requests. Clients requested inside a running event loop get async pools bound
+    to that loop. Without a `base_url` the client routes through the endpoint pool when OLLAMA_ENDPOINTS
+    is set, and talks to OLLAMA_BASE_URL otherwise.
+    """
+    if base_url is None:
+        if endpoint_pool is not None:
+            key = (model, request_timeout, keep_alive, json.dumps(options, sort_keys=True, default=str))
+            if key not in pooled_clients:
+                pooled_clients[key] = PooledLLM(model, request_timeout, keep_alive, options)
+            return pooled_clients[key]
+        base_url = OLLAMA_BASE_URL
+
+    key = (model, base_url, request_timeout, keep_alive, json.dumps(options, sort_keys=True, default=str))
+    loop = running_loop()
+    registry = llm_clients if loop is None else loop_llm_clients.setdefault(loop, {})
+
+    llm = registry.get(key)
+    if llm is None:
+        async_client = async_http_client(base_url, request_timeout, loop) if loop is not None else None
+        llm = Ollama(model=model, base_url=base_url, request_timeout=request_timeout, keep_alive=keep_alive,
+                     client=http_client(base_url, request_timeout), async_client=async_client, **options)
+        registry[key] = llm
+    return llm
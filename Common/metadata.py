@@ -0,0 +1,63 @@
+import os
+import json
+from .config import FINAL_DF_PATH, METADATA_FIELDS, METADATA_INDEX_PATH
+
+class PolicyMetadata:
+    """
+    Lazily loaded id -> fields lookup over final_df.json.
+
+    The column-oriented JSON written by pandas is read once with the json module and reduced to the
+    fields each stage needs. With `index_path` set, the reduced table is written as a compact index that
+    later processes load directly while it is newer than the source file.
+    """
+    def __init__(self, path=FINAL_DF_PATH, index_path=METADATA_INDEX_PATH, fields=METADATA_FIELDS):
+        self.path = path
+        self.index_path = index_path
+        self.fields = list(fields)
+        self.records = None
+
+    def load_index(self):
+        if not self.index_path or not os.path.exists(self.index_path):
+            return None
+        if os.path.getmtime(self.index_path) < os.path.getmtime(self.path):
+            return None
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index['fields'] != self.fields:
+            return None
+        return {int(id): dict(zip(self.fields, values)) for id, values in index['rows'].items()}
+
+    def save_index(self, records):
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        rows = {id: [record[field] for field in self.fields] for id, record in records.items()}
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fields': self.fields, 'rows': rows}, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.index_path)
+
+    def load(self):
+        records = self.load_index()
+        if records is not None:
+            return records
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            columns = json.load(f)
+        records = {
+            int(id): {field: columns[field][row] for field in self.fields}
+            for row, id in columns['id'].items()
+        }
+        if self.index_path:
+            self.save_index(records)
+        return records
+
+    def get(self, id, fields=None):
+        """
+        Returns the requested fields of a policy as a dict, or None if the id is unknown.
+        """
+        if self.records is None:
+            self.records = self.load()
+        record = self.records.get(int(id))
+        if record is None or fields is None:
+            return record
+        return {field: record[field] for field in fields}
+
+policy_metadata = PolicyMetadata()
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from .config import (RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_MAX_AGE, RESPONSE_CACHE_EVICT_EVERY,
+                     RESPONSE_CACHE_TOUCH_INTERVAL)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,
+    prompt_tokens INTEGER,
+    completion_tokens INTEGER,
+    latency REAL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at);
+CREATE INDEX IF NOT EXISTS responses_created_at ON responses (created_at);
+'''
+
+def context_window(llm):
+    """
+    Returns the context window sent with a request. Ollama clients look an unset (-1) window up from the
+    model on first use and keep it, so reading the field directly would key a model's first prompt apart
+    from the rest; the raw field is used only when the lookup fails.
+    """
+    try:
+        return llm.get_context_window()
+    except Exception:
+        return getattr(llm, 'context_window', None)
+
+def llm_options(llm):
+    """
+    Returns the client settings that change what a model generates for a prompt.
+    """
+    return {
+        'temperature': getattr(llm, 'temperature', None),
+        'context_window': context_window(llm),
+        'json_mode': getattr(llm, 'json_mode', None),
+        'thinking': getattr(llm, 'thinking', None),
+        'additional_kwargs': getattr(llm, 'additional_kwargs', None),
+    }
+
+def cache_key(model, options, prompt):
+    payload = json.dumps([model, options, prompt], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    Content-addressed store of raw LLM responses keyed by hash of (model, options, prompt).
+
+    Backed by SQLite in WAL mode so several worker processes can read and write the same file. Each
+    thread of each process opens its own connection. Entries older than `max_age` seconds are dropped,
+    then the least recently used ones until the stored responses fit in `max_bytes`. A hit refreshes
+    the access time only once it is `touch_interval` seconds old, so reads rarely need the write lock.
+    """
+    def __init__(self, path=RESPONSE_CACHE_PATH, max_bytes=RESPONSE_CACHE_MAX_BYTES, max_age=RESPONSE_CACHE_MAX_AGE,
+                 evict_every=RESPONSE_CACHE_EVICT_EVERY, touch_interval=RESPONSE_CACHE_TOUCH_INTERVAL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.evict_every = evict_every
+        self.touch_interval = touch_interval
+        self.local = threading.local()
+        self.writes = 0
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None or self.local.pid != os.getpid():
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(SCHEMA)
+            self.local.conn, self.local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        """
+        Returns the cached response row as a dict, or None on a miss or an expired entry.
+        """
+        conn = self.connection()
+        row = conn.execute(
+            'SELECT response, prompt_tokens, completion_tokens, latency, created_at, accessed_at FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        now = time.time()
+        if self.max_age and row[4] < now - self.max_age:
+            conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            return None
+        if row[5] < now - self.touch_interval:
+            conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+        return {'response': row[0], 'prompt_tokens': row[1], 'completion_tokens': row[2], 'latency': row[3]}
+
+    def put(self, key, model, response, prompt_tokens=None, completion_tokens=None, latency=None):
+        now = time.time()
+        self.connection().execute(
+            'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (key, model, response, prompt_tokens, completion_tokens, latency, len(response.encode('utf-8')), now, now)
+        )
+        self.writes += 1
+        if self.evict_every and self.writes % self.evict_every == 0:
+            self.evict()
+
+    def evict(self):
+        """
+        Drops expired entries, then least recently used ones until the cache fits in `max_bytes`.
+        """
+        conn = self.connection()
+        if self.max_age:
+            conn.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.max_age,))
+        if self.max_bytes:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+            if total > self.max_bytes:
+                conn.execute('''
+                    DELETE FROM responses WHERE key IN (
+                        SELECT key FROM (
+                            SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS kept
+                            FROM responses
+                        ) WHERE kept > ?
+                    )''', (self.max_bytes,))
+
+response_cache = ResponseCache() if RESPONSE_CACHE_PATH else None
@@ -0,0 +1,243 @@
+"""
+Span timings and Ollama token counts for the pipeline stages.
+
+Spans are aggregated in memory per (span, model, question type) and, when TRACE_PATH is set, appended
+as JSONL lines that several processes can share. The model and question type come from the
+`labels` context (or the span itself), so an LLM call inherits the question type of the job it
+runs in. A Prometheus text snapshot is written to METRICS_PATH at exit; with a trace it covers every
+process that wrote to the trace so far, otherwise only the exiting process.
+
+Summarize a trace, optionally from several runs or processes:
+    python -m Common.tracing trace.jsonl [--prometheus metrics.prom]
+"""
+import os
+import sys
+import json
+import time
+import atexit
+import argparse
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from collections import defaultdict
+from .config import TRACE_PATH, METRICS_PATH
+
+# Upper bounds (seconds) of the span duration histogram
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+# Ollama response fields recorded on LLM spans; durations are in nanoseconds
+LLM_FIELDS = ('prompt_eval_count', 'eval_count', 'prompt_eval_duration', 'eval_duration', 'load_duration', 'total_duration')
+
+current_labels = contextvars.ContextVar('trace_labels', default={})
+
+class Tracer:
+    """
+    Aggregates finished spans and writes them to the JSONL trace.
+    """
+    def __init__(self, trace_path=TRACE_PATH):
+        self.trace_path = trace_path
+        self.lock = threading.Lock()
+        self.fd, self.fd_pid = None, None
+        self.stats = defaultdict(lambda: defaultdict(float))
+        self.histograms = defaultdict(lambda: [0] * (len(BUCKETS) + 1))
+
+    def write(self, event):
+        if not self.trace_path:
+            return
+        line = (json.dumps(event, ensure_ascii=False, default=str) + '\n').encode('utf-8')
+        with self.lock:
+            if self.fd_pid != os.getpid():
+                # One O_APPEND descriptor per process, so forked workers never share a file offset
+                os.makedirs(os.path.dirname(os.path.abspath(self.trace_path)), exist_ok=True)
+                self.fd = os.open(self.trace_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+                self.fd_pid = os.getpid()
+            os.write(self.fd, line)
+
+    def add(self, event):
+        """
+        Folds one finished span into the aggregates.
+        """
+        key = (event['span'], event.get('model') or '', event.get('question_type') or '')
+        with self.lock:
+            stats = self.stats[key]
+            stats['count'] += 1
+            stats['seconds'] += event['duration']
+            stats['errors'] += 1 if event.get('error') else 0
+            stats['cache_hits'] += 1 if event.get('cache_hit') else 0
+            for field in LLM_FIELDS:
+                stats[field] += event.get(field) or 0
+            bucket = next((i for i, bound in enumerate(BUCKETS) if event['duration'] <= bound), len(BUCKETS))
+            self.histograms[key][bucket] += 1
+
+    def record(self, event):
+        self.add(event)
+        self.write(event)
+
+tracer = Tracer()
+
+@contextmanager
+def labels(**values):
+    """
+    Sets labels (model, question_type, ...) inherited by every span opened inside the block.
+    """
+    token = current_labels.set({**current_labels.get(), **values})
+    try:
+        yield
+    finally:
+        current_labels.reset(token)
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Times a block. The yielded dict can be filled with extra fields (token counts, sizes) before it closes.
+    """
+    event = {'span': name, **current_labels.get(), **attrs}
+    start = time.perf_counter()
+    try:
+        yield event
+    except BaseException as e:
+        event['error'] = e.__class__.__name__
+        raise
+    finally:
+        event['duration'] = time.perf_counter() - start
+        event['ts'] = time.time()
+        event['pid'] = os.getpid()
+        tracer.record(event)
+
+def traced(name):
+    """
+    Decorator form of `span`.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_llm_response(event, response):
+    """
+    Copies the Ollama-reported token counts and durations of a llama_index response into a span.
+    """
+    raw = getattr(response, 'raw', None) or {}
+    for field in LLM_FIELDS:
+        if raw.get(field) is not None:
+            event[field] = raw[field]
+
+def prometheus_text(stats, histograms):
+    """
+    Renders aggregates in the Prometheus text exposition format.
+    """
+    def label_text(key, extra=''):
+        span_name, model, question_type = key
+        text = f'span="{span_name}",model="{model}",question_type="{question_type}"'
+        return '{' + text + extra + '}'
+
+    lines = []
+    metrics = [
+        ('qa_span_seconds_total', 'counter', 'Wall time spent in spans', 'seconds', 1),
+        ('qa_span_calls_total', 'counter', 'Finished spans', 'count', 1),
+        ('qa_span_errors_total', 'counter', 'Spans that raised', 'errors', 1),
+        ('qa_llm_cache_hits_total', 'counter', 'LLM calls answered from the response cache', 'cache_hits', 1),
+        ('qa_llm_prompt_tokens_total', 'counter', 'Ollama prompt_eval_count', 'prompt_eval_count', 1),
+        ('qa_llm_eval_tokens_total', 'counter', 'Ollama eval_count', 'eval_count', 1),
+        ('qa_llm_prompt_eval_seconds_total', 'counter', 'Ollama prompt_eval_duration', 'prompt_eval_duration', 1e-9),
+        ('qa_llm_eval_seconds_total', 'counter', 'Ollama eval_duration', 'eval_duration', 1e-9),
+        ('qa_llm_load_seconds_total', 'counter', 'Ollama load_duration', 'load_duration', 1e-9),
+    ]
+    for metric, kind, help_text, field, scale in metrics:
+        lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+        for key in sorted(stats):
+            if field in ('seconds', 'count') or stats[key][field]:
+                lines.append(f'{metric}{label_text(key)} {stats[key][field] * scale:g}')
+
+    lines += ['# HELP qa_span_duration_seconds Span durations', '# TYPE qa_span_duration_seconds histogram']
+    for key in sorted(histograms):
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), histograms[key]):
+            cumulative += count
+            le = f',le="{bound}"'
+            lines.append(f'qa_span_duration_seconds_bucket{label_text(key, le)} {cumulative}')
+        lines.append(f'qa_span_duration_seconds_sum{label_text(key)} {stats[key]["seconds"]:g}')
+        lines.append(f'qa_span_duration_seconds_count{label_text(key)} {int(stats[key]["count"])}')
+    return '\n'.join(lines) + '\n'
+
+def write_prometheus(path, stats=None, histograms=None):
+    stats = tracer.stats if stats is None else stats
+    histograms = tracer.histograms if histograms is None else histograms
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(prometheus_text(stats, histograms))
+    os.replace(tmp_path, path)
+
+def summary(stats=None):
+    """
+    Per (model, question type) rows: LLM calls, latency, tokens, generation speed and time per span.
+    """
+    stats = tracer.stats if stats is None else stats
+    rows = defaultdict(lambda: defaultdict(float))
+    for (span_name, model, question_type), values in stats.items():
+        row = rows[(model, question_type)]
+        row[f'{span_name}_s'] += values['seconds']
+        if span_name == 'llm.complete':
+            for field in ('count', 'seconds', 'cache_hits') + LLM_FIELDS:
+                row[field] += values[field]
+    report = []
+    for (model, question_type), row in sorted(rows.items()):
+        eval_seconds = row['eval_duration'] / 1e9
+        calls = row['count'] - row['cache_hits']
+        report.append({
+            'model': model, 'question_type': question_type,
+            'llm_calls': int(row['count']), 'cache_hits': int(row['cache_hits']),
+            'mean_latency_s': round(row['seconds'] / calls, 3) if calls else None,
+            'prompt_tokens': int(row['prompt_eval_count']), 'eval_tokens': int(row['eval_count']),
+            'eval_tokens_per_s': round(row['eval_count'] / eval_seconds, 1) if eval_seconds else None,
+            'span_seconds': {name[:-2]: round(value, 3) for name, value in row.items() if name.endswith('_s')},
+        })
+    return report
+
+def print_summary(stats=None):
+    for row in summary(stats):
+        spans = ', '.join(f'{name} {seconds:.1f}s' for name, seconds in sorted(row['span_seconds'].items(), key=lambda item: -item[1]))
+        print(f"{row['model'] or '-':<14} {row['question_type'] or '-':<17} calls {row['llm_calls']:>6} "
+              f"(cached {row['cache_hits']}) latency {row['mean_latency_s']}s tokens {row['prompt_tokens']}/{row['eval_tokens']} "
+              f"eval tok/s {row['eval_tokens_per_s']} | {spans}")
+
+def load_trace(path):
+    """
+    Rebuilds aggregates from a JSONL trace, e.g. one shared by several worker processes.
+    """
+    trace = Tracer(trace_path=None)
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                trace.add(json.loads(line))
+            except (ValueError, KeyError):
+                continue  # torn line from a killed process
+    return trace
+
+@atexit.register
+def write_snapshot():
+    if not METRICS_PATH or not tracer.stats:
+        return
+    if tracer.trace_path and os.path.exists(tracer.trace_path):
+        trace = load_trace(tracer.trace_path)
+        write_prometheus(METRICS_PATH, trace.stats, trace.histograms)
+    else:
+        write_prometheus(METRICS_PATH)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a span trace per model and question type")
+    parser.add_argument("trace", help="JSONL trace written with TRACE_PATH")
+    parser.add_argument("--prometheus", help="Also write a Prometheus text snapshot to this path")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+
+    args = parser.parse_args()
+    trace = load_trace(args.trace)
+    if args.json:
+        json.dump(summary(trace.stats), sys.stdout, indent=2)
+    else:
+        print_summary(trace.stats)
+    if args.prometheus:
+        write_prometheus(args.prometheus, trace.stats, trace.histograms)
@@ -0,0 +1,28 @@
+import os
+import re
+import json
+import hashlib
+from .tracing import span
+
+def chunk_hash(chunk):
+    """
+    Returns a stable content hash used as the identity of a chunk.
+    """
+    return hashlib.sha1(chunk.encode('utf-8')).hexdigest()[:16]
+
+def sanitize_filename(name):
+    """
+    Replaces illegal filename characters with underscores.
+    """
+    return re.sub(r'[:<>"/\\|?*]', '_', name)
+
+def write_json_atomic(path, data, indent=4, ensure_ascii=False):
+    """
+    Writes JSON to a temporary file and renames it over `path`, so readers never see a partial file.
+    Pass `ensure_ascii` to keep the escaped encoding of outputs that were written with json.dump's default.
+    """
+    with span('write_json', path=os.path.basename(path)):
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=indent, ensure_ascii=ensure_ascii)
+        os.replace(tmp_path, path)
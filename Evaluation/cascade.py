@@ -0,0 +1,157 @@
+"""
+Evaluation cascades driven by the global filter's thresholds: early exit across metrics
+(MetricCascade) and escalation across judge models (JudgeTiers).
+
+Filtering.global_filter keeps a pair only when the weighted mean of its question scores and of its
+answer scores both reach their thresholds. After each metric the cascade computes the best mean
+each group could still reach, taking every unscored metric at the top of the scale. Once one group
+cannot reach its threshold the pair is certain to be filtered out, so its remaining metrics are
+marked as skipped (score -1) instead of being sent to the judge.
+
+With the same judge responses, a pair passes the threshold filter after a cascade run exactly when
+it passes after a full run. This relies on scores staying on the prompt's 0-10 scale; a higher score
+seen during the run raises the assumed maximum. Local filtering merges near-duplicate questions
+before the global filter and picks the merged question and answer by their scores, so pairs with a
+near-duplicate among the models' outputs for the same chunk are never cut short. Clusters depend
+only on question embeddings and are computed from the generated files before scoring, which keeps
+the final dataset identical to a full run's.
+
+Metrics are tried in `cascade_metric_order` until each has `cascade_min_samples` scores. After that
+they are ranked by exit power per second of judge time. Exit power is the share of observed scores
+low enough to sink the metric's group on their own.
+
+JudgeTiers scores every metric with the first model in `evaluation_tiers`. A pair is settled when
+every group mean clears its threshold by at least `uncertainty_band`, or some group falls short by
+at least that much. Other pairs, including any with a failed score, go to the next tier, and the
+last tier always settles. `tier_audit_rate` escalates a share of settled pairs anyway so agreement
+between tiers can be measured on them as well.
+"""
+from collections import defaultdict
+from Filtering.config import QUESTION_THRESHOLD, ANSWER_THRESHOLD, QUESTION_WEIGHTS, ANSWER_WEIGHTS
+from Common.utils import chunk_hash
+from .config import metric_types, score_max, cascade_metric_order, cascade_min_samples, uncertainty_band, tier_audit_rate
+
+def score_groups(thresholds=None, weights=None):
+    """
+    Returns [(weights, threshold)] for the question and answer score groups of the global filter.
+    """
+    question_threshold, answer_threshold = thresholds or (QUESTION_THRESHOLD, ANSWER_THRESHOLD)
+    question_weights, answer_weights = weights or (QUESTION_WEIGHTS, ANSWER_WEIGHTS)
+    return [(question_weights, question_threshold), (answer_weights, answer_threshold)]
+
+def group_mean(weights, scores, default=0):
+    return sum(weight * scores.get(metric, default) for metric, weight in weights.items()) / sum(weights.values())
+
+class MetricCascade:
+    def __init__(self, thresholds=None, weights=None, order=cascade_metric_order, min_samples=cascade_min_samples):
+        self.groups = score_groups(thresholds, weights)
+        self.order = [metric for metric in order if metric in metric_types]
+        self.order += [metric for metric in metric_types if metric not in self.order]
+        self.min_samples = min_samples
+        self.score_max = score_max
+        self.scores = defaultdict(list)
+        self.seconds = defaultdict(float)
+        self.pairs = 0
+        self.exits = 0
+        self.skipped = 0
+
+    def cannot_pass(self, scores):
+        """
+        True when, whatever the unscored metrics return, some group stays below its threshold.
+        """
+        return any(group_mean(weights, scores, self.score_max) < threshold for weights, threshold in self.groups)
+
+    def exit_power(self, metric):
+        """
+        Share of this metric's observed scores that fail its group even with every other metric at the maximum.
+        """
+        observed = self.scores[metric]
+        for weights, threshold in self.groups:
+            if weights.get(metric):
+                slack = sum(weights.values()) * (self.score_max - threshold)
+                return sum(weights[metric] * (self.score_max - score) > slack for score in observed) / len(observed)
+        return 0.0
+
+    def metric_order(self):
+        if any(len(self.scores[metric]) < self.min_samples for metric in self.order):
+            return list(self.order)
+        rank = {metric: i for i, metric in enumerate(self.order)}
+        value = {metric: self.exit_power(metric) / max(self.seconds[metric] / len(self.scores[metric]), 1e-3)
+                 for metric in self.order}
+        return sorted(self.order, key=lambda metric: (-value[metric], rank[metric]))
+
+    def observe(self, metric, score, seconds):
+        if score >= 0:
+            self.scores[metric].append(score)
+            self.seconds[metric] += seconds
+            self.score_max = max(self.score_max, score)
+
+    def finish_pair(self, skipped):
+        self.pairs += 1
+        if skipped:
+            self.exits += 1
+            self.skipped += skipped
+
+    def report(self):
+        full = self.pairs * len(self.order)
+        saved = f' ({100 * self.skipped / full:.1f}%)' if full else ''
+        print(f'Cascade: {self.exits} of {self.pairs} pairs exited early; '
+              f'{self.skipped} of {full} metric calls saved{saved}; order {", ".join(self.metric_order())}')
+
+class JudgeTiers:
+    def __init__(self, models, band=uncertainty_band, audit_rate=tier_audit_rate, thresholds=None, weights=None):
+        self.models = list(models)
+        self.band = band
+        self.audit_rate = audit_rate
+        self.groups = score_groups(thresholds, weights)
+        self.scored = defaultdict(int)  # pairs scored by each tier
+        self.escalated = defaultdict(int)  # pairs passed on to the next tier
+        self.audited = defaultdict(int)  # settled pairs escalated for auditing
+        self.agreed = defaultdict(int)  # escalated pairs whose pass/fail this tier predicted correctly
+
+    def passes(self, scores):
+        return all(group_mean(weights, scores) >= threshold for weights, threshold in self.groups)
+
+    def settled(self, scores):
+        """
+        True when the scores are clear of every threshold by the band, or clearly fail one of them.
+        """
+        if any(score < 0 for score in scores.values()):
+            return False
+        margins = [group_mean(weights, scores) - threshold for weights, threshold in self.groups]
+        return any(margin <= -self.band for margin in margins) or all(margin >= self.band for margin in margins)
+
+    def audit(self, question):
+        # Deterministic per question so a resumed run audits the same pairs
+        return self.audit_rate > 0 and int(chunk_hash(question), 16) % 10000 < self.audit_rate * 10000
+
+    def escalate(self, level, scores, question):
+        """
+        Records a tier's scores and returns whether the pair goes on to the next tier.
+        """
+        self.scored[level] += 1
+        if level == len(self.models) - 1:
+            return False
+        if self.settled(scores):
+            if not self.audit(question):
+                return False
+            self.audited[level] += 1
+        self.escalated[level] += 1
+        return True
+
+    def record_final(self, tier_results):
+        """
+        Counts, for every tier below the settling one, whether its pass/fail matched the final one.
+        """
+        final = self.passes(tier_results[-1]['scores'])
+        for level, result in enumerate(tier_results[:-1]):
+            self.agreed[level] += self.passes(result['scores']) == final
+
+    def report(self):
+        for level, model in enumerate(self.models[:-1]):
+            scored, escalated = self.scored[level], self.escalated[level]
+            rate = f'{100 * escalated / scored:.1f}%' if scored else '-'
+            agreement = f'{100 * self.agreed[level] / escalated:.1f}%' if escalated else '-'
+            print(f'Tier {level} ({model}): {scored} pairs, {escalated} escalated ({rate}, {self.audited[level]} for audit); '
+                  f'pass/fail agreement with the final tier on escalated pairs {agreement}')
+        print(f'Tier {len(self.models) - 1} ({self.models[-1]}): {self.scored[len(self.models) - 1]} pairs')
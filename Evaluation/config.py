@@ -2,3 +2,23 @@ metric_types = ['accuracy', 'completeness', 'groundedness', 'relevance', 'intent
 question_types = ['Yes/No', 'Yes/No cond', 'Legal Obligation', 'Factual', 'Descriptive']
 models = ['mixtral', 'gemma3:27b', 'llama3.3', 'yi:34b']
 evaluation_model = 'qwen3:8b'
+
+# 'single' scores one metric per call; 'batched' scores all metrics for `pairs_per_call` pairs per call;
+# 'cascade' scores one metric per call and stops once a pair cannot pass the global filter thresholds;
+# 'tiered' scores with the `evaluation_tiers` judges in turn, escalating pairs close to the thresholds
+evaluation_mode = 'single'
+pairs_per_call = 1
+
+# 'legacy' keeps the original prompt order; 'prefix' puts the policy document ahead of the metric and
+# QA pair so consecutive judge calls on a chunk reuse Ollama's cached prompt prefix
+prompt_layout = 'legacy'
+
+# Early-exit cascade (see Evaluation/cascade.py); thresholds and weights come from Filtering.config
+score_max = 10  # top of the judge's scale, assumed for metrics not scored yet
+cascade_metric_order = ['groundedness', 'accuracy', 'completeness', 'relevance', 'intent']
+cascade_min_samples = 50  # scores per metric before the order adapts to observed scores
+
+# Tiered judging ('tiered' mode): cheaper judges first, the last model settles what they leave uncertain
+evaluation_tiers = ['qwen3:1.7b', evaluation_model]
+uncertainty_band = 1.0  # group means closer than this to a threshold are escalated
+tier_audit_rate = 0.05  # share of settled pairs escalated anyway to measure agreement
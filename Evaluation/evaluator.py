@@ -1,14 +1,39 @@
 import json
-from .prompts import get_prompt
+from .prompts import get_prompt, return_prompt
 from .config import evaluation_model
-from llama_index.llms.ollama import Ollama
+from Common.llm_clients import get_llm
+from Common.llm_calls import complete
+from Common.tracing import labels, span
+
+def evaluation_llm(model=evaluation_model):
+    """
+    Returns the shared judge client for a model, `evaluation_model` by default.
+    """
+    return get_llm(model, request_timeout=100, verbose=False, json_mode=True)
 
 def evaluate_qa_pairs(chunk, question, answer, context, conditions, metric_type, question_type,
-                      llm, title, summary, program_type, sector_type, incentive_amount_data):
-    try:
-        prompt = get_prompt(chunk, question, answer, context, conditions,
-                            metric_type, question_type, title, summary, program_type, sector_type, incentive_amount_data)
-        response = llm.complete(prompt)
-        return response.text
-    except Exception as e:
-        return False
+                      llm, title, summary, program_type, sector_type, incentive_amount_data, refresh=False):
+    """
+    Returns the judge's raw response, or False if the prompt could not be built.
+    Raises LLMCallError when the call policy gives up on the request.
+    """
+    with labels(model=llm.model, question_type=question_type), span('evaluate_qa_pairs', metric=metric_type) as event:
+        try:
+            prompt = get_prompt(chunk, question, answer, context, conditions,
+                                metric_type, question_type, title, summary, program_type, sector_type, incentive_amount_data)
+        except Exception as e:
+            event['error'] = e.__class__.__name__
+            return False
+        return complete(llm, prompt, refresh)
+
+def evaluate_qa_batch(chunk, qa_pairs, question_type, llm, title, summary, program_type, sector_type, incentive_amount_data):
+    """
+    Scores every metric for a batch of QA pairs from the same chunk in a single LLM call.
+    """
+    with labels(model=llm.model, question_type=question_type), span('evaluate_qa_batch', pairs=len(qa_pairs)) as event:
+        try:
+            prompt = return_prompt(chunk, qa_pairs, question_type, title, summary, program_type, sector_type, incentive_amount_data)
+        except Exception as e:
+            event['error'] = e.__class__.__name__
+            return False
+        return complete(llm, prompt)
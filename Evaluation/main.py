@@ -1,8 +1,30 @@
-import sys
+import argparse
+from . import config
+from .config import evaluation_mode, pairs_per_call, prompt_layout
 from .runner import main
+from Common.config import JOB_LEDGER_PATH
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f'{value} is not a positive integer')
+    return number
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print('Usage: python -m Evaluation.main <files_folder> <output_folder> <start_index>')
-    else:
-        main(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+    parser = argparse.ArgumentParser(description="Score generated QA pairs with an LLM judge")
+    parser.add_argument("files_folder", help="Path to folder with generated QA pairs")
+    parser.add_argument("output_folder", help="Path to folder for evaluated QA pairs")
+    parser.add_argument("start_index", type=int, help="Index of the first document folder to process")
+    parser.add_argument("--mode", choices=['single', 'batched', 'cascade', 'tiered'], default=evaluation_mode,
+                        help="Score one metric per call, all metrics in one call, one metric per call stopping once "
+                             "a pair cannot pass the global filter thresholds, or with cheaper judges first")
+    parser.add_argument("--pairs-per-call", type=positive_int, default=pairs_per_call,
+                        help="QA pairs of the same chunk scored together in batched mode")
+    parser.add_argument("--prompt-layout", choices=['legacy', 'prefix'], default=prompt_layout,
+                        help="Put the policy document ahead of the metric and QA pair so judge calls share a cached prefix")
+    parser.add_argument("--ledger", default=JOB_LEDGER_PATH,
+                        help="Job ledger shared by cooperating workers; start this command once per worker")
+
+    args = parser.parse_args()
+    config.prompt_layout = args.prompt_layout
+    main(args.files_folder, args.output_folder, args.start_index, args.mode, args.pairs_per_call, args.ledger)
@@ -1,4 +1,5 @@
 import json
+from . import config
 from .config import metric_types, question_types
 
 # All your get_*_conditions functions
@@ -162,20 +163,109 @@ def additional_instructions(metric_type, question_type):
     return get_intent_conditions(question_type)
 
 
+metric_definitions = {
+    'accuracy': 'Does the answer correctly reflect the information in the chunk for this question?',
+    'completeness': 'Does the answer cover every part of what the question asks, without leaving out key details?',
+    'groundedness': 'Is every claim in the answer supported by the chunk, with nothing invented or assumed?',
+    'relevance': 'Is the question relevant and useful to someone in the program sector who wants to understand this policy?',
+    'intent': 'Is the question clearly worded, specific, and true to the expected question type?',
+}
+
+def format_pair(question, answer, context, conditions):
+    return f"""**Question** - {question}
+**Answer** - {answer}
+**Conditions** - {conditions}
+**Context** - {context}"""
+
+def format_document(chunk, title, summary, program_type, sector_type, incentive_amount_data):
+    return f"""## Policy Metadata:
+**title** - {title}
+**Program Type** - {program_type}
+**Program Sector** - {sector_type}
+**Summary** - {summary}
+**Incentive Amount Data** - {json.dumps(incentive_amount_data, ensure_ascii=False, default=str)}
+
+## Chunk:
+{chunk}"""
+
 def get_prompt(chunk, question, answer, context, conditions, metric_type, question_type, title, summary, program_type, sector_type, incentive_amount_data):
     additional_prompts = additional_instructions(metric_type, question_type)
-    
-    # Entire formatting block for accuracy, completeness, intent, relevance, groundedness
-    # You have already provided this in your code — just include all `if metric_type == ...` blocks as-is
-    
-    return res
-
-def return_prompt(title, summary, program_type, sector_type, question_type, questions, incentive_amount_data):
-    prompt = f"""You are an expert assistant..."""  # Full multi-question prompt template from original code
-    for i, q in enumerate(questions, 1):
-        prompt += f"{i}. {q}\n"
+    if config.prompt_layout == 'prefix':
+        # Document first, so every metric and pair of a chunk shares the prompt prefix Ollama has cached
+        return f"""You are an expert evaluator of question-answer pairs generated from US solar and energy policy documents.
+Read the policy document below, then score the QA pair that follows it on the metric given, on a scale of 0 to 10, where 10 is best.
+
+{format_document(chunk, title, summary, program_type, sector_type, incentive_amount_data)}
+
+## Metric - {metric_type}:
+Score the QA pair below for **{metric_type}**.
+{metric_definitions[metric_type]}
+
+## Additional Instructions for question type {question_type}:
+{additional_prompts}
+
+## QA Pair:
+{format_pair(question, answer, context, conditions)}
+
+## Output Format:
+Return only a JSON object: {{"score": <0-10>, "reason": "<one or two sentences>"}}
+"""
+
+    return f"""You are an expert evaluator of question-answer pairs generated from US solar and energy policy documents.
+Score the QA pair below for **{metric_type}** on a scale of 0 to 10, where 10 is best.
+
+## Metric - {metric_type}:
+{metric_definitions[metric_type]}
+
+## Additional Instructions for question type {question_type}:
+{additional_prompts}
+
+{format_document(chunk, title, summary, program_type, sector_type, incentive_amount_data)}
+
+## QA Pair:
+{format_pair(question, answer, context, conditions)}
+
+## Output Format:
+Return only a JSON object: {{"score": <0-10>, "reason": "<one or two sentences>"}}
+"""
+
+def return_prompt(chunk, qa_pairs, question_type, title, summary, program_type, sector_type, incentive_amount_data):
+    """
+    Builds one prompt that scores every metric for several QA pairs of the same chunk.
+    """
+    prefix = config.prompt_layout == 'prefix'
+    prompt = f"""You are an expert evaluator of question-answer pairs generated from US solar and energy policy documents.
+Score every QA pair below on each metric on a scale of 0 to 10, where 10 is best.
+"""
+    if prefix:
+        prompt += f"""
+{format_document(chunk, title, summary, program_type, sector_type, incentive_amount_data)}
+"""
     prompt += """
----
-Rate each question on a scale...
+## Metrics:
+"""
+    for metric_type in metric_types:
+        prompt += f"""
+### {metric_type}
+{metric_definitions[metric_type]}
+{additional_instructions(metric_type, question_type).strip()}
+"""
+    if not prefix:
+        prompt += f"""
+{format_document(chunk, title, summary, program_type, sector_type, incentive_amount_data)}
+"""
+    prompt += f"""
+## QA Pairs (question type {question_type}):
+"""
+    for i, obj in enumerate(qa_pairs, 1):
+        prompt += f"""
+### {i}
+{format_pair(obj['question'], obj['answer'], obj['context'], obj['conditions'])}
+"""
+    metric_format = ', '.join(f'"{metric_type}": {{"score": <0-10>, "reason": "<reason>"}}' for metric_type in metric_types)
+    prompt += f"""
+## Output Format:
+Return only a JSON object with one entry per QA pair, in order:
+{{"results": [{{"pair": <QA pair number>, {metric_format}}}]}}
 """
     return prompt.strip()
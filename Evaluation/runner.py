@@ -1,17 +1,140 @@
 import os
 import json
 import re
-import pandas as pd
+import time
 from tqdm import tqdm
-from llama_index.llms.ollama import Ollama
-
-from .config import metric_types
-from .evaluator import evaluate_qa_pairs
-from .utils import parse_json, safe_int
-
-def main(files_folder, output_folder, start_index):
-    final_df = pd.read_json('./data/final_df.json')
-
+from .config import metric_types, evaluation_mode, pairs_per_call, evaluation_tiers
+from .evaluator import evaluate_qa_pairs, evaluate_qa_batch, evaluation_llm
+from .cascade import MetricCascade, JudgeTiers
+from .utils import parse_json, parse_score, parse_batched_scores
+from Common.metadata import policy_metadata
+from Common.checkpoint import Checkpoint, checkpoint_path
+from Common.config import JOB_LEDGER_PATH
+from Common.job_ledger import run_jobs, worker_id, check_lease
+from Common.call_policy import LLMCallError, call_policy
+from Common.endpoint_pool import endpoint_pool
+from Common.tracing import labels, span
+from Common.utils import chunk_hash
+from Filtering.local_filtering import near_duplicate_questions
+
+def score_metric(chunk, obj, metric_type, question_type, llm, metadata, errors):
+    """
+    Scores one metric of a QA pair, recording the pair in `errors` with the failure outcome if no score is obtained.
+
+    Timeouts and connection errors are already retried with backoff by the call policy. A response
+    without a parseable score is asked for once more, bypassing the response cache.
+    """
+    obj[f'{metric_type}_score'] = -1
+    for tries in range(2):
+        try:
+            temp = evaluate_qa_pairs(chunk, obj['question'], obj['answer'], obj['context'], obj['conditions'],
+                                     metric_type, question_type, llm, metadata['name'], metadata['summary'],
+                                     metadata['program_category_name'], metadata['sector_name'], metadata['incentive_amount_data'],
+                                     refresh=tries > 0)
+        except LLMCallError as e:
+            errors.append(dict(obj, failed_metric=metric_type, failure=e.outcome))
+            return
+        if temp is False:
+            errors.append(dict(obj, failed_metric=metric_type, failure='prompt_error'))
+            return
+
+        temp = parse_json(temp)
+        score = parse_score(temp)
+        if score is not None:
+            obj[f'{metric_type}_eval'] = temp
+            obj[f'{metric_type}_score'] = score
+            return
+        call_policy.count(llm.model, 'parse_error')
+    errors.append(dict(obj, failed_metric=metric_type, failure='parse_error'))
+
+def score_batched(chunk, qa_pairs, question_type, llm, metadata, errors, pairs_per_call, i):
+    """
+    Scores all metrics for `pairs_per_call` QA pairs per LLM call, falling back to `score_metric`
+    for any metric missing from the batched response.
+    """
+    for start in tqdm(range(0, len(qa_pairs), pairs_per_call), f'Batch | {i}', leave=False):
+        batch = qa_pairs[start:start + pairs_per_call]
+        try:
+            temp = evaluate_qa_batch(chunk, batch, question_type, llm, metadata['name'], metadata['summary'],
+                                     metadata['program_category_name'], metadata['sector_name'], metadata['incentive_amount_data'])
+        except LLMCallError:
+            temp = None  # every metric falls back to score_metric
+        parsed = parse_batched_scores(temp, len(batch), metric_types)
+
+        for obj, scores in zip(batch, parsed):
+            for metric_type in metric_types:
+                if metric_type in scores:
+                    obj[f'{metric_type}_score'], obj[f'{metric_type}_eval'] = scores[metric_type]
+                else:
+                    score_metric(chunk, obj, metric_type, question_type, llm, metadata, errors)
+
+def score_cascade(chunk, qa_pairs, question_type, llm, metadata, errors, cascade, i, duplicates=None):
+    """
+    Scores metrics one call at a time in the cascade's order, stopping as soon as a pair can no
+    longer pass the global filter; the metrics left are marked `{metric}_skipped` with score -1.
+    Questions in `duplicates` will be merged with a near-duplicate by local filtering, which
+    compares their scores, so they are always fully scored. Without `duplicates`, when the chunk's
+    near-duplicates are not known yet, every pair is fully scored.
+    """
+    for obj in tqdm(qa_pairs, f'Question | {i}', leave=False):
+        order = cascade.metric_order()
+        scores = {}
+        for position, metric_type in enumerate(order):
+            start = time.perf_counter()
+            score_metric(chunk, obj, metric_type, question_type, llm, metadata, errors)
+            scores[metric_type] = obj[f'{metric_type}_score']
+            cascade.observe(metric_type, scores[metric_type], time.perf_counter() - start)
+            if duplicates is not None and obj['question'] not in duplicates and cascade.cannot_pass(scores):
+                for skipped in order[position + 1:]:
+                    obj[f'{skipped}_score'] = -1
+                    obj[f'{skipped}_skipped'] = True
+                cascade.finish_pair(len(order) - position - 1)
+                break
+        else:
+            cascade.finish_pair(0)
+
+def score_tiered(chunk, qa_pairs, question_type, llms, metadata, errors, tiers, i):
+    """
+    Scores every metric with each judge tier in turn until one settles the pair. The settling tier's
+    scores become the pair's scores; every tier's scores and raw outputs go to `judge_tiers`.
+    """
+    for obj in tqdm(qa_pairs, f'Question | {i}', leave=False):
+        tier_results = []
+        for level, llm in enumerate(llms):
+            scored, tier_errors = dict(obj), []
+            for metric_type in metric_types:
+                score_metric(chunk, scored, metric_type, question_type, llm, metadata, tier_errors)
+            scores = {metric_type: scored[f'{metric_type}_score'] for metric_type in metric_types}
+            tier_results.append({'model': llm.model, 'scores': scores,
+                                 'raw': {metric_type: scored.get(f'{metric_type}_eval') for metric_type in metric_types}})
+            if not tiers.escalate(level, scores, obj['question']):
+                break
+
+        tiers.record_final(tier_results)
+        errors.extend(tier_errors)
+        for metric_type in metric_types:
+            obj[f'{metric_type}_score'] = scored[f'{metric_type}_score']
+            if f'{metric_type}_eval' in scored:
+                obj[f'{metric_type}_eval'] = scored[f'{metric_type}_eval']
+        obj['judge_model'] = llm.model
+        obj['judge_tiers'] = tier_results
+
+def load_checkpoint(output_file_path):
+    """
+    Opens the per-chunk checkpoint of an evaluation output file, migrating an existing
+    output file written before checkpointing into it.
+    """
+    checkpoint = Checkpoint(checkpoint_path(output_file_path))
+    if not checkpoint.exists() and os.path.exists(output_file_path):
+        with open(output_file_path, 'r', encoding='utf-8') as f:
+            existing_data = json.load(f)
+        for chunk_data in existing_data:
+            if isinstance(chunk_data, dict) and 'chunk' in chunk_data:
+                checkpoint.append(chunk_data.get('chunk_id') or chunk_hash(chunk_data['chunk']), chunk_data)
+        checkpoint.close()
+    return checkpoint
+
+def main(files_folder, output_folder, start_index, eval_mode=evaluation_mode, pairs_per_call=pairs_per_call, ledger=JOB_LEDGER_PATH):
     if not os.path.exists(files_folder):
         print(f'Error: {files_folder} does not exist!')
         return
@@ -21,15 +144,21 @@ def main(files_folder, output_folder, start_index):
     files = sorted(os.listdir(files_folder))[start_index:]
     result_files = []
     for folder in files:
-        result_files.extend(os.listdir(os.path.join(files_folder, folder)))
-    result_files.sort()
-
+        # The folder is the document name; sanitized model names such as gemma3_27b contain underscores
+        result_files.extend((folder, file) for file in os.listdir(os.path.join(files_folder, folder)) if file.endswith('.json'))
+    result_files.sort(key=lambda item: item[1])
+
+    llm = evaluation_llm()
+    cascade = MetricCascade() if eval_mode == 'cascade' else None
+    tiers = JudgeTiers(evaluation_tiers) if eval_mode == 'tiered' else None
+    tier_llms = [evaluation_llm(model) for model in evaluation_tiers] if eval_mode == 'tiered' else None
     res, errors = [], []
-    for file in tqdm(result_files, desc='Files'):
+    # Cooperating workers each keep their own error file
+    errors_file = f"error.{worker_id().replace(':', '.')}.json" if ledger else "error.json"
+
+    def evaluate_file(document_name, file):
         fName = file.rsplit('.', 1)[0]
         question_type = fName.split('_')[-2]
-        gen_model = fName.split('_')[-3]
-        document_name = '_'.join(fName.split('_')[:-3])
 
         output_folder_n = os.path.join(output_folder, "final_kri", "qa-eval", document_name)
         os.makedirs(output_folder_n, exist_ok=True)
@@ -37,85 +166,71 @@ def main(files_folder, output_folder, start_index):
         output_file_path = os.path.join(output_folder_n, f"{fName}.json")
         file_path = os.path.join(files_folder, document_name, file)
 
-        existing_data = []
-        completed_chunks_text = set()
-
-        if os.path.exists(output_file_path):
-            with open(output_file_path, 'r', encoding='utf-8') as f:
-                existing_data = json.load(f)
-            for chunk_data in existing_data:
-                if isinstance(chunk_data, dict) and 'chunk' in chunk_data:
-                    completed_chunks_text.add(chunk_data['chunk'])
+        checkpoint = load_checkpoint(output_file_path)
+        completed = checkpoint.load()
 
         with open(file_path, 'r', encoding='utf-8') as f:
             input_json = json.load(f)
-        all_input_chunks = set(doc['chunk'] for doc in input_json)
+        keys = [document.get('chunk_id') or chunk_hash(document['chunk']) for document in input_json]
 
-        if completed_chunks_text.issuperset(all_input_chunks):
-            continue
+        if all(key in completed for key in keys):
+            if not os.path.exists(output_file_path):
+                checkpoint.compact(output_file_path, keys, completed)
+            return
 
         doc_id = int(re.match(r"(\d+)_", fName).group(1))
-        summary_row = final_df[final_df["id"] == doc_id]
-        if summary_row.empty:
+        metadata = policy_metadata.get(doc_id, ['summary', 'name', 'program_category_name', 'sector_name', 'incentive_amount_data'])
+        if metadata is None:
             print(f"No summary found for doc_id: {doc_id}")
-            continue
+            return
 
-        summary = summary_row['summary'].values[0]
-        title, program_type, sector_type, incentive_amount_data = summary_row[['name', 'program_category_name', 'sector_name', 'incentive_amount_data']].to_numpy()[0]
+        # Near-duplicate questions across the models' files of this document and question type, for the
+        # chunks every model has finished
+        duplicates = near_duplicate_questions(os.path.join(files_folder, document_name), document_name,
+                                              fName.split('_')[-2]) if cascade is not None else {}
 
         errors_size = len(errors)
         for i, document in tqdm(list(enumerate(input_json)), desc=f'chunks {fName}', leave=False):
-            if document['chunk'] in completed_chunks_text:
+            if keys[i] in completed:
                 continue
+            check_lease()
 
             chunk = document['chunk']
             question_type = document['question_type']
             qa_pairs = document['response']
-            llm = Ollama(model='qwen3:8b', request_timeout=100, verbose=False, json_mode=True)
-
-            for obj in tqdm(qa_pairs, f'Question | {i}', leave=False):
-                for metric_type in tqdm(metric_types, desc='Metric', leave=False):
-                    tries = 0
-                    obj[f'{metric_type}_score'] = -1
-                    while tries < 2:
-                        temp = evaluate_qa_pairs(chunk, obj['question'], obj['answer'], obj['context'], obj['conditions'],
-                                                 metric_type, question_type, llm, title, summary, program_type, sector_type, incentive_amount_data)
-
-                        if temp is False:
-                            tries += 1
-                            if tries == 2: errors.append(obj.copy())
-                            continue
-
-                        temp = parse_json(temp)
-
-                        if isinstance(temp, str):
-                            score = safe_int(temp)
-                            if score == -1:
-                                tries += 1
-                                if tries == 2: errors.append(obj.copy())
-                                continue
-                        elif isinstance(temp, dict):
-                            if 'score' not in temp:
-                                tries += 1
-                                if tries == 2: errors.append(obj.copy())
-                                continue
-                            try:
-                                score = float(temp['score'] or 0)
-                            except:
-                                tries += 1
-                                if tries == 2: errors.append(obj.copy())
-                                continue
-
-                        obj[f'{metric_type}_eval'] = temp
-                        obj[f'{metric_type}_score'] = score
-                        break
-
-        with open(output_file_path, 'w', encoding='utf-8') as f:
-            json.dump(input_json, f, indent=4, ensure_ascii=False)
+            with labels(stage='evaluation', gen_model=document.get('llm')), span('evaluate_chunk', question_type=question_type, pairs=len(qa_pairs)):
+                if eval_mode == 'batched':
+                    score_batched(chunk, qa_pairs, question_type, llm, metadata, errors, pairs_per_call, i)
+                elif eval_mode == 'cascade':
+                    score_cascade(chunk, qa_pairs, question_type, llm, metadata, errors, cascade, i, duplicates.get(keys[i]))
+                elif eval_mode == 'tiered':
+                    score_tiered(chunk, qa_pairs, question_type, tier_llms, metadata, errors, tiers, i)
+                else:
+                    for obj in tqdm(qa_pairs, f'Question | {i}', leave=False):
+                        for metric_type in tqdm(metric_types, desc='Metric', leave=False):
+                            score_metric(chunk, obj, metric_type, question_type, llm, metadata, errors)
+            checkpoint.append(keys[i], document)
+
+        checkpoint.close()
+        checkpoint.compact(output_file_path, keys)
 
         if len(errors) != errors_size:
-            with open(os.path.join(output_folder, "error.json"), 'w', encoding='utf-8') as f:
+            with span('write_json', path=errors_file), open(os.path.join(output_folder, errors_file), 'w', encoding='utf-8') as f:
                 json.dump(errors, f, indent=4, ensure_ascii=False)
 
-    with open(os.path.join(output_folder, "final.json"), 'w', encoding='utf-8') as f:
+    if ledger:
+        jobs = [(f'{document_name}/{file}', {'document_name': document_name, 'file': file}) for document_name, file in result_files]
+        run_jobs(ledger, 'evaluation', jobs, evaluate_file)
+    else:
+        for document_name, file in tqdm(result_files, desc='Files'):
+            evaluate_file(document_name, file)
+
+    with span('write_json', path='final.json'), open(os.path.join(output_folder, "final.json"), 'w', encoding='utf-8') as f:
         json.dump(res, f, indent=4, ensure_ascii=False)
+    call_policy.print_report()
+    if endpoint_pool is not None:
+        endpoint_pool.print_report()
+    if cascade is not None:
+        cascade.report()
+    if tiers is not None:
+        tiers.report()
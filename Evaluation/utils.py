@@ -11,3 +11,53 @@ def safe_int(s):
         return float(s.split(',')[0].split(':')[-1].strip())
     except:
         return -1
+
+def parse_score(temp):
+    """
+    Extracts a numeric score from a parsed metric response, or returns None if it has none.
+    """
+    if isinstance(temp, str):
+        score = safe_int(temp)
+        return None if score == -1 else score
+    if isinstance(temp, (int, float)) and not isinstance(temp, bool):
+        return float(temp)
+    if isinstance(temp, dict):
+        if 'score' not in temp:
+            return None
+        try:
+            return float(temp['score'] or 0)
+        except:
+            return None
+    return None
+
+def parse_batched_scores(text, n_pairs, metric_types):
+    """
+    Parses a batched evaluation response into one {metric: (score, eval)} dict per QA pair.
+
+    Metrics that are missing or unparseable are left out so callers can fall back to scoring them alone.
+    """
+    res = [{} for _ in range(n_pairs)]
+    temp = parse_json(text) if text else None
+    if isinstance(temp, dict):
+        temp = temp.get('results', [temp] if n_pairs == 1 else None)
+    if not isinstance(temp, list):
+        return res
+
+    for i, item in enumerate(temp):
+        if not isinstance(item, dict):
+            continue
+        index = safe_pair_index(item.get('pair'), i, n_pairs)
+        if index is None:
+            continue
+        for metric_type in metric_types:
+            score = parse_score(item.get(metric_type))
+            if score is not None:
+                res[index][metric_type] = (score, item[metric_type])
+    return res
+
+def safe_pair_index(pair, position, n_pairs):
+    try:
+        index = int(pair) - 1
+    except:
+        index = position
+    return index if 0 <= index < n_pairs else None
@@ -0,0 +1,29 @@
+import os
+
+# Near-duplicate detection
+SIMILARITY_THRESHOLD = 0.95
+SIMILARITY_BLOCK_SIZE = 4096  # rows per block of the similarity matrix
+
+# Embeddings
+EMBEDDING_MODEL = 'llama3'
+EMBED_BATCH_SIZE = 64  # questions per Ollama embed request
+EMBEDDING_CACHE_DIR = './cache/embeddings'  # None disables the cache
+EMBEDDING_CACHE_DTYPE = 'float32'  # 'float16' halves the cache size
+
+# Local filtering
+LOCAL_FILTER_WORKERS = 4  # (document, question type) jobs deduplicated in parallel
+
+# Dataset-wide near-duplicate removal
+GLOBAL_DEDUP_BACKEND = 'lsh'  # 'lsh' (NumPy only), 'faiss' or 'hnswlib'
+LSH_BUCKET_SIZE = 64  # target mean bucket size used to pick the number of hyperplanes
+LSH_RECALL = 0.99  # target probability that a pair at the threshold shares a bucket in some table
+LSH_MAX_BUCKET_SIZE = 1024  # buckets larger than this are split by hashing them again on their own
+LSH_SEED = 0
+ANN_NEIGHBORS = 32  # neighbours retrieved per question by the faiss/hnswlib backends
+
+# Global relevance filter: a triplet is kept when the weighted mean of each score group reaches its threshold
+QUESTION_THRESHOLD = 7
+ANSWER_THRESHOLD = 7
+QUESTION_WEIGHTS = {'relevance': 1, 'intent': 1}
+ANSWER_WEIGHTS = {'accuracy': 1, 'completeness': 1, 'groundedness': 1}
+GLOBAL_FILTER_WORKERS = os.cpu_count() or 1
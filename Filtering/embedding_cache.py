@@ -0,0 +1,199 @@
+import os
+import re
+import json
+import fcntl
+import time
+import hashlib
+import numpy as np
+from Common.config import OLLAMA_BASE_URL, CALL_MAX_ATTEMPTS
+from Common.call_policy import RETRYABLE, classify
+from Common.endpoint_pool import endpoint_pool
+from .config import EMBEDDING_MODEL, EMBED_BATCH_SIZE, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_DTYPE
+
+KEY_SIZE = 20
+
+def normalize_text(text):
+    return ' '.join(text.split())
+
+def text_key(model_name, text):
+    return hashlib.sha1(f'{model_name}\x1f{normalize_text(text)}'.encode('utf-8')).digest()
+
+class EmbeddingCache:
+    """
+    Persistent embedding store for one embedding model, shared by processes through memory mapping.
+
+    Rows live in a flat float32/float16 file read through np.memmap, and a parallel append-only file holds
+    the 20-byte key of each row (sha1 of model name and whitespace-normalized text). Writers append rows
+    then keys under an exclusive file lock, so a key is only ever visible once its row is on disk. Rows
+    or partial keys left past the last complete (key, row) pair by a crashed writer are ignored by
+    readers and truncated by the next writer.
+    """
+    def __init__(self, cache_dir, model_name, dtype=EMBEDDING_CACHE_DTYPE):
+        os.makedirs(cache_dir, exist_ok=True)
+        name = re.sub(r'[:<>"/\\|?*]', '_', model_name)
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.data_path = os.path.join(cache_dir, f'{name}.{self.dtype.name}')
+        self.keys_path = os.path.join(cache_dir, f'{name}.keys')
+        self.meta_path = os.path.join(cache_dir, f'{name}.meta.json')
+        self.lock_path = os.path.join(cache_dir, f'{name}.lock')
+        self.dim = None
+        self.index = {}
+        self.rows = 0
+        self.matrix = None
+
+    def refresh(self):
+        """
+        Picks up rows appended by other processes since the last refresh.
+        """
+        if self.dim is None:
+            if not os.path.exists(self.meta_path):
+                return
+            with open(self.meta_path, 'r') as f:
+                self.dim = json.load(f)['dim']
+        if not os.path.exists(self.keys_path) or not os.path.exists(self.data_path):
+            return
+
+        # Only rows present in both files are complete
+        rows = min(os.path.getsize(self.keys_path) // KEY_SIZE,
+                   os.path.getsize(self.data_path) // (self.dim * self.dtype.itemsize))
+        if rows == self.rows:
+            return
+        with open(self.keys_path, 'rb') as f:
+            f.seek(self.rows * KEY_SIZE)
+            keys = f.read((rows - self.rows) * KEY_SIZE)
+        for i in range(rows - self.rows):
+            self.index[keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]] = self.rows + i
+        self.rows = rows
+        self.matrix = np.memmap(self.data_path, dtype=self.dtype, mode='r', shape=(rows, self.dim))
+
+    def get_many(self, texts):
+        """
+        Returns one float32 vector per text, or None where the text is not cached yet.
+        """
+        self.refresh()
+        res = []
+        for text in texts:
+            row = self.index.get(text_key(self.model_name, text))
+            res.append(None if row is None else np.asarray(self.matrix[row], dtype=np.float32))
+        return res
+
+    def put_many(self, texts, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if not os.path.exists(self.meta_path):
+                    tmp_path = f'{self.meta_path}.{os.getpid()}.tmp'
+                    with open(tmp_path, 'w') as f:
+                        json.dump({'dim': embeddings.shape[1], 'model': self.model_name}, f)
+                    os.replace(tmp_path, self.meta_path)
+                self.refresh()
+                self.dim = self.dim or embeddings.shape[1]
+
+                new_keys, new_rows = [], []
+                for text, embedding in zip(texts, embeddings):
+                    key = text_key(self.model_name, text)
+                    if key not in self.index and key not in new_keys:
+                        new_keys.append(key)
+                        new_rows.append(embedding)
+                if not new_keys:
+                    return
+
+                # Appends start right after the last complete row, dropping anything a crashed writer left
+                with open(self.data_path, 'ab') as f:
+                    f.truncate(self.rows * self.dim * self.dtype.itemsize)
+                    f.write(np.asarray(new_rows, dtype=self.dtype).tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+                with open(self.keys_path, 'ab') as f:
+                    f.truncate(self.rows * KEY_SIZE)
+                    f.write(b''.join(new_keys))
+                    f.flush()
+                    os.fsync(f.fileno())
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        self.refresh()
+
+def embed_texts(texts, embed_model, cache=None, batch_size=EMBED_BATCH_SIZE):
+    """
+    Embeds texts as a float32 matrix, reading cached rows and sending the rest to the embedding
+    model in batches of `batch_size`.
+    """
+    vectors = cache.get_many(texts) if cache is not None else [None] * len(texts)
+    missing = list(dict.fromkeys(normalize_text(text) for text, vector in zip(texts, vectors) if vector is None))
+
+    if missing:
+        computed = []
+        for start in range(0, len(missing), batch_size):
+            computed.extend(embed_model.get_text_embedding_batch(missing[start:start + batch_size]))
+        computed = np.asarray(computed, dtype=np.float32)
+        if cache is not None:
+            cache.put_many(missing, computed)
+        by_text = dict(zip(missing, computed))
+        vectors = [by_text[normalize_text(text)] if vector is None else vector for text, vector in zip(texts, vectors)]
+
+    if not vectors:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.vstack(vectors)
+
+embedding_caches = {}
+
+def get_embedding_cache(model_name, cache_dir=EMBEDDING_CACHE_DIR):
+    """
+    Returns the shared cache for an embedding model, or None when caching is disabled.
+    """
+    if not cache_dir:
+        return None
+    if model_name not in embedding_caches:
+        embedding_caches[model_name] = EmbeddingCache(cache_dir, model_name)
+    return embedding_caches[model_name]
+
+def ollama_embedding(model_name, base_url):
+    from llama_index.embeddings.ollama import OllamaEmbedding
+    return OllamaEmbedding(model_name=model_name, base_url=base_url, embed_batch_size=EMBED_BATCH_SIZE)
+
+class PooledEmbedding:
+    """
+    Embedding client that sends each batch to a host of the endpoint pool, moving to another host
+    when one fails with a retryable error.
+    """
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.clients = {}
+
+    def client(self, base_url):
+        if base_url not in self.clients:
+            self.clients[base_url] = ollama_embedding(self.model_name, base_url)
+        return self.clients[base_url]
+
+    def get_text_embedding_batch(self, texts):
+        tried = []
+        for attempt in range(CALL_MAX_ATTEMPTS):
+            endpoint = endpoint_pool.acquire(self.model_name, exclude=tried)
+            start = time.monotonic()
+            try:
+                embeddings = self.client(endpoint.url).get_text_embedding_batch(texts)
+            except Exception as e:
+                outcome = classify(e)
+                endpoint_pool.release(endpoint, self.model_name, outcome)
+                if outcome not in RETRYABLE or attempt + 1 == CALL_MAX_ATTEMPTS:
+                    raise
+                tried.append(endpoint.url)
+                continue
+            endpoint_pool.release(endpoint, self.model_name, 'ok', time.monotonic() - start)
+            return embeddings
+
+embedding_models = {}
+
+def get_embedding_model(model_name=EMBEDDING_MODEL):
+    """
+    Returns this process's Ollama embedding client for a model, creating it on first use.
+    With OLLAMA_ENDPOINTS set the client routes each batch through the endpoint pool.
+    """
+    if model_name not in embedding_models:
+        if endpoint_pool is not None:
+            embedding_models[model_name] = PooledEmbedding(model_name)
+        else:
+            embedding_models[model_name] = ollama_embedding(model_name, OLLAMA_BASE_URL)
+    return embedding_models[model_name]
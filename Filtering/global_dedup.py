@@ -0,0 +1,124 @@
+import math
+import numpy as np
+from .config import (SIMILARITY_THRESHOLD, GLOBAL_DEDUP_BACKEND, LSH_BUCKET_SIZE, LSH_RECALL, LSH_SEED,
+                     LSH_MAX_BUCKET_SIZE, ANN_NEIGHBORS)
+from .similarity import normalize, similar_pairs, connected_components, group_clusters
+
+def entry_score(entry):
+    """
+    Scores a filtered triplet by the mean of the two averages the global threshold checks.
+    """
+    question = (entry['relevance'] + entry['intent_score']) / 2
+    answer = (entry['accuracy'] + entry['completeness'] + entry['groundedness']) / 3
+    return (question + answer) / 2
+
+def lsh_parameters(n, threshold, bucket_size=LSH_BUCKET_SIZE, recall=LSH_RECALL):
+    """
+    Chooses (bits per table, tables) so buckets average about `bucket_size` entries and a pair at
+    `threshold` collides in at least one table with probability `recall`.
+    """
+    bits = max(1, math.ceil(math.log2(max(n / bucket_size, 2))))
+    collide = (1 - math.acos(min(threshold, 1.0)) / math.pi) ** bits
+    tables = max(1, math.ceil(math.log(1 - recall) / math.log(1 - collide))) if collide < 1 else 1
+    return bits, tables
+
+def centered_threshold(mean, threshold):
+    """
+    Cosine that a pair at `threshold` keeps once the dataset mean is subtracted, for members whose
+    offset along the mean is typical (x . mean = |mean|^2, its average). It is 0 when the rows are too
+    tightly clustered for hyperplanes to tell such a pair from the rest.
+    """
+    spread = float(1 - mean @ mean)
+    if spread <= 1e-6:
+        return 0.0
+    return max((threshold - (1 - spread)) / spread, 0.0)
+
+def lsh_pairs(matrix, threshold, seed=LSH_SEED, max_bucket=LSH_MAX_BUCKET_SIZE):
+    """
+    Random-hyperplane LSH: entries sharing a signature in any table are compared exactly, bucket by bucket.
+
+    Hashing runs on mean-centered rows, since embeddings crowd into a narrow cone and uncentered
+    hyperplanes would leave most of them on one side; candidates are checked on the original rows. A
+    bucket above `max_bucket` is hashed again on its own, and sets too small or too tightly clustered
+    for the tables to save work are compared exactly.
+    """
+    n, dim = matrix.shape
+    mean = matrix.mean(axis=0)
+    centered_at = centered_threshold(mean, threshold)
+    bits, tables = lsh_parameters(n, centered_at)
+    if centered_at <= 0 or tables * LSH_BUCKET_SIZE >= n:
+        return similar_pairs(matrix, threshold, block_size=max(1, (1 << 24) // n))
+    centered = matrix - mean
+    rng = np.random.default_rng(seed)
+    weights = (1 << np.arange(bits, dtype=np.int64))
+
+    rows, cols = [], []
+    for table in range(tables):
+        planes = rng.standard_normal((dim, bits)).astype(np.float32)
+        codes = ((centered @ planes) > 0).astype(np.int64) @ weights
+        order = np.argsort(codes, kind='stable')
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        for bucket in np.split(order, boundaries):
+            if len(bucket) < 2:
+                continue
+            bucket = np.sort(bucket)
+            if max_bucket < len(bucket) < n:
+                r, c = lsh_pairs(matrix[bucket], threshold, seed=(seed, table, bucket[0]), max_bucket=max_bucket)
+            else:
+                r, c = similar_pairs(matrix[bucket], threshold, block_size=max(1, (1 << 24) // len(bucket)))
+            rows.append(bucket[r])
+            cols.append(bucket[c])
+
+    if not rows:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    edges = np.unique(np.concatenate(rows) * n + np.concatenate(cols))
+    return edges // n, edges % n
+
+def knn_pairs(matrix, threshold, backend, neighbors=ANN_NEIGHBORS):
+    """
+    Neighbour search through an optional faiss or hnswlib HNSW index, keeping neighbours at or above `threshold`.
+    """
+    n, dim = matrix.shape
+    k = min(neighbors, n)
+    if backend == 'faiss':
+        import faiss
+        index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+        index.add(matrix)
+        sims, ids = index.search(matrix, k)
+    else:
+        import hnswlib
+        index = hnswlib.Index(space='ip', dim=dim)
+        index.init_index(max_elements=n, ef_construction=200, M=32)
+        index.add_items(matrix, np.arange(n))
+        index.set_ef(max(2 * k, 64))
+        ids, distances = index.knn_query(matrix, k=k)
+        sims = 1 - distances
+
+    rows = np.repeat(np.arange(n), k)
+    ids, sims = ids.reshape(-1), sims.reshape(-1)
+    keep = (ids >= 0) & (sims >= threshold) & (rows != ids)
+    rows, ids = rows[keep], ids[keep]
+    edges = np.unique(np.minimum(rows, ids) * n + np.maximum(rows, ids))
+    return edges // n, edges % n
+
+def global_deduplicate(triplets, embeddings, threshold=SIMILARITY_THRESHOLD, backend=GLOBAL_DEDUP_BACKEND):
+    """
+    Clusters near-duplicate questions across the whole dataset and keeps the best-scoring entry per cluster.
+
+    Candidate pairs come from an approximate index, so work grows with bucket or neighbour sizes rather
+    than with the square of the dataset; every candidate is checked against the exact cosine threshold.
+    """
+    if len(triplets) < 2:
+        return list(triplets)
+
+    matrix = normalize(embeddings)
+    if backend == 'lsh':
+        rows, cols = lsh_pairs(matrix, threshold)
+    else:
+        rows, cols = knn_pairs(matrix, threshold, backend)
+
+    res = []
+    for indices in group_clusters(connected_components(len(matrix), rows, cols)):
+        best = max(indices, key=lambda i: entry_score(triplets[i]))
+        res.append(triplets[best])
+    return res
@@ -1,68 +1,221 @@
 import os
 import json
 from collections import defaultdict
+from multiprocessing import Pool
+from Common.tracing import span
+from Common.utils import chunk_hash
+from .config import (EMBEDDING_MODEL, QUESTION_THRESHOLD, ANSWER_THRESHOLD, QUESTION_WEIGHTS,
+                     ANSWER_WEIGHTS, GLOBAL_FILTER_WORKERS)
+from .embedding_cache import embed_texts, get_embedding_cache, get_embedding_model
+from .global_dedup import global_deduplicate
 
 # Define question types
 question_types = ['Yes/No', 'Yes/No cond', 'Legal Obligation', 'Factual', 'Descriptive']
-RELEVANCE_THRESHOLD = 7
 
-def global_threshold_relevance(input_folder, output_path):
+def cleaned_type(qtype):
+    return qtype.replace('/', '-').replace(' ', '-')
+
+def weighted_score(triplet, weights):
+    """
+    Weighted mean of the given score fields. With equal integer weights this is exactly the plain mean.
+    """
+    total = sum(weight * triplet.get(field, 0) for field, weight in weights.items())
+    return total / sum(weights.values())
+
+def passes_thresholds(triplet, thresholds=None, weights=None):
+    """
+    True when both the question scores and the answer scores reach their thresholds.
+    """
+    question_threshold, answer_threshold = thresholds or (QUESTION_THRESHOLD, ANSWER_THRESHOLD)
+    question_weights, answer_weights = weights or (QUESTION_WEIGHTS, ANSWER_WEIGHTS)
+    return (weighted_score(triplet, question_weights) >= question_threshold
+            and weighted_score(triplet, answer_weights) >= answer_threshold)
+
+def filtered_entry(triplet, doc_id):
+    return {
+        "document_id": doc_id,
+        "question": triplet['question'],
+        "answer": triplet['answer'],
+        "context": triplet['context'],
+        "conditions": triplet['conditions'],
+        "relevance": triplet['relevance'],
+        "accuracy": triplet['accuracy'],
+        "completeness": triplet['completeness'],
+        "groundedness": triplet.get('groundedness', 0),
+        "intent_score": triplet['intent'],
+        "model": triplet['model']
+    }
+
+def filter_file(filepath, thresholds=None, weights=None):
+    """
+    Parses one evaluated file and applies the thresholds.
+    Returns (entries, chunks, error): entries are (question_type, entry) pairs that reference their
+    chunk by `chunk_id`, and chunks maps each referenced id to its text.
+    """
+    try:
+        with open(filepath, 'r') as f:
+            blocks = json.load(f)
+    except Exception as e:
+        return [], {}, f"Error loading {filepath}: {e}"
+
+    doc_id = os.path.basename(os.path.dirname(filepath))
+    entries, chunks = [], {}
+    for block in blocks:
+        chunk = block['chunk']
+        chunk_id = block.get('chunk_id') or chunk_hash(chunk)
+        for triplet in block['result']:
+            if passes_thresholds(triplet, thresholds, weights):
+                entry = filtered_entry(triplet, doc_id)
+                entry['chunk_id'] = chunk_id
+                entries.append((block['question_type'], entry))
+                chunks[chunk_id] = chunk
+    return entries, chunks, None
+
+def evaluated_files(input_folder, ordered=False):
+    """
+    Yields the evaluated JSON files under input_folder in os.walk order, or sorted by path with `ordered`.
+    """
+    for root, dirs, files in os.walk(input_folder):
+        if ordered:
+            dirs.sort()
+            files = sorted(files)
+        for file in files:
+            if file.endswith('.json'):
+                yield os.path.join(root, file)
+
+def deduplicate_globally(type_to_triplets):
+    """
+    Removes near-duplicate questions across documents within each question type.
+    """
+    embed_model = get_embedding_model(EMBEDDING_MODEL)
+    cache = get_embedding_cache(EMBEDDING_MODEL)
+    for qtype, triplets in type_to_triplets.items():
+        embeddings = embed_texts([triplet['question'] for triplet in triplets], embed_model, cache)
+        type_to_triplets[qtype] = global_deduplicate(triplets, embeddings)
+        print(f"{qtype}: kept {len(type_to_triplets[qtype])} of {len(triplets)} after global dedup")
+
+def global_threshold_relevance(input_folder, output_path, dedup=False, thresholds=None, weights=None):
     type_to_triplets = defaultdict(list)
     print(len(os.listdir(input_folder)))
     
     # Walk through all files in all subfolders
-    for root, _, files in os.walk(input_folder):
-        for file in files:
-            if not file.endswith('.json'):
-                continue
-
-            filepath = os.path.join(root, file)
-            with open(filepath, 'r') as f:
-                try:
-                    blocks = json.load(f)
-                except Exception as e:
-                    print(f"Error loading {filepath}: {e}")
-                    continue
+    for filepath in evaluated_files(input_folder):
+        entries, chunks, error = filter_file(filepath, thresholds, weights)
+        if error:
+            print(error)
+            continue
+        for qtype, entry in entries:
+            chunk = chunks[entry.pop('chunk_id')]
+            type_to_triplets[qtype].append({"document_id": entry.pop('document_id'), "chunk": chunk, **entry})
 
-            for block in blocks:
-                qtype = block['question_type']
-                doc_id = os.path.basename(root)
-                chunk = block['chunk']
-
-                for triplet in block['result']:
-                    if ((triplet['relevance'] + triplet['intent'])/2) >= RELEVANCE_THRESHOLD and (triplet['accuracy']+triplet['completeness']+triplet['groundedness'])/3 >= RELEVANCE_THRESHOLD :
-                        type_to_triplets[qtype].append({
-                            "document_id": doc_id,
-                            "chunk": chunk,
-                            "question": triplet['question'],
-                            "answer": triplet['answer'],
-                            "context": triplet['context'],
-                            "conditions": triplet['conditions'],
-                            "relevance": triplet['relevance'],
-                            "accuracy": triplet['accuracy'],
-                            "completeness": triplet['completeness'],
-                            "groundedness": triplet.get('groundedness', 0),
-                            "intent_score": triplet['intent'],
-                            "model": triplet['model']
-                        })
+    if dedup:
+        deduplicate_globally(type_to_triplets)
 
     # Save filtered triplets by question type
     os.makedirs(output_path, exist_ok=True)
     for qtype in question_types:
-        cleaned_qtype = qtype.replace('/', '-').replace(' ', '-')
+        cleaned_qtype = cleaned_type(qtype)
         triplets = type_to_triplets[qtype]
         out_file = os.path.join(output_path, f'relevance5_{cleaned_qtype}.json')
-        with open(out_file, 'w') as f:
+        with span('write_json', path=os.path.basename(out_file)), open(out_file, 'w') as f:
             json.dump(triplets, f, indent=2)
 
         print(f"Wrote {len(triplets)} entries to {out_file}")
 
+def _filter_file(args):
+    return filter_file(*args)
+
+def dedup_jsonl(path):
+    """
+    Rewrites one per-question-type JSONL file without its near-duplicate questions.
+    Only the chunk-free entries are loaded, so this stays far smaller than the legacy in-memory path.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        triplets = [json.loads(line) for line in f if line.strip()]
+    if not triplets:
+        return 0, 0
+    embeddings = embed_texts([triplet['question'] for triplet in triplets],
+                             get_embedding_model(EMBEDDING_MODEL), get_embedding_cache(EMBEDDING_MODEL))
+    kept = global_deduplicate(triplets, embeddings)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for triplet in kept:
+            f.write(json.dumps(triplet, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+    return len(kept), len(triplets)
+
+def stream_threshold_relevance(input_folder, output_path, dedup=False, thresholds=None, weights=None,
+                               workers=GLOBAL_FILTER_WORKERS):
+    """
+    Streaming variant of `global_threshold_relevance`. Files are parsed and thresholded in a worker
+    pool and passing entries are appended to `relevance5_{qtype}.jsonl` as each file completes.
+    Entries carry a `chunk_id`; every chunk text is written once to `chunks.jsonl`.
+    Results are consumed in file order so the output is deterministic; memory is bounded by the
+    files in flight plus the set of chunk ids already written.
+    """
+    os.makedirs(output_path, exist_ok=True)
+    handles = {}
+    counts = defaultdict(int)
+    seen_chunks = set()
+    jobs = ((filepath, thresholds, weights) for filepath in evaluated_files(input_folder, ordered=True))
+
+    def handle(qtype):
+        if qtype not in handles:
+            out_file = os.path.join(output_path, f'relevance5_{cleaned_type(qtype)}.jsonl')
+            handles[qtype] = open(out_file, 'w', encoding='utf-8')
+        return handles[qtype]
+
+    for qtype in question_types:
+        handle(qtype)
+    chunks_file = open(os.path.join(output_path, 'chunks.jsonl'), 'w', encoding='utf-8')
+    try:
+        with Pool(workers) as pool:
+            for entries, chunks, error in pool.imap(_filter_file, jobs, chunksize=4):
+                if error:
+                    print(error)
+                    continue
+                for chunk_id, chunk in chunks.items():
+                    if chunk_id not in seen_chunks:
+                        seen_chunks.add(chunk_id)
+                        chunks_file.write(json.dumps({"chunk_id": chunk_id, "chunk": chunk}, ensure_ascii=False) + '\n')
+                for qtype, entry in entries:
+                    handle(qtype).write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    counts[qtype] += 1
+    finally:
+        chunks_file.close()
+        for f in handles.values():
+            f.close()
+
+    for qtype in handles:
+        out_file = handles[qtype].name
+        if dedup:
+            kept, total = dedup_jsonl(out_file)
+            print(f"{qtype}: kept {kept} of {total} after global dedup")
+            counts[qtype] = kept
+        print(f"Wrote {counts[qtype]} entries to {out_file}")
+    print(f"Wrote {len(seen_chunks)} chunks to {chunks_file.name}")
+
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Filter questions by relevance threshold per question type")
     parser.add_argument("input_folder", help="Path to folder with deduplicated outputs")
     parser.add_argument("output_folder", help="Path to folder for filtered output")
+    parser.add_argument("--dedup", action="store_true", help="Remove near-duplicate questions across documents")
+    parser.add_argument("--stream", action="store_true",
+                        help="Parse files in a worker pool and write JSONL with chunks referenced by id")
+    parser.add_argument("--workers", type=int, default=GLOBAL_FILTER_WORKERS, help="Worker processes for --stream")
+    parser.add_argument("--question-threshold", type=float, default=QUESTION_THRESHOLD)
+    parser.add_argument("--answer-threshold", type=float, default=ANSWER_THRESHOLD)
+    parser.add_argument("--question-weights", type=json.loads, default=QUESTION_WEIGHTS,
+                        help='JSON object, e.g. \'{"relevance": 2, "intent": 1}\'')
+    parser.add_argument("--answer-weights", type=json.loads, default=ANSWER_WEIGHTS,
+                        help='JSON object, e.g. \'{"accuracy": 1, "completeness": 1, "groundedness": 1}\'')
 
     args = parser.parse_args()
-    global_threshold_relevance(args.input_folder, args.output_folder)
+    thresholds = (args.question_threshold, args.answer_threshold)
+    weights = (args.question_weights, args.answer_weights)
+    if args.stream:
+        stream_threshold_relevance(args.input_folder, args.output_folder, args.dedup, thresholds, weights, args.workers)
+    else:
+        global_threshold_relevance(args.input_folder, args.output_folder, args.dedup, thresholds, weights)
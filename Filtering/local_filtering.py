@@ -1,16 +1,18 @@
-import sys
 import os
 import json
-import torch
+import time
+from functools import partial
 from collections import defaultdict
-from sentence_transformers import util
-from llama_index.embeddings.ollama import OllamaEmbedding
-from llama_index.core import Settings
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
-
-ollama_embedding = OllamaEmbedding(model_name="llama3")
-Settings.embed_model = ollama_embedding
+from Common.config import JOB_LEDGER_PATH
+from Common.checkpoint import Checkpoint, checkpoint_path
+from Common.job_ledger import JobLedger, run_jobs
+from Common.tracing import span
+from Common.utils import sanitize_filename, write_json_atomic, chunk_hash
+from .config import EMBEDDING_MODEL, LOCAL_FILTER_WORKERS
+from .similarity import similarity_clusters
+from .embedding_cache import embed_texts, get_embedding_cache, get_embedding_model
 
 # Model names (static list)
 MODEL_NAMES = [
@@ -53,7 +55,53 @@ def load_json_file(file_path):
         return json.load(f)
     
 def generate_embeddings(questions):
-    return [ollama_embedding.get_text_embedding(q) for q in questions]
+    with span('generate_embeddings', texts=len(questions)):
+        return embed_texts(questions, get_embedding_model(EMBEDDING_MODEL), get_embedding_cache(EMBEDDING_MODEL))
+
+
+def merge_cluster(triplets, indices):
+    """
+    Combines a cluster of near-duplicate questions into one triplet: the question with the best intent
+    and the answer with the best accuracy/completeness/groundedness composite.
+    """
+    best_question_entry = None
+    best_question_intent = float('-inf')
+
+    best_answer_entry = None
+    best_answer_score = float('-inf')
+
+    for index in indices:
+        entry = triplets[index]
+
+        # 1. Track best question by intent
+        if entry['intent'] > best_question_intent:
+            best_question_intent = entry['intent']
+            best_question_entry = entry
+
+        # 2. Track best answer by composite score
+        answer_score = (
+            0.40 * entry['accuracy'] +
+            0.40 * entry['completeness'] +
+            0.20 * entry['groundedness']
+        )
+        if answer_score > best_answer_score:
+            best_answer_score = answer_score
+            best_answer_entry = entry
+
+    if best_question_entry and best_answer_entry:
+        return {
+            "question": best_question_entry["question"],
+            "answer": best_answer_entry["answer"],
+            "context": best_answer_entry["context"],
+            "conditions" : best_answer_entry["conditions"],
+            "accuracy": best_answer_entry["accuracy"],
+            "completeness": best_answer_entry["completeness"],
+            "groundedness": best_answer_entry["groundedness"],
+            "relevance": best_question_entry["relevance"],
+            "intent": best_question_entry["intent"],
+            "model": best_answer_entry["model"]
+        }
+    return None
 
 
 def deduplicate_utility(data, metadata):
@@ -65,77 +113,13 @@ def deduplicate_utility(data, metadata):
         questions = [item['question'] for item in triplets]
         
         embeddings = generate_embeddings(questions)
-        clusters = defaultdict(list)
-
-        n = len(questions)
-        parent = list(range(n))
-
-        def find(x):
-            if parent[x] != x:
-                parent[x] = find(parent[x])
-            return parent[x]
-
-        def union(x, y):
-            root_x = find(x)
-            root_y = find(y)
-            if root_x != root_y:
-                parent[root_y] = root_x
-        
-        for i in range(n):
-            for j in range(i+1, n):
-                # try:
-                sim = util.pytorch_cos_sim(
-                torch.tensor(embeddings[i]).unsqueeze(0),
-                torch.tensor(embeddings[j]).unsqueeze(0)
-            ).item()
-
-
-                if sim >= 0.95:
-                    union(i, j)
-        
-        for i in range(n):
-            clusters[find(i)].append(i)
+        clusters = similarity_clusters(embeddings) if questions else []
 
         final_triplets = []
-
-        for indices in clusters.values():
-            best_question_entry = None
-            best_question_intent = float('-inf')
-
-            best_answer_entry = None
-            best_answer_score = float('-inf')
-
-            for index in indices:
-                entry = triplets[index]
-
-                # 1. Track best question by intent
-                if entry['intent'] > best_question_intent:
-                    best_question_intent = entry['intent']
-                    best_question_entry = entry
-
-                # 2. Track best answer by composite score
-                answer_score = (
-                    0.40 * entry['accuracy'] +
-                    0.40 * entry['completeness'] +
-                    0.20 * entry['groundedness']
-                )
-                if answer_score > best_answer_score:
-                    best_answer_score = answer_score
-                    best_answer_entry = entry
-
-            if best_question_entry and best_answer_entry:
-                final_triplets.append({
-                    "question": best_question_entry["question"],
-                    "answer": best_answer_entry["answer"],
-                    "context": best_answer_entry["context"],
-                    "conditions" : best_answer_entry["conditions"],
-                    "accuracy": best_answer_entry["accuracy"],
-                    "completeness": best_answer_entry["completeness"],
-                    "groundedness": best_answer_entry["groundedness"],
-                    "relevance": best_question_entry["relevance"],
-                    "intent": best_question_entry["intent"],
-                    "model": best_answer_entry["model"]
-                })
+        for indices in clusters:
+            merged = merge_cluster(triplets, indices)
+            if merged:
+                final_triplets.append(merged)
 
         meta = metadata[idx]
         res.append({
@@ -150,27 +134,25 @@ def deduplicate_utility(data, metadata):
     return res
 
 
-def deduplicate_questions(files_folder, document_name, question_type, output_folder):
-    qtype = question_type
+def output_file(output_folder, document_name, question_type):
+    return os.path.join(output_folder, document_name, f'{document_name}_{question_type}.json')
 
-    # Prepare output path
-    document_output_folder = os.path.join(output_folder, document_name)
-    os.makedirs(document_output_folder, exist_ok=True)
-
-    output_file_path = os.path.join(document_output_folder, f'{document_name}_{qtype}.json')
-
-    # Skip if file already exists
-    if os.path.exists(output_file_path):
-        return
+def generated_file(files_folder, document_name, model, question_type):
+    # Generation writes model names with ':' replaced, e.g. gemma3_27b
+    fname = f'{document_name}_{sanitize_filename(model)}_{question_type}_{fewshot_prompts[(model, question_type)]}.json'
+    return os.path.join(files_folder, fname)
 
-    # chunk_key -> list of questions
+def load_triplets(files_folder, document_name, question_type):
+    """
+    Reads the QA pairs of every model for a (document, question type) job, skipping pairs without a
+    question, answer or context. Returns ({chunk: triplets}, {chunk: block metadata}).
+    Works on generated as well as evaluated files; missing scores read as 0.
+    """
     all_chunks_data = defaultdict(list)
     chunk_meta_info = {}
 
     for model in models:
-        fname = f'{document_name}_{model}_{qtype}_{fewshot_prompts[(model, question_type)]}.json'
-        fpath = os.path.join(files_folder, fname)
-
+        fpath = generated_file(files_folder, document_name, model, question_type)
         if not os.path.exists(fpath):
             continue
 
@@ -206,6 +188,62 @@ def deduplicate_questions(files_folder, document_name, question_type, output_fol
                     'document_id': block['document_id']
                 }
 
+    return all_chunks_data, chunk_meta_info
+
+def finished_chunks(files_folder, document_name, question_type):
+    """
+    Returns the ids of the chunks every model has finished generating for: those in its output file,
+    plus those its checkpoint records as answered 'NA'. Chunks whose generation failed, or is still
+    running in another worker, are left out.
+    """
+    finished = None
+    for model in models:
+        fpath = generated_file(files_folder, document_name, model, question_type)
+        if not os.path.exists(fpath):
+            return set()
+        ids = {block.get('chunk_id') or chunk_hash(block['chunk']) for block in load_json_file(fpath)}
+        ids.update(key for key, entry in Checkpoint(checkpoint_path(fpath)).load().items() if entry['status'] == 'NA')
+        finished = ids if finished is None else finished & ids
+    return finished
+
+def near_duplicate_questions(files_folder, document_name, question_type):
+    """
+    Returns {chunk_id: questions} with the questions `deduplicate_questions` will merge with another
+    one. Clusters depend only on the question embeddings, so this can run on the generated files
+    before they are scored. Only chunks in `finished_chunks` are listed, as another model's questions
+    for the others may still change the clusters.
+    """
+    finished = finished_chunks(files_folder, document_name, question_type)
+    duplicates = {}
+    for chunk, triplets in load_triplets(files_folder, document_name, question_type)[0].items():
+        chunk_id = chunk_hash(chunk)
+        if chunk_id not in finished:
+            continue
+        questions = [item['question'] for item in triplets]
+        clusters = similarity_clusters(generate_embeddings(questions)) if len(questions) > 1 else []
+        duplicates[chunk_id] = {questions[index] for indices in clusters if len(indices) > 1 for index in indices}
+    return duplicates
+
+def deduplicate_questions(files_folder, document_name, question_type, output_folder):
+    """
+    Deduplicates one (document, question type) job. Returns the number of questions read,
+    or None when the output already exists.
+    """
+    qtype = question_type
+
+    # Prepare output path
+    document_output_folder = os.path.join(output_folder, document_name)
+    os.makedirs(document_output_folder, exist_ok=True)
+
+    output_file_path = output_file(output_folder, document_name, qtype)
+
+    # Skip if file already exists
+    if os.path.exists(output_file_path):
+        return None
+
+    # chunk_key -> list of questions
+    all_chunks_data, chunk_meta_info = load_triplets(files_folder, document_name, qtype)
+
     # convert chunk_key -> index for consistent output
     chunk_to_index = {chunk: idx for idx, chunk in enumerate(sorted(all_chunks_data))}
     indexed_data = {chunk_to_index[chunk]: triplets for chunk, triplets in all_chunks_data.items()}
@@ -213,13 +251,19 @@ def deduplicate_questions(files_folder, document_name, question_type, output_fol
 
     res = deduplicate_utility(indexed_data, indexed_meta)
 
-    with open(output_file_path, 'w') as f:
-        json.dump(res, f, indent=4)
-
+    # Atomic so an interrupted run never leaves a partial file that resume would skip; escaped as before
+    write_json_atomic(output_file_path, res, indent=4, ensure_ascii=True)
+    return sum(len(triplets) for triplets in all_chunks_data.values())
 
 
+def init_worker():
+    # Each worker owns its embedding client (and its HTTP connection pool)
+    get_embedding_model(EMBEDDING_MODEL)
 
-def main(qa_folder, out_folder, start_index):
+def list_jobs(qa_folder):
+    """
+    Returns the sorted (document, question type) pairs found under qa_folder.
+    """
     files = set()
 
     # Each subfolder is a document folder (name = document ID)
@@ -245,19 +289,77 @@ def main(qa_folder, out_folder, start_index):
            
             files.add((document_dir, question_type))  # document_dir is document_name
     
-    files = sorted(list(files))
-    
-    for document_name, question_type in tqdm(files[start_index:], desc='Files'):
-        deduplicate_questions(
-            os.path.join(qa_folder, document_name),  # Path to the folder containing files
-            document_name,
-            question_type,
-            out_folder
-        )
+    return sorted(list(files))
+
+
+def ledger_job(qa_folder, out_folder, document_name, question_type):
+    deduplicate_questions(os.path.join(qa_folder, document_name), document_name, question_type, out_folder)
+
+def ledger_worker(ledger, qa_folder, out_folder):
+    init_worker()
+    return JobLedger(ledger).run('local_filter', partial(ledger_job, qa_folder, out_folder))
+
+def main(qa_folder, out_folder, start_index, workers=LOCAL_FILTER_WORKERS, ledger=JOB_LEDGER_PATH):
+    files = list_jobs(qa_folder)[start_index:]
+
+    if ledger:
+        # Every worker process of every cooperating command leases jobs from the shared ledger
+        jobs = [(f'{document_name}/{question_type}', {'document_name': document_name, 'question_type': question_type})
+                for document_name, question_type in files]
+        if workers <= 1:
+            run_jobs(ledger, 'local_filter', jobs, partial(ledger_job, qa_folder, out_folder))
+            return
+        JobLedger(ledger).add('local_filter', jobs)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            finished = sum(executor.map(ledger_worker, [ledger] * workers, [qa_folder] * workers, [out_folder] * workers))
+        print(f'local_filter: {workers} workers finished {finished} jobs')
+        JobLedger(ledger).print_status('local_filter')
+        return
+
+    # Resume: jobs with an output are done (outputs are written atomically)
+    pending = [job for job in files if not os.path.exists(output_file(out_folder, *job))]
+    print(f"{len(files) - len(pending)} of {len(files)} jobs already done")
+
+    progress = tqdm(total=len(pending), desc='Files')
+    questions = 0
+    start = time.perf_counter()
+
+    def update(count):
+        nonlocal questions
+        questions += count or 0
+        elapsed = time.perf_counter() - start
+        progress.set_postfix(questions_per_s=f'{questions / elapsed:.1f}', jobs_per_s=f'{(progress.n + 1) / elapsed:.2f}')
+        progress.update(1)
+
+    if workers <= 1:
+        for document_name, question_type in pending:
+            update(deduplicate_questions(
+                os.path.join(qa_folder, document_name),  # Path to the folder containing files
+                document_name,
+                question_type,
+                out_folder
+            ))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+            futures = [executor.submit(deduplicate_questions, os.path.join(qa_folder, document_name),
+                                       document_name, question_type, out_folder)
+                       for document_name, question_type in pending]
+            for future in as_completed(futures):
+                update(future.result())
+    progress.close()
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print('Usage: python main.py <qa_folder> <output_folder> <start_index>')
-    else:
-        main(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Remove near-duplicate questions within each document and question type")
+    parser.add_argument("qa_folder", help="Path to folder with evaluated QA pairs")
+    parser.add_argument("output_folder", help="Path to folder for deduplicated output")
+    parser.add_argument("start_index", type=int, nargs='?', default=0, help="Index of the first job to process")
+    parser.add_argument("--workers", type=int, default=LOCAL_FILTER_WORKERS,
+                        help="Worker processes, each with its own embedding client (1 runs serially)")
+    parser.add_argument("--ledger", default=JOB_LEDGER_PATH,
+                        help="Job ledger shared by cooperating workers, e.g. this command started on several machines")
+
+    args = parser.parse_args()
+    main(args.qa_folder, args.output_folder, args.start_index, args.workers, args.ledger)
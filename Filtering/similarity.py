@@ -0,0 +1,69 @@
+import numpy as np
+from .config import SIMILARITY_THRESHOLD, SIMILARITY_BLOCK_SIZE
+
+def normalize(embeddings):
+    """
+    Stacks embeddings into a float32 matrix of unit-length rows.
+    """
+    matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+def similar_pairs(matrix, threshold=SIMILARITY_THRESHOLD, block_size=SIMILARITY_BLOCK_SIZE):
+    """
+    Returns (rows, cols) with rows < cols for every pair of unit vectors whose cosine similarity is at least
+    `threshold`, computing the similarity matrix one block of rows at a time.
+    """
+    n = len(matrix)
+    rows, cols = [], []
+    for start in range(0, n, block_size):
+        sims = matrix[start:start + block_size] @ matrix[start:].T
+        r, c = np.nonzero(sims >= threshold)
+        r += start
+        c += start
+        upper = r < c
+        rows.append(r[upper])
+        cols.append(c[upper])
+    if not rows:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    return np.concatenate(rows), np.concatenate(cols)
+
+def connected_components(n, rows, cols):
+    """
+    Labels each node with the smallest index in its connected component.
+
+    Uses min-label propagation over the edge arrays with pointer jumping, so each round is a few
+    vectorized passes instead of a Python-level union per pair.
+    """
+    labels = np.arange(n)
+    if len(rows) == 0:
+        return labels
+    while True:
+        edge_min = np.minimum(labels[rows], labels[cols])
+        updated = labels.copy()
+        np.minimum.at(updated, rows, edge_min)
+        np.minimum.at(updated, cols, edge_min)
+        while True:
+            jumped = updated[updated]
+            if np.array_equal(jumped, updated):
+                break
+            updated = jumped
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+def group_clusters(labels):
+    """
+    Returns clusters as lists of indices, ordered by their smallest index with members ascending.
+    """
+    order = np.argsort(labels, kind='stable')
+    boundaries = np.flatnonzero(np.diff(labels[order])) + 1
+    return [group.tolist() for group in np.split(order, boundaries)] if len(order) else []
+
+def similarity_clusters(embeddings, threshold=SIMILARITY_THRESHOLD, block_size=SIMILARITY_BLOCK_SIZE):
+    """
+    Groups embeddings whose cosine similarity chains at or above `threshold` into clusters.
+    """
+    matrix = normalize(embeddings)
+    rows, cols = similar_pairs(matrix, threshold, block_size)
+    return group_clusters(connected_components(len(matrix), rows, cols))
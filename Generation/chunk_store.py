@@ -0,0 +1,152 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+from collections.abc import Sequence
+from .chunking import chunk_markdown, chunk_markdown_tokens
+from .chunk_stream import iter_chunks, read_chunk
+from .config import (CHUNK_SIZE, CHUNK_OVERLAP, MAX_CHUNK_LIMIT, CHUNK_CACHE_SIZE, CHUNK_CACHE_DIR,
+                     CHUNKING_MODE, CHUNK_OVERLAP_TOKENS, TOKENIZER, TOKEN_ESTIMATE_SCALE, CHUNK_STREAM_MIN_BYTES)
+from .tokens import chunk_token_budget
+from Common.utils import chunk_hash
+
+class StreamedChunks(Sequence):
+    """
+    (chunk_id, chunk) pairs of a streamed file held as byte spans; each chunk is read back from the
+    file with `read_chunk` when it is accessed.
+    """
+    def __init__(self, markdown_file, spans):
+        self.markdown_file = markdown_file
+        self.spans = spans  # (chunk_id, byte_start, byte_end, window)
+        self.ids = [span[0] for span in spans]
+
+    def __len__(self):
+        return len(self.spans)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return StreamedChunks(self.markdown_file, self.spans[index])
+        chunk_id, start, end, window = self.spans[index]
+        return chunk_id, read_chunk(self.markdown_file, start, end, window)
+
+class ChunkStore:
+    """
+    Caches the chunks of each markdown file so a document is chunked once per run instead of once per job.
+
+    Entries are keyed by file path, modification time and chunking parameters, held in an in-process
+    LRU and optionally persisted as JSON files under `cache_dir`. In 'tokens' mode the parameters are
+    the token budget and tokenizer settings instead of the character sizes.
+
+    In 'chars' mode files of at least `stream_min_bytes` are chunked by the streaming chunker, which
+    gives the same chunks without reading the whole file. Only their byte spans are kept, in memory
+    and on disk, and they are returned as StreamedChunks that read each chunk when it is used.
+    """
+    def __init__(self, max_entries=CHUNK_CACHE_SIZE, cache_dir=CHUNK_CACHE_DIR,
+                 chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP, max_chunk_limit=MAX_CHUNK_LIMIT,
+                 mode=CHUNKING_MODE, overlap_tokens=CHUNK_OVERLAP_TOKENS, stream_min_bytes=CHUNK_STREAM_MIN_BYTES):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.stream_min_bytes = stream_min_bytes
+        self.overlap_tokens = overlap_tokens
+        self.params = (chunk_size, overlap, max_chunk_limit) if mode == 'chars' else None
+        self.entries = OrderedDict()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, markdown_file):
+        if self.params is None:
+            # The budget depends on the prompt overhead, so it is computed on first use
+            self.params = ('tokens', chunk_token_budget(), self.overlap_tokens, TOKENIZER, TOKEN_ESTIMATE_SCALE)
+        path = os.path.abspath(markdown_file)
+        return (path, os.stat(path).st_mtime_ns) + self.params
+
+    def disk_path(self, key):
+        digest = hashlib.sha1(json.dumps(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.json')
+
+    def streams(self, markdown_file):
+        if self.mode != 'chars' or self.stream_min_bytes is None:
+            return False
+        chunk_size, _, max_chunk_limit = self.params
+        # iter_chunks only reproduces chunk_markdown when merged sections never need windows
+        return chunk_size < max_chunk_limit and os.path.getsize(markdown_file) >= self.stream_min_bytes
+
+    def load(self, key):
+        if not self.cache_dir:
+            return None
+        path = self.disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if tuple(data['key']) != key:
+            return None
+        if 'spans' in data:
+            # key[0] is the path; its mtime in the key guarantees the spans still match the file
+            return StreamedChunks(key[0], [tuple(span) for span in data['spans']])
+        return [tuple(item) for item in data['chunks']]
+
+    def save(self, key, chunks):
+        if not self.cache_dir:
+            return
+        path = self.disk_path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        if isinstance(chunks, StreamedChunks):
+            data = {'key': list(key), 'spans': [list(span) for span in chunks.spans]}
+        else:
+            data = {'key': list(key), 'chunks': chunks}
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def chunk(self, markdown_file):
+        if self.mode == 'tokens':
+            _, budget, overlap, _, _ = self.params
+            return chunk_markdown_tokens(markdown_file, budget, overlap)
+        chunk_size, overlap, max_chunk_limit = self.params
+        return chunk_markdown(markdown_file, chunk_size, overlap, max_chunk_limit)
+
+    def get(self, markdown_file):
+        """
+        Returns the (chunk_id, chunk) pairs of a markdown file, as StreamedChunks for streamed files.
+        """
+        key = self.key(markdown_file)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        chunks = self.load(key)
+        if chunks is None and self.streams(markdown_file):
+            chunk_size, overlap, max_chunk_limit = self.params
+            spans = [(chunk_hash(chunk), byte_start, byte_end, window) for chunk, byte_start, byte_end, window
+                     in iter_chunks(markdown_file, chunk_size, overlap, max_chunk_limit)]
+            chunks = StreamedChunks(key[0], spans)
+            self.save(key, chunks)
+        elif chunks is None:
+            chunks = [(chunk_hash(chunk), chunk) for chunk in self.chunk(markdown_file)]
+            self.save(key, chunks)
+
+        self.entries[key] = chunks
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return chunks
+
+chunk_store = ChunkStore()
+
+def get_chunks(markdown_file):
+    """
+    Returns the cached (chunk_id, chunk) pairs of a markdown file from the shared store.
+    """
+    return chunk_store.get(markdown_file)
+
+def chunk_ids(chunks):
+    """
+    Returns the ids of chunks returned by `get_chunks` without reading streamed chunks back.
+    """
+    if isinstance(chunks, StreamedChunks):
+        return chunks.ids
+    return [chunk_id for chunk_id, _ in chunks]
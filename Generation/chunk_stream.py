@@ -0,0 +1,185 @@
+import re
+from bisect import bisect_right
+from .chunking import IMAGE_PATTERN, markdown_sections
+
+NEWLINE_PATTERN = re.compile(rb'\r\n|\r|\n')
+
+def logical_lines(f):
+    """
+    Yields (content, byte_start, newline_length) for each line of a binary file, splitting on
+    '\\r\\n', '\\r' and '\\n' like text mode does. newline_length is 0 for a final unterminated line.
+    """
+    offset = 0
+    for raw in f:
+        pos = 0
+        for match in NEWLINE_PATTERN.finditer(raw):
+            yield raw[pos:match.start()], offset + pos, match.end() - match.start()
+            pos = match.end()
+        if pos < len(raw):
+            yield raw[pos:], offset + pos, 0
+        offset += len(raw)
+
+def is_header(line):
+    """
+    Matches the section split of chunk_markdown: optional whitespace, '#', then whitespace.
+    """
+    stripped = line.lstrip()
+    return len(stripped) > 1 and stripped[0] == '#' and stripped[1].isspace()
+
+class Section:
+    """
+    Text of one header section with leading whitespace dropped, kept as segments that map each
+    character back to its byte offset in the file.
+
+    Each segment is a run of unmodified file text, or a translated newline whose raw form
+    ('\\r\\n', '\\r' or '\\n') is `raw_length` bytes long. `confirmed` is the length up to the last
+    non-whitespace character, i.e. the length of the stripped section so far.
+    """
+    def __init__(self):
+        self.starts = []  # character offset of each segment
+        self.segments = []  # (text, byte_start, raw_length or None)
+        self.length = 0
+        self.confirmed = 0
+
+    def add(self, text, byte_start, raw_length=None):
+        if not self.length:
+            stripped = text.lstrip()
+            if not stripped:
+                return
+            byte_start += len(text[:len(text) - len(stripped)].encode('utf-8'))
+            text = stripped
+        self.starts.append(self.length)
+        self.segments.append((text, byte_start, raw_length))
+        if not text.isspace():
+            self.confirmed = self.length + len(text.rstrip())
+        self.length += len(text)
+
+    def segment(self, pos):
+        index = bisect_right(self.starts, pos) - 1
+        return self.starts[index], self.segments[index]
+
+    def byte_start(self, pos):
+        start, (text, byte_start, raw_length) = self.segment(pos)
+        if raw_length is not None:
+            return byte_start
+        return byte_start + len(text[:pos - start].encode('utf-8'))
+
+    def byte_end(self, pos):
+        start, (text, byte_start, raw_length) = self.segment(pos - 1)
+        if raw_length is not None:
+            return byte_start + raw_length
+        return byte_start + len(text[:pos - start].encode('utf-8'))
+
+    def text(self, start, end):
+        first = bisect_right(self.starts, start) - 1
+        last = bisect_right(self.starts, end - 1)
+        joined = ''.join(text for text, _, _ in self.segments[first:last])
+        offset = self.starts[first]
+        return joined[start - offset:end - offset]
+
+    def prune(self, pos):
+        """
+        Drops segments that end before `pos`.
+        """
+        index = bisect_right(self.starts, pos) - 1
+        if index > 0:
+            del self.starts[:index]
+            del self.segments[:index]
+
+def iter_chunks(markdown_file, chunk_size=4096, overlap=512, max_chunk_limit=8192):
+    """
+    Streaming counterpart of chunk_markdown. Reads the file line by line and yields
+    (chunk, byte_start, byte_end, window) with the same chunks, in the same order.
+
+    A chunk is either a run of merged sections (window False) or a character window of a section
+    longer than max_chunk_limit (window True); read_chunk rebuilds it from its byte span.
+    Memory is bounded by max_chunk_limit plus one line, whatever the file size.
+    """
+    if chunk_size >= max_chunk_limit:
+        # Merged sections can reach chunk_size + 1 characters, so only single sections may need windows
+        raise ValueError('iter_chunks needs chunk_size < max_chunk_limit; use chunk_markdown instead')
+    step = chunk_size - overlap
+
+    buffer, buffer_start, buffer_end = "", None, None
+    after_window = False  # the previous buffer was a long section whose windows were already yielded
+    section, next_window = Section(), None
+
+    def window(start, end):
+        return (section.text(start, end), section.byte_start(start), section.byte_end(end), True)
+
+    def close_section():
+        """
+        Returns the chunks completed by the end of the current section.
+        """
+        nonlocal buffer, buffer_start, buffer_end, after_window
+        chunks = []
+        if next_window is not None:
+            start = next_window
+            while start < section.confirmed:
+                chunks.append(window(start, min(start + chunk_size, section.confirmed)))
+                start += step
+            buffer, after_window = "", True
+        elif section.confirmed:
+            text = section.text(0, section.confirmed)
+            start, end = section.byte_start(0), section.byte_end(section.confirmed)
+            if after_window:
+                buffer, buffer_start, buffer_end, after_window = text, start, end, False
+            elif len(buffer) + len(text) < chunk_size:
+                buffer += "\n\n" + text
+                buffer_start = start if buffer_start is None else buffer_start
+                buffer_end = end
+            else:
+                if buffer:
+                    chunks.append((buffer.strip(), buffer_start, buffer_end, False))
+                buffer, buffer_start, buffer_end = text, start, end
+        return chunks
+
+    with open(markdown_file, 'rb') as f:
+        for content, byte_start, newline_length in logical_lines(f):
+            line = content.decode('utf-8')
+            pieces, pos = [], 0
+            for match in IMAGE_PATTERN.finditer(line):  # Remove images
+                pieces.append((line[pos:match.start()], byte_start + len(line[:pos].encode('utf-8'))))
+                pos = match.end()
+            pieces.append((line[pos:], byte_start + len(line[:pos].encode('utf-8'))))
+
+            cleaned = ''.join(piece for piece, _ in pieces) + ('\n' if newline_length else '')
+            if is_header(cleaned):
+                yield from close_section()
+                section, next_window = Section(), None
+
+            for piece, piece_start in pieces:
+                if piece:
+                    section.add(piece, piece_start)
+            if newline_length:
+                section.add('\n', byte_start + len(content), newline_length)
+
+            if next_window is None and section.confirmed > max_chunk_limit and section.confirmed >= chunk_size:
+                # Too long to merge with anything: flush the buffer and window the section as it streams in
+                if buffer and not after_window:
+                    yield (buffer.strip(), buffer_start, buffer_end, False)
+                buffer, buffer_start, buffer_end = "", None, None
+                next_window = 0
+            if next_window is not None:
+                while next_window + chunk_size <= section.confirmed:
+                    yield window(next_window, next_window + chunk_size)
+                    next_window += step
+                section.prune(next_window)
+
+    yield from close_section()
+    if buffer and not after_window:
+        yield (buffer.strip(), buffer_start, buffer_end, False)
+
+def read_chunk(markdown_file, byte_start, byte_end, window=False):
+    """
+    Rebuilds a chunk yielded by iter_chunks from its byte span.
+    """
+    with open(markdown_file, 'rb') as f:
+        f.seek(byte_start)
+        raw = f.read(byte_end - byte_start)
+        # A span can end on a bare '#'; whether that starts a section depends on the character after it
+        following = f.read(4).decode('utf-8', errors='ignore')[:1]
+    text = raw.decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+    if window:
+        return IMAGE_PATTERN.sub("", text)
+    return "\n\n".join(markdown_sections(text + following))
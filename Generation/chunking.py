@@ -1,4 +1,11 @@
 import re
+from Common.tracing import traced
+from .tokens import count_tokens
+
+IMAGE_PATTERN = re.compile(r"!\[.*?\]\(.*?\)")
+HEADER_PATTERN = re.compile(r'(?=^(?:\s*)#\s)', re.MULTILINE)
+PARAGRAPH_PATTERN = re.compile(r'\n\s*\n')
+TABLE_RULE_PATTERN = re.compile(r'^\s*\|?\s*:?-{3,}')
 
 def split_large_chunk(text, max_chunk_size=4096, overlap=512):
     """
@@ -12,18 +19,23 @@ def split_large_chunk(text, max_chunk_size=4096, overlap=512):
         start += (max_chunk_size - overlap)
     return chunks
 
-def chunk_markdown(markdown_file, chunk_size=4096):
+def markdown_sections(markdown_text):
+    """
+    Removes images and splits markdown text into stripped, non-empty header sections.
+    """
+    markdown_text = IMAGE_PATTERN.sub("", markdown_text)  # Remove images
+    sections = HEADER_PATTERN.split(markdown_text)
+    return [section.strip() for section in sections if section.strip()]
+
+@traced('chunk_markdown')
+def chunk_markdown(markdown_file, chunk_size=4096, overlap=512, max_chunk_limit=8192):
     """
     Reads a markdown file and splits it into manageable chunks based on headers and max size.
     """
     with open(markdown_file, encoding='utf-8') as f:
         markdown_text = f.read()
 
-    markdown_text = re.sub(r"!\[.*?\]\(.*?\)", "", markdown_text)  # Remove images
-
-    pattern = re.compile(r'(?=^(?:\s*)#\s)', re.MULTILINE)
-    sections = pattern.split(markdown_text)
-    sections = [section.strip() for section in sections if section.strip()]
+    sections = markdown_sections(markdown_text)
 
     merged = []
     buffer = ""
@@ -41,10 +53,92 @@ def chunk_markdown(markdown_file, chunk_size=4096):
 
     final_chunks = []
     for chunk in merged:
-        if len(chunk) > 8192:
-            split_chunks = split_large_chunk(chunk, max_chunk_size=4096, overlap=512)
+        if len(chunk) > max_chunk_limit:
+            split_chunks = split_large_chunk(chunk, max_chunk_size=chunk_size, overlap=overlap)
             final_chunks.extend(split_chunks)
         else:
             final_chunks.append(chunk)
 
     return final_chunks
+
+def token_windows(text, budget, overlap):
+    """
+    Splits text into overlapping character windows of at most `budget` tokens each.
+    """
+    window = max(1, len(text) * budget // count_tokens(text))
+    while True:
+        windows = split_large_chunk(text, max_chunk_size=window, overlap=window * overlap // budget)
+        if window == 1 or all(count_tokens(w) <= budget for w in windows):
+            return windows
+        window = max(1, window * 9 // 10)
+
+def split_table(table, budget, overlap):
+    """
+    Splits a markdown table on row boundaries, repeating its header rows in every piece.
+    """
+    lines = table.split('\n')
+    header = lines[:2] if len(lines) > 2 and TABLE_RULE_PATTERN.match(lines[1]) else []
+    rows = lines[len(header):]
+    header_tokens = count_tokens('\n'.join(header)) + 1 if header else 0
+
+    pieces, buffer, size = [], [], header_tokens
+    for row in rows:
+        tokens = count_tokens(row) + 1
+        if header_tokens + tokens > budget:
+            if buffer:
+                pieces.append('\n'.join(header + buffer))
+                buffer, size = [], header_tokens
+            pieces.extend(token_windows(row, budget, overlap))
+            continue
+        if buffer and size + tokens > budget:
+            pieces.append('\n'.join(header + buffer))
+            buffer, size = [], header_tokens
+        buffer.append(row)
+        size += tokens
+    if buffer:
+        pieces.append('\n'.join(header + buffer))
+    return pieces
+
+def token_units(section, budget, overlap):
+    """
+    Breaks a section into pieces of at most `budget` tokens: the whole section if it fits,
+    otherwise its paragraphs, table rows, and finally character windows.
+    """
+    if count_tokens(section) <= budget:
+        return [section]
+    units = []
+    for paragraph in PARAGRAPH_PATTERN.split(section):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if count_tokens(paragraph) <= budget:
+            units.append(paragraph)
+        elif paragraph.lstrip().startswith('|'):
+            units.extend(split_table(paragraph, budget, overlap))
+        else:
+            units.extend(token_windows(paragraph, budget, overlap))
+    return units
+
+@traced('chunk_markdown')
+def chunk_markdown_tokens(markdown_file, budget, overlap=128):
+    """
+    Token-budgeted counterpart of chunk_markdown: splits on headers, then paragraphs, table rows
+    and character windows as needed, and packs consecutive pieces into chunks of at most `budget` tokens.
+    """
+    with open(markdown_file, encoding='utf-8') as f:
+        markdown_text = f.read()
+
+    chunks, buffer, size = [], [], 0
+    for section in markdown_sections(markdown_text):
+        for unit in token_units(section, budget, overlap):
+            tokens = count_tokens(unit)
+            # '\n\n' joins cost about one token
+            if buffer and size + 1 + tokens > budget:
+                chunks.append('\n\n'.join(buffer))
+                buffer, size = [], 0
+            size += tokens + (1 if buffer else 0)
+            buffer.append(unit)
+
+    if buffer:
+        chunks.append('\n\n'.join(buffer))
+    return chunks
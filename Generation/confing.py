@@ -1,16 +1,26 @@
-import pandas as pd
-
 # Data files
 FINAL_DF_PATH = './data/final_df.json'
 CONTEXT_CSV_PATH = './data/context.csv'
 
-# Load metadata
-final_df = pd.read_json(FINAL_DF_PATH)
-context_df = pd.read_csv(CONTEXT_CSV_PATH)
+def __getattr__(name):
+    """
+    Loads the metadata tables and their unique categories on first access instead of at import time.
+    """
+    import pandas as pd
+
+    if name == 'final_df':
+        value = pd.read_json(FINAL_DF_PATH)
+    elif name == 'context_df':
+        value = pd.read_csv(CONTEXT_CSV_PATH)
+    elif name == 'policy_types':
+        value = __getattr__('context_df')['policy_type'].unique()
+    elif name == 'question_types':
+        value = __getattr__('context_df')['question_type'].unique()
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Unique categories
-policy_types = context_df['policy_type'].unique()
-question_types = context_df['question_type'].unique()
+    globals()[name] = value
+    return value
 
 # Constants
 CHUNK_SIZE = 4096
@@ -18,10 +28,43 @@ CHUNK_OVERLAP = 512
 MAX_CHUNK_LIMIT = 8192
 TOKEN_PER_QUESTION = 1024
 
+# Chunking mode: 'chars' keeps the character sizes above, 'tokens' packs chunks to a token budget
+# derived from CONTEXT_TOKENS minus the prompt overhead of return_prompt and the expected response
+CHUNKING_MODE = 'chars'
+TOKENIZER = 'estimate'  # 'estimate' (offline heuristic) or 'tiktoken' (needs the cl100k_base encoding cached locally)
+TOKEN_ESTIMATE_SCALE = 1.0  # calibrate with tokens.calibrate_estimate against the models' tokenizer
+TOKEN_CACHE_SIZE = 65536  # memoized token counts
+CONTEXT_TOKENS = 8192  # context window the prompt and response must fit in
+QUESTION_TOKENS = 256  # chunk tokens per generated question (token mode counterpart of TOKEN_PER_QUESTION)
+RESPONSE_TOKENS_PER_QUESTION = 200  # response tokens reserved per generated question
+METADATA_TOKENS = 64  # headroom for the title, state and sector in the prompt
+CHUNK_OVERLAP_TOKENS = 128  # overlap of the character windows used for oversized paragraphs
+
+# Prompt layout: 'legacy' keeps the original prompt order; 'prefix' puts the shared instructions first, the
+# document metadata and chunk next and the question type, examples and question count last, and sends the
+# question types of a chunk back to back so Ollama can reuse the cached prompt prefix
+PROMPT_LAYOUT = 'legacy'
+
+# Few-shot example sampling: draws are derived from this seed and the chunk, so a re-run builds the same
+# prompts and the LLM response cache answers them; change it for new draws, None samples afresh every
+# run (and generation responses are then never served from the cache)
+EXAMPLE_SEED = 0
+
+# Chunk cache (set CHUNK_CACHE_DIR to persist chunks across runs and worker processes)
+CHUNK_CACHE_SIZE = 256
+CHUNK_CACHE_DIR = None
+# Files at least this large are chunked by chunk_stream.iter_chunks in 'chars' mode (None never streams);
+# their persisted cache entries hold byte spans instead of chunk text
+CHUNK_STREAM_MIN_BYTES = 4 * 1024 ** 2
+
 # Models and question types
 models = ['mixtral', 'gemma3:27b', 'llama3.3', 'yi:34b']
 question_types_list = ['Yes/No', 'Yes/No cond', 'Legal Obligation', 'Factual', 'Descriptive']
 
+# Concurrent scheduler limits
+MAX_IN_FLIGHT = 8
+MODEL_CONCURRENCY = {model: 2 for model in models}
+
 # Few-shot prompt config
 fewshot_prompts = {
     (models[0], question_types_list[0]): 3,
@@ -48,3 +91,4 @@ fewshot_prompts = {
 
 # Document exclusions
 EXCLUDED_FILES = ['']
+END_INDEX = 561  # documents from this index of the sorted files folder on are not processed; None for all
@@ -0,0 +1,58 @@
+import hashlib
+import numpy as np
+from . import config
+
+class ExamplePool:
+    """
+    Few-shot examples pre-grouped by (policy type, question type).
+
+    Ratings are stored as arrays and each row's formatted dict is rendered once, so drawing a block of
+    examples is an index sample, an argsort and a string join. Blocks are not cached: unseeded draws
+    almost never repeat, so a cache of them would only grow.
+    """
+    def __init__(self, context_df, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.groups = {}
+
+        for (policy_type, question_type), group in context_df.groupby(['policy_type', 'question_type'], sort=False):
+            rows = group[['question', 'answer', 'condition', 'context']].to_numpy()
+            ratings = 0.5 * group['q_rating'].to_numpy(dtype=float) + 0.5 * group['a_rating'].to_numpy(dtype=float)
+            formatted = [
+                repr({'question': row[0], 'answer': row[1], 'conditions': row[2], 'context': row[3]})
+                for row in rows
+            ]
+            self.groups[(policy_type, question_type)] = (ratings, formatted)
+
+    def sample(self, cnt, question_type, program_type, seed=None):
+        """
+        Draws `cnt` examples without replacement and returns them formatted, highest rated first.
+        """
+        ratings, formatted = self.groups[(program_type, question_type)]
+        rng = self.rng if seed is None else np.random.default_rng(seed)
+        indices = rng.choice(len(ratings), size=cnt, replace=False)
+        indices = indices[np.argsort(-ratings[indices], kind='stable')]
+        return '[' + ', '.join(formatted[i] for i in indices) + ']'
+
+    def longest(self, cnt, question_type, program_type, length):
+        """
+        Returns the block of the `cnt` examples with the largest `length`, an upper bound on any sampled block.
+        """
+        _, formatted = self.groups[(program_type, question_type)]
+        return '[' + ', '.join(sorted(formatted, key=length, reverse=True)[:cnt]) + ']'
+
+def example_seed(*parts):
+    """
+    Derives a per-prompt seed from EXAMPLE_SEED and the given parts, or None when no seed is configured.
+    """
+    if config.EXAMPLE_SEED is None:
+        return None
+    key = '\x1f'.join(str(part) for part in (config.EXAMPLE_SEED,) + parts)
+    return int.from_bytes(hashlib.sha1(key.encode('utf-8')).digest()[:8], 'big')
+
+example_pool = None
+
+def get_example_pool():
+    global example_pool
+    if example_pool is None:
+        example_pool = ExamplePool(config.context_df, config.EXAMPLE_SEED)
+    return example_pool
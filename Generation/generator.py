@@ -2,62 +2,201 @@ import os
 import json
 import math
 from tqdm import tqdm
-from .chunking import chunk_markdown
-from .config import final_df, TOKEN_PER_QUESTION, EXCLUDED_FILES
+from .chunk_store import get_chunks
+from .config import TOKEN_PER_QUESTION, EXCLUDED_FILES, CHUNKING_MODE
 from .prompts import return_prompt
-from .parser import extract_pairs
+from .examples import example_seed
+from .tokens import question_count
+from .parser import parse_pairs
 from .llm_runner import init_llm, sanitize_filename
+from Common.metadata import policy_metadata
+from Common.llm_calls import complete
+from Common.call_policy import LLMCallError
+from Common.checkpoint import Checkpoint, checkpoint_path
+from Common.job_ledger import check_lease
+from Common.tracing import labels
+from Common.utils import chunk_hash, write_json_atomic
 
-def get_questions(markdown_file, llm, question_type, fewshot_examples, ex_flag, output_file):
-    id = int(markdown_file.split('/')[-1].split('.')[0].split('_')[0])
-    markdown_chunks = chunk_markdown(markdown_file)
-    qa_pairs, error, res = [], [], []
+def document_id(markdown_file):
+    """
+    Returns the numeric policy id encoded in a markdown file name.
+    """
+    return int(markdown_file.split('/')[-1].split('.')[0].split('_')[0])
+
+def document_metadata(id):
+    """
+    Looks up the title, state, program type and sector used in the generation prompt.
+    """
+    record = policy_metadata.get(id, ['name', 'state_name', 'program_category_name', 'sector_name'])
+    if record is None:
+        raise KeyError(f'No metadata found for document id {id}')
+    return tuple(record.values())
 
-    title, state, program_type, sector_type = final_df[final_df['id'] == id][['name', 'state_name', 'program_category_name', 'sector_name']].to_numpy()[0]
-    chunk_to_response = {}
+def output_path(markdown_file, output_folder, model, question_type, fewshot_examples):
+    """
+    Returns the output JSON path for a (file, model, question type) job, or None if the file is excluded.
+    """
+    fName = markdown_file.split('/')[-1].split('.')[0].strip()
+    if fName in EXCLUDED_FILES:
+        return None
+
+    qtype_safe = question_type.replace('/', '-').replace(' ', '-')
+    output_folder = f'{output_folder}/final/qa-gen/{fName}'
+    os.makedirs(output_folder, exist_ok=True)
 
-    if ex_flag:
+    model_safe = sanitize_filename(model)
+    return f'{output_folder}/{fName}_{model_safe}_{qtype_safe}_{fewshot_examples}.json'
+
+def load_responses(output_file):
+    """
+    Opens the checkpoint of an output file and maps each finished chunk id to its response,
+    or to None for chunks the model answered with 'NA'. Empty responses logged by earlier versions
+    are left out so they are asked for again.
+
+    Output files written before checkpointing are migrated into a new checkpoint on first use.
+    """
+    checkpoint = Checkpoint(checkpoint_path(output_file))
+    if not checkpoint.exists() and os.path.exists(output_file):
         with open(output_file, 'r', encoding='utf-8') as f:
             filedata = json.load(f)
-            chunk_to_response = {doc['chunk']: doc['response'] for doc in filedata}
+        for doc in filedata:
+            chunk_id = doc.get('chunk_id') or chunk_hash(doc['chunk'])
+            checkpoint.append(chunk_id, dict(doc, chunk_id=chunk_id))
+        checkpoint.close()
+
+    entries = checkpoint.load()
+    return checkpoint, {key: entry['record']['response'] if entry['status'] == 'ok' else None
+                        for key, entry in entries.items() if entry['status'] != 'empty'}
+
+def build_prompt(markdown_file, chunk, metadata, question_type, fewshot_examples):
+    """
+    Builds the generation prompt for one chunk.
+    """
+    title, state, program_type, sector_type = metadata
+    if 'meta' in markdown_file:
+        num_questions = 5
+    elif CHUNKING_MODE == 'tokens':
+        num_questions = question_count(chunk)
+    else:
+        num_questions = math.ceil(len(chunk) / TOKEN_PER_QUESTION)
+    seed = example_seed(chunk_hash(chunk), question_type, fewshot_examples)
+    return return_prompt(title, state, program_type, sector_type, chunk, question_type, fewshot_examples, num_questions, seed)
+
+def parse_response(response_text, markdown_file, chunk_id):
+    """
+    Parses a model response into QA pair dicts, reporting pairs that could not be parsed.
+    """
+    result = parse_pairs(response_text)
+    if result.malformed:
+        reasons = '; '.join(bad.reason for bad in result.malformed)
+        tqdm.write(f"{markdown_file} chunk {chunk_id}: skipped {len(result.malformed)} malformed QA pairs ({reasons})")
+    return [pair.as_dict() for pair in result.pairs]
+
+def build_record(chunk_id, chunk, response, question_type, id, model):
+    return {'chunk_id': chunk_id, 'chunk': chunk, 'response': response, 'question_type': question_type, 'document_id': id, 'llm': model}
+
+def write_output(output_file, qa_pairs):
+    write_json_atomic(output_file, qa_pairs)
 
-    for chunk in tqdm(markdown_chunks, desc='Processing chunks', leave=False):
-        if chunk in chunk_to_response:
-            response = chunk_to_response[chunk]
-            qa_pairs.append({'chunk': chunk, 'response': response, 'question_type': question_type, 'document_id': id, 'llm': llm.model})
+def generate_response(markdown_file, llm, chunk_id, chunk, metadata, question_type, fewshot_examples, checkpoint):
+    """
+    Generates one chunk's QA pairs and checkpoints the result.
+    Returns (record, error, response_text); record is None when there is nothing to keep.
+    """
+    prompt = build_prompt(markdown_file, chunk, metadata, question_type, fewshot_examples)
+    try:
+        response_text = complete(llm, prompt)
+    except LLMCallError as e:
+        # Not checkpointed, so the next run asks for this chunk again
+        tqdm.write(f'{markdown_file} chunk {chunk_id}: {e.outcome}: {e}')
+        return None, str(e), None
+
+    if response_text == 'NA':
+        checkpoint.append(chunk_id, None, 'NA')
+        return None, None, None
+    response = parse_response(response_text, markdown_file, chunk_id)
+    if response_text: 
+        record = build_record(chunk_id, chunk, response, question_type, document_id(markdown_file), llm.model)
+        checkpoint.append(chunk_id, record)
+        return record, None, response_text
+    # An empty response is an error, not checkpointed, so the next run asks for this chunk again
+    return None, response_text, None
+
+def get_questions(markdown_file, llm, question_type, fewshot_examples, output_file):
+    id = document_id(markdown_file)
+    markdown_chunks = get_chunks(markdown_file)
+    qa_pairs, error, res = [], [], []
+
+    metadata = document_metadata(id)
+    checkpoint, chunk_to_response = load_responses(output_file)
+
+    for chunk_id, chunk in tqdm(markdown_chunks, desc='Processing chunks', leave=False):
+        if chunk_id in chunk_to_response:
+            response = chunk_to_response[chunk_id]
+            if response is not None:
+                qa_pairs.append(build_record(chunk_id, chunk, response, question_type, id, llm.model))
         else:
-            tokens_in_chunk = len(chunk)
-            num_questions = 5 if 'meta' in markdown_file else math.ceil(tokens_in_chunk / TOKEN_PER_QUESTION)
-            prompt = return_prompt(title, state, program_type, sector_type, chunk, question_type, fewshot_examples, num_questions)
-            response = llm.complete(prompt)
-            response_text = response.text if hasattr(response, "text") else str(response)
-
-            if response_text == 'NA': continue
-            response = extract_pairs(response_text)
-            if response_text: 
+            check_lease()
+            record, failure, response_text = generate_response(markdown_file, llm, chunk_id, chunk, metadata,
+                                                               question_type, fewshot_examples, checkpoint)
+            if record is not None:
                 res.append(response_text)
-                qa_pairs.append({'chunk': chunk, 'response': response, 'question_type': question_type, 'document_id': id, 'llm': llm.model})
-            else:
-                error.append(response_text)
+                qa_pairs.append(record)
+            elif failure is not None:
+                error.append(failure)
 
+    checkpoint.close()
     return qa_pairs, error, res
 
 def extract_qa_pairs(markdown_file, output_folder, model, question_type, fewshot_examples):
-    fName = markdown_file.split('/')[-1].split('.')[0].strip()
-    if fName in EXCLUDED_FILES:
+    output_file = output_path(markdown_file, output_folder, model, question_type, fewshot_examples)
+    if output_file is None:
         return None
 
-    llm = init_llm(model)
-    qtype_safe = question_type.replace('/', '-').replace(' ', '-')
-    output_folder = f'{output_folder}/final/qa-gen/{fName}'
-    os.makedirs(output_folder, exist_ok=True)
+    with labels(model=model, question_type=question_type, stage='generation'):
+        llm = init_llm(model)
+        qa_pairs, error, res = get_questions(markdown_file, llm, question_type, fewshot_examples, output_file)
+        write_output(output_file, qa_pairs)
 
-    model_safe = sanitize_filename(model)
-    output_file = f'{output_folder}/{fName}_{model_safe}_{qtype_safe}_{fewshot_examples}.json'
-    ex_flag = os.path.exists(output_file)
+    return qa_pairs, error, res
 
-    qa_pairs, error, res = get_questions(markdown_file, llm, question_type, fewshot_examples, ex_flag, output_file)
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(qa_pairs, f, indent=4, ensure_ascii=False)
+def extract_chunk_major(markdown_file, output_folder, model, question_types):
+    """
+    Same outputs as calling `extract_qa_pairs` for each question type, but walks the chunks in the
+    outer loop so the prompts of one chunk, which share everything up to the task, are sent back to
+    back and Ollama can reuse their cached prefix. `question_types` maps each type to its few-shot count.
+    Returns {question_type: (qa_pairs, error, res)}.
+    """
+    jobs = {}
+    for question_type, fewshot_examples in question_types.items():
+        output_file = output_path(markdown_file, output_folder, model, question_type, fewshot_examples)
+        if output_file is not None:
+            checkpoint, chunk_to_response = load_responses(output_file)
+            jobs[question_type] = (fewshot_examples, output_file, checkpoint, chunk_to_response, ([], [], []))
+    if not jobs:
+        return {}
 
-    return qa_pairs, error, res
+    id = document_id(markdown_file)
+    metadata = document_metadata(id)
+    llm = init_llm(model)
+    for chunk_id, chunk in tqdm(get_chunks(markdown_file), desc='Processing chunks', leave=False):
+        for question_type, (fewshot_examples, _, checkpoint, chunk_to_response, (qa_pairs, error, res)) in jobs.items():
+            if chunk_id in chunk_to_response:
+                response = chunk_to_response[chunk_id]
+                if response is not None:
+                    qa_pairs.append(build_record(chunk_id, chunk, response, question_type, id, model))
+                continue
+            check_lease()
+            with labels(model=model, question_type=question_type, stage='generation'):
+                record, failure, response_text = generate_response(markdown_file, llm, chunk_id, chunk, metadata,
+                                                                   question_type, fewshot_examples, checkpoint)
+            if record is not None:
+                res.append(response_text)
+                qa_pairs.append(record)
+            elif failure is not None:
+                error.append(failure)
+
+    for _, output_file, checkpoint, _, (qa_pairs, _, _) in jobs.values():
+        checkpoint.close()
+        write_output(output_file, qa_pairs)
+    return {question_type: job[4] for question_type, job in jobs.items()}
@@ -1,14 +1,12 @@
-from llama_index.llms.ollama import Ollama
-
-def sanitize_filename(name):
-    """
-    Replaces illegal filename characters with underscores.
-    """
-    import re
-    return re.sub(r'[:<>"/\\|?*]', '_', name)
+from Common.config import CALL_TIMEOUT_MAX
+from Common.llm_clients import get_llm
+from Common.tracing import traced
+from Common.utils import sanitize_filename
 
+@traced('init_llm')
 def init_llm(model_name):
     """
-    Initializes an Ollama LLM with a given model name.
+    Returns the shared Ollama LLM for a given model name. Calls made through Common.llm_calls get
+    adaptive timeouts from the call policy, capped at CALL_TIMEOUT_MAX.
     """
-    return Ollama(model=model_name, request_timeout=12000, verbose=True)
+    return get_llm(model_name, request_timeout=CALL_TIMEOUT_MAX, verbose=True)
@@ -1,29 +1,116 @@
 import os
-import sys
+import asyncio
+import argparse
 from tqdm import tqdm
-from .config import models, question_types_list, fewshot_prompts
-from .generator import extract_qa_pairs
+from . import config
+from functools import partial
+from .config import models, question_types_list, fewshot_prompts, PROMPT_LAYOUT, END_INDEX
+from .generator import extract_qa_pairs, extract_chunk_major
+from .scheduler import run_scheduler
+from .planner import build_plan, order_by_model, report_plan
+from Common.config import JOB_LEDGER_PATH
+from Common.job_ledger import run_jobs, check_lease
 
-def main(files_folder, output_folder, start_index):
+def generate_file(markdown_file, output_folder, model, concurrent=False):
+    """
+    Generates every question type of one (file, model) job. Raises when some chunks failed, so a
+    job ledger retries the job; finished chunks are checkpointed and not asked for again.
+    """
+    if concurrent:
+        errors = asyncio.run(run_scheduler([markdown_file], output_folder, model_names=[model]))
+        check_lease()  # the scheduler stops calling the model once the lease is lost
+        failures = len(errors)
+    elif config.PROMPT_LAYOUT == 'prefix':
+        results = extract_chunk_major(markdown_file, output_folder, model, {q: fewshot_prompts[(model, q)] for q in question_types_list})
+        # Failed calls and empty responses ('' errors) are not checkpointed and are asked for again
+        failures = sum(len(error) for _, error, _ in results.values())
+    else:
+        failures = 0
+        for q in tqdm(question_types_list, desc=f"{os.path.basename(markdown_file)} | {model}", leave=False):
+            result = extract_qa_pairs(markdown_file, output_folder, model, q, fewshot_prompts[(model, q)])
+            if result is not None:
+                failures += len(result[1])
+    if failures:
+        raise RuntimeError(f'{failures} chunks of {markdown_file} failed with {model}')
+
+def main(files_folder, output_folder, start_index, concurrent=False, plan=False, end_index=END_INDEX, ledger=JOB_LEDGER_PATH):
     start_index = int(start_index)
     if not os.path.exists(files_folder):
         print(f'Error: {files_folder} does not exist!')
         return
     os.makedirs(output_folder, exist_ok=True)
 
-    markdown_files = sorted(os.listdir(files_folder))[start_index:561]
+    markdown_files = sorted(os.listdir(files_folder))[start_index:end_index]
     if not markdown_files:
         print(f'No files found in {files_folder}')
         return
 
+    markdown_paths = [os.path.join(files_folder, file) for file in markdown_files]
+
+    if ledger:
+        # Model-major, so cooperating workers keep the same model resident for as long as possible
+        jobs = [(f'{model}|{file}', {'markdown_file': os.path.join(files_folder, file), 'model': model})
+                for model in models for file in markdown_files]
+        run_jobs(ledger, 'generation', jobs, partial(generate_file, output_folder=output_folder, concurrent=concurrent))
+        return
+
+    if plan:
+        jobs = build_plan(markdown_paths, output_folder)
+        planned = order_by_model(jobs)
+        report_plan(jobs, planned)
+
+        if concurrent:
+            for model in models:
+                model_files = sorted({job['markdown_file'] for job in planned if job['model'] == model and job['pending']})
+                if model_files:
+                    errors = asyncio.run(run_scheduler(model_files, output_folder, model_names=[model]))
+                    if errors:
+                        print(f'{len(errors)} {model} chunks failed and will be retried on the next run')
+            return
+
+        pending = [job for job in planned if job['pending']]
+        if config.PROMPT_LAYOUT == 'prefix':
+            # One pass per (model, file), sending the question types of each chunk back to back
+            groups = {}
+            for job in pending:
+                groups.setdefault((job['model'], job['markdown_file']), {})[job['question_type']] = job['fewshot_examples']
+            for (model, markdown_file), question_types in tqdm(groups.items(), desc='Jobs'):
+                extract_chunk_major(markdown_file, output_folder, model, question_types)
+            return
+
+        for job in tqdm(pending, desc='Jobs'):
+            extract_qa_pairs(job['markdown_file'], output_folder, job['model'], job['question_type'], job['fewshot_examples'])
+        return
+
+    if concurrent:
+        errors = asyncio.run(run_scheduler(markdown_paths, output_folder))
+        if errors:
+            print(f'{len(errors)} chunks failed and will be retried on the next run')
+        return
+
     for file in tqdm(markdown_files, desc='Files'):
         markdown_path = os.path.join(files_folder, file)
         for model in tqdm(models, desc='Model', leave=False):
-            for q in tqdm(question_types_list, desc=f"{file} | {model}", leave=False):
-                extract_qa_pairs(markdown_path, output_folder, model, q, fewshot_prompts[(model, q)])
+            try:
+                generate_file(markdown_path, output_folder, model)
+            except RuntimeError as e:
+                tqdm.write(f'{e}; they will be retried on the next run')
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print('Usage: python main.py <files_folder> <output_folder> <start_index>')
-    else:
-        main(sys.argv[1], sys.argv[2], sys.argv[3])
+    parser = argparse.ArgumentParser(description="Generate QA pairs from markdown policy documents")
+    parser.add_argument("files_folder", help="Path to folder with markdown documents")
+    parser.add_argument("output_folder", help="Path to folder for generated QA pairs")
+    parser.add_argument("start_index", type=int, help="Index of the first document to process")
+    parser.add_argument("--end-index", type=int, default=END_INDEX, help="Index after the last document to process")
+    parser.add_argument("--concurrent", action="store_true",
+                        help="Fan out chunk requests with the asyncio scheduler instead of running them one at a time")
+    parser.add_argument("--plan", action="store_true",
+                        help="Plan all jobs up front and run them grouped by model to avoid reloading models")
+    parser.add_argument("--prompt-layout", choices=['legacy', 'prefix'], default=PROMPT_LAYOUT,
+                        help="Order prompts and chunks so consecutive requests share a cached prompt prefix")
+    parser.add_argument("--ledger", default=JOB_LEDGER_PATH,
+                        help="Job ledger shared by cooperating workers; start this command once per worker")
+
+    args = parser.parse_args()
+    config.PROMPT_LAYOUT = args.prompt_layout
+    main(args.files_folder, args.output_folder, args.start_index, args.concurrent, args.plan, args.end_index, args.ledger)
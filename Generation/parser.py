@@ -1,64 +1,147 @@
 import re
-from collections import defaultdict
+from Common.tracing import traced
+
+# One alternation per token kind so a response is cleaned in a single regex pass
+CLEAN_PATTERN = re.compile(
+    r'(?P<space>(?:\s|\\[nrtfv])+)'
+    r'|\\u(?P<u4>[0-9a-fA-F]{4})|\\U(?P<u8>[0-9a-fA-F]{8})|\\x(?P<x2>[0-9a-fA-F]{2})'
+    r'|\\(?P<literal>[%$\\\'"])'
+    r'|(?P<punct>[“”‘’–—])'
+    r'|(?P<dots>\.{2,})'
+)
+PUNCTUATION = {'“': '"', '”': '"', '‘': "'", '’': "'", '–': '-', '—': '-'}
+
+# Bold labels in any case with an optional ':'/'-' inside the bold, and '###' pair separators
+# (the separator stops before '*' so "### 1 **Question**" keeps its label)
+TOKEN_PATTERN = re.compile(
+    r'\*\*[ \t]*(?P<label>(?i:question|answer|conditions|context))[ \t]*[:\-]?[ \t]*\*\*'
+    r'|##(?P<separator>#+[^\n*]*)'
+)
+LEADING_CHARS = ' \t\n\r\f\v-:'
+
+REQUIRED_FIELDS = ('question', 'answer', 'context')
+
+def _clean_token(match):
+    kind = match.lastgroup
+    if kind == 'space':
+        return ' '
+    if kind in ('u4', 'u8', 'x2'):
+        char = chr(int(match.group(kind), 16))
+        return PUNCTUATION.get(char, char)
+    if kind == 'literal':
+        return match.group(kind)
+    if kind == 'punct':
+        return PUNCTUATION[match.group(kind)]
+    return '.'
 
 def clean_unicode_and_markdown(text):
     """
     Cleans unicode artifacts, formatting characters, and unnecessary markdown clutter.
+    Escape sequences are decoded in place, so real (non-escaped) unicode text is left intact.
+    """
+    return CLEAN_PATTERN.sub(_clean_token, text).strip()
+
+class QAPair:
+    """
+    One parsed question/answer pair.
+    """
+    __slots__ = ('question', 'answer', 'conditions', 'context')
+
+    def __init__(self, question, answer, conditions, context):
+        self.question = question
+        self.answer = answer
+        self.conditions = conditions
+        self.context = context
+
+    def as_dict(self):
+        return {
+            'question': self.question,
+            'answer': self.answer,
+            'conditions': self.conditions,
+            'context': self.context
+        }
+
+    def __repr__(self):
+        return f'QAPair({self.question!r})'
+
+class MalformedPair:
+    """
+    A span of the response that looked like a pair but could not be parsed, with the reason.
     """
-    text = re.sub(r'\\%', '__PERCENT__', text)
-    text = re.sub(r'\\$', '__DOLLAR__', text)
-    text = text.encode('utf-8', 'surrogatepass').decode('unicode_escape', errors='ignore')
-    text = text.replace('__PERCENT__', '%').replace('__DOLLAR__', '$')
-    text = re.sub(r'“|”', '"', text)
-    text = re.sub(r'’|‘', "'", text)
-    text = re.sub(r'–|—', '-', text)
-    text = re.sub(r'\.{2,}', '.', text)
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+    __slots__ = ('index', 'reason', 'text')
+
+    def __init__(self, index, reason, text):
+        self.index = index
+        self.reason = reason
+        self.text = text
+
+    def __repr__(self):
+        return f'MalformedPair({self.index}, {self.reason!r})'
+
+class ParseResult:
+    __slots__ = ('pairs', 'malformed')
+
+    def __init__(self):
+        self.pairs = []
+        self.malformed = []
+
+def _field_value(text, start, end):
+    return text[start:end].lstrip(LEADING_CHARS).rstrip()
+
+@traced('parse_pairs')
+def parse_pairs(text):
+    """
+    Parses model output into QAPair records in one pass over its label tokens.
+    A pair runs from a Question label to the next Question label or '###' separator.
+    Pairs missing a question, answer or context, or repeating a label, are reported
+    in `malformed` rather than returned.
+    """
+    result = ParseResult()
+    fields = None  # field -> value of the pair being read; None outside a pair
+    problem = None
+    field, value_start, pair_start = None, 0, 0
+
+    def finish(end):
+        if field is not None:
+            fields[field] = _field_value(text, value_start, end)
+        missing = [name for name in REQUIRED_FIELDS if not fields.get(name)]
+        reason = problem or (f"missing {', '.join(missing)}" if missing else None)
+        if reason:
+            result.malformed.append(MalformedPair(len(result.pairs) + len(result.malformed), reason, text[pair_start:end]))
+        else:
+            result.pairs.append(QAPair(fields['question'], fields['answer'], fields.get('conditions', ''), fields['context']))
+
+    for match in TOKEN_PATTERN.finditer(text):
+        label = match.group('label')
+        if label is None:
+            # '###' closes the current pair
+            if fields is not None:
+                finish(match.start())
+                fields, field = None, None
+            continue
+
+        label = label.lower()
+        if label == 'question':
+            if fields is not None:
+                finish(match.start())
+            fields, problem, field, pair_start = {}, None, label, match.start()
+        elif fields is None:
+            result.malformed.append(MalformedPair(len(result.pairs) + len(result.malformed),
+                                                  f'{label} label outside a pair', match.group()))
+            continue
+        else:
+            fields[field] = _field_value(text, value_start, match.start())
+            if label in fields and problem is None:
+                problem = f'repeated {label} label'
+            field = label
+        value_start = match.end()
+
+    if fields is not None:
+        finish(len(text))
+    return result
 
 def extract_pairs(text):
     """
     Extracts structured QA pairs from a formatted block of model-generated text.
     """
-    def remove_whitespaces(temp): return re.sub(r"^[\s\-:]+", "", temp)
-
-    res = []
-    qString, aString, cString, csString = '**Question**', '**Answer**', '**Context**', '**Conditions**'
-
-    # Normalize variants of QA labels
-    for key in ['question', 'answer', 'context', 'conditions']:
-        for variant in [f"{key}:", f"{key}-", f"{key} -", f"{key.upper()}:", f"{key.upper()}-", f"{key.upper()} -"]:
-            text = text.replace(variant, key.capitalize())
-
-    while text:
-        pairs = defaultdict(str)
-        qStart = text.find(qString)
-        temp = text[qStart + len(qString):]
-        temp = remove_whitespaces(temp)
-
-        aStart = temp.find(aString)
-        q = temp[:aStart]
-        pairs['question'] = q.strip()
-        temp = temp[aStart + len(aString):]
-        temp = remove_whitespaces(temp)
-
-        csStart = temp.find(csString)
-        a = temp[:csStart]
-        pairs['answer'] = a.strip()
-        temp = temp[csStart + len(csString):]
-        temp = remove_whitespaces(temp)
-
-        cStart = temp.find(cString)
-        conditions = temp[:cStart]
-        pairs['conditions'] = conditions.strip()
-        temp = temp[cStart + len(cString):]
-
-        aStart = temp.find('###')
-        c = temp[:aStart]
-        pairs['context'] = c.strip()
-
-        text = temp[aStart:]
-        res.append(pairs)
-        if aStart == -1: break
-
-    return res
+    return [pair.as_dict() for pair in parse_pairs(text).pairs]
@@ -0,0 +1,56 @@
+from .chunk_store import get_chunks, chunk_ids
+from .config import models, question_types_list, fewshot_prompts
+from .generator import output_path, load_responses
+
+def build_plan(markdown_files, output_folder):
+    """
+    Enumerates every (file, model, question type) job in today's file-major order.
+
+    Each job records how many of its chunks are still missing from its output file, using the same
+    chunk matching as `get_questions`, so finished jobs are recognised without calling the LLM.
+    """
+    jobs = []
+    for markdown_file in markdown_files:
+        ids = chunk_ids(get_chunks(markdown_file))
+        for model in models:
+            for q in question_types_list:
+                fewshot_examples = fewshot_prompts[(model, q)]
+                output_file = output_path(markdown_file, output_folder, model, q, fewshot_examples)
+                if output_file is None:
+                    continue
+
+                _, done = load_responses(output_file)
+                jobs.append({
+                    'markdown_file': markdown_file,
+                    'model': model,
+                    'question_type': q,
+                    'fewshot_examples': fewshot_examples,
+                    'output_file': output_file,
+                    'pending': sum(1 for chunk_id in ids if chunk_id not in done)
+                })
+    return jobs
+
+def order_by_model(jobs):
+    """
+    Groups jobs by model so each model stays resident while it drains all of its work.
+    """
+    return sorted(jobs, key=lambda job: models.index(job['model']))
+
+def count_model_loads(jobs):
+    """
+    Counts how many times the model changes between consecutive jobs that still need the LLM.
+    """
+    loads, current = 0, None
+    for job in jobs:
+        if not job['pending']:
+            continue
+        if job['model'] != current:
+            loads += 1
+            current = job['model']
+    return loads
+
+def report_plan(jobs, planned):
+    pending = [job for job in jobs if job['pending']]
+    today, ordered = count_model_loads(jobs), count_model_loads(planned)
+    print(f'{len(jobs)} jobs, {len(pending)} pending ({sum(job["pending"] for job in pending)} chunks)')
+    print(f'Model loads: {today} in file order, {ordered} grouped by model ({today - ordered} saved)')
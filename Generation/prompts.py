@@ -1,34 +1,18 @@
-from .config import context_df, question_types, policy_types
+from . import config
+from .examples import get_example_pool
 
-def return_examples(cnt, question_type, program_type):
+def return_examples(cnt, question_type, program_type, seed=None):
     """
     Samples high-rated examples from the context_df for few-shot learning.
     """
-    temp_df = context_df[
-        (context_df['policy_type'] == program_type) &
-        (context_df['question_type'] == question_type)
-    ].sample(n=cnt)
-
-    temp_df = temp_df[['question', 'answer', 'condition', 'context', 'q_rating', 'a_rating']]
-    temp_df['rating'] = temp_df.apply(lambda row: 0.5 * row['q_rating'] + 0.5 * row['a_rating'], axis=1)
-    temp_df = temp_df.sort_values(by='rating', ascending=False).to_numpy()
-
-    data = []
-    for i in range(cnt):
-        data.append({
-            'question': temp_df[i][0],
-            'answer': temp_df[i][1],
-            'conditions': temp_df[i][2],
-            'context': temp_df[i][3]
-        })
-    
-    return f'{data}'
-
-
-def return_prompt(title, state, program_type, sector_type, text, question_type, fewshot_examples, num_questions):
+    return get_example_pool().sample(cnt, question_type, program_type, seed)
+
+
+def question_type_instructions(question_type, program_type):
     """
-    Constructs the final prompt string by combining instructions, metadata, examples, and the text.
+    Returns the additional instructions for a (question type, policy type) pair.
     """
+    question_types, policy_types = config.question_types, config.policy_types
     example_injection_prompts = {
         (question_types[0], policy_types[1]): """
 - Generate a Yes/No question based on an Incentives policy document. Only create questions with Yes/No answers and doesn't require any condition.
@@ -82,8 +66,16 @@ def return_prompt(title, state, program_type, sector_type, text, question_type,
         """,
     }
 
-    additional_instruction = example_injection_prompts.get((question_type, program_type), "")
-    examples = return_examples(fewshot_examples, question_type, program_type)
+    return example_injection_prompts.get((question_type, program_type), "")
+
+def return_prompt(title, state, program_type, sector_type, text, question_type, fewshot_examples, num_questions, seed=None):
+    """
+    Constructs the final prompt string by combining instructions, metadata, examples, and the text.
+    """
+    additional_instruction = question_type_instructions(question_type, program_type)
+    examples = return_examples(fewshot_examples, question_type, program_type, seed)
+    if config.PROMPT_LAYOUT == 'prefix':
+        return prefix_prompt(title, state, program_type, sector_type, text, question_type, additional_instruction, examples, num_questions)
 
     return rf'''You are a QA dataset generator designed to create high-quality question-answer-context from solar and energy policy documents. Follow the instructions carefully.
 
@@ -129,3 +121,56 @@ def return_prompt(title, state, program_type, sector_type, text, question_type,
 ## Text:
 {text}
 '''
+
+def prefix_prompt(title, state, program_type, sector_type, text, question_type, additional_instruction, examples, num_questions):
+    """
+    Same instructions as the legacy layout, ordered from most to least shared: the fixed instructions,
+    then the document metadata and chunk, then the question type, examples and question count.
+    """
+    return rf'''You are a QA dataset generator designed to create high-quality question-answer-context from solar and energy policy documents. Follow the instructions carefully.
+
+## Instructions:
+- The text is US solar policy document in markdown format. For questions and answers, modify the text to make it readable and user-friendly.
+- Extract key findings that are valuable and avoid unnecessary or repetitive details.
+- Ensure the answers are present in the text. Do not make any inferences or provide answers beyond what is mentioned.
+- Generate at most the number of questions given in the task, with their answers and contexts. Answer can be modified from the text but context should be exact same words from the text.
+- Capture all important information in distinct QA pairs, avoiding any overlap or redundancy between pairs.
+- The text contains structured data like tables and lists, understand the information given and create questions from that.
+- The text has some code for html, markdown code, separators, blank lines which is unnecessary for the original text. So, remove it from the questions and answers.
+- The text has many order lists. So, there are many letter like a, b, etc at the start and at the end showing the order number of that list. Remove them from the answers. 
+- The questions should be of the type given in the task. Do not create questions of other types. There are total 5 types - Yes/No (without conditions), Yes/No with conditions, Legal Obligation, Factual and Descriptive.
+- The questions should contain location information - the state in the metadata - and the policy title from the metadata and make the questions as specific as possible.
+- Add detailed scenarios in the questions if possible. Use the Program Sector in the metadata to create first person scenarios for users who want to know more about the policy.
+- Generate scenarios that can change the outcome of the question based on the user requirements.
+- Do not use keywords like this program or sections reference that require a specific document to look and answer the question.
+- Never create questions from the metadata entirely. Only use it to make questions more rich and specific.
+- The text may have reference of other sections which needs to be removed in the answers to remove confusions.
+- The questions should be of the task's question type only. It shouldn't be of any other type no matter what.
+- If there are no questions possible from the text. Return 'NA'. Do not return anything else, no matter what.
+- Use the examples given in the task to understand the problem in a better way and improve your final result. But do not create questions from the examples.
+
+## Output Format:
+### <QA Pair number> 
+**Question** - <question>
+**Answer** - <answer>
+**Conditions** - [<conditions>]
+**Context** - <context>
+
+## Metadata (for reference only):
+**title** - {title}
+**state** - {state}
+**Program Type** - {program_type}
+**Program Sector** - {sector_type}
+
+## Text:
+{text}
+
+## Task:
+Generate at most {num_questions} questions of type {question_type}.
+
+## Additional Instructions for question type {question_type}:
+{additional_instruction}
+
+## Examples:
+{examples}
+'''
@@ -0,0 +1,145 @@
+import asyncio
+from tqdm import tqdm
+from .chunk_store import get_chunks, chunk_ids
+from . import config
+from .config import models, question_types_list, fewshot_prompts, MAX_IN_FLIGHT, MODEL_CONCURRENCY
+from .generator import (document_id, document_metadata, output_path, load_responses,
+                        build_prompt, build_record, parse_response, write_output)
+from .llm_runner import init_llm
+from Common.llm_calls import acomplete
+from Common.call_policy import classify
+from Common.tracing import labels
+from Common.job_ledger import lease_lost
+
+class Job:
+    """
+    One (file, model, question type) output file whose chunks are generated concurrently.
+    """
+    def __init__(self, markdown_file, output_file, model, question_type, fewshot_examples):
+        self.markdown_file = markdown_file
+        self.output_file = output_file
+        self.model = model
+        self.question_type = question_type
+        self.fewshot_examples = fewshot_examples
+        self.id = document_id(markdown_file)
+        self.chunks = get_chunks(markdown_file)
+        self.chunk_ids = chunk_ids(self.chunks)
+        self.records = [None] * len(self.chunks)
+        self.pending = len(self.chunks)
+        self.checkpoint = None
+
+    def finish_chunk(self, index, record, status=None):
+        """
+        Stores a chunk result, checkpointing it when `status` is given, and writes the output file
+        once every chunk of the job is done.
+        """
+        self.records[index] = record
+        if status is not None:
+            self.checkpoint.append(self.chunk_ids[index], record, status)
+        self.pending -= 1
+        if self.pending == 0:
+            self.checkpoint.close()
+            write_output(self.output_file, [r for r in self.records if r is not None])
+            return True
+        return False
+
+async def generate_chunk(llm, job, index, metadata, in_flight):
+    chunk_id, chunk = job.chunks[index]
+    with labels(model=job.model, question_type=job.question_type, stage='generation'):
+        prompt = build_prompt(job.markdown_file, chunk, metadata, job.question_type, job.fewshot_examples)
+        async with in_flight:
+            response_text = await acomplete(llm, prompt)
+
+        if response_text == 'NA':
+            return None, 'NA'
+        if not response_text:
+            return None, None  # not checkpointed, so the next run asks for this chunk again
+        return build_record(chunk_id, chunk, parse_response(response_text, job.markdown_file, chunk_id), job.question_type, job.id, llm.model), 'ok'
+
+async def produce(model, markdown_files, output_folder, queue, progress):
+    """
+    Enqueues every pending chunk of one model's jobs, reusing responses already present in output files.
+    With the 'prefix' prompt layout a file's chunks are enqueued chunk by chunk across question types,
+    so prompts sharing a prefix reach Ollama together.
+    """
+    for markdown_file in markdown_files:
+        pending = []
+        for q in question_types_list:
+            output_file = output_path(markdown_file, output_folder, model, q, fewshot_prompts[(model, q)])
+            if output_file is None:
+                continue
+
+            job = Job(markdown_file, output_file, model, q, fewshot_prompts[(model, q)])
+            if not job.chunks:
+                write_output(output_file, [])
+                progress.update(1)
+                continue
+
+            job.checkpoint, chunk_to_response = load_responses(output_file)
+            metadata = document_metadata(job.id)
+            for index, chunk_id in enumerate(job.chunk_ids):
+                if chunk_id in chunk_to_response:
+                    response = chunk_to_response[chunk_id]
+                    record = build_record(chunk_id, job.chunks[index][1], response, q, job.id, model) if response is not None else None
+                    if job.finish_chunk(index, record):
+                        progress.update(1)
+                else:
+                    pending.append((job, index, metadata))
+
+        if config.PROMPT_LAYOUT == 'prefix':
+            pending.sort(key=lambda item: item[1])  # stable, so question types stay in order within a chunk
+        for item in pending:
+            await queue.put(item)
+
+async def consume(llm, queue, in_flight, progress, errors):
+    while True:
+        job, index, metadata = await queue.get()
+        if lease_lost():
+            # The job ledger gave this job to another worker; drain the queue without calling the model
+            queue.task_done()
+            continue
+        try:
+            record, status = await generate_chunk(llm, job, index, metadata, in_flight)
+            if status is None:
+                errors.append({'file': job.markdown_file, 'model': job.model, 'question_type': job.question_type,
+                               'chunk_index': index, 'outcome': 'empty', 'error': 'empty response'})
+        except Exception as e:
+            errors.append({'file': job.markdown_file, 'model': job.model, 'question_type': job.question_type,
+                           'chunk_index': index, 'outcome': classify(e), 'error': str(e)})
+            record, status = None, None
+        if job.finish_chunk(index, record, status):
+            progress.update(1)
+        queue.task_done()
+
+async def run_scheduler(markdown_files, output_folder, max_in_flight=MAX_IN_FLIGHT, model_concurrency=None, model_names=None):
+    """
+    Generates QA pairs for every (file, model, question type, chunk) work item concurrently.
+
+    Each model gets its own queue drained by `model_concurrency[model]` workers, and all workers share
+    a global cap of `max_in_flight` outstanding LLM requests. Output files match `extract_qa_pairs`.
+    Pass `model_names` to restrict the run to a subset of `models`.
+    """
+    model_concurrency = model_concurrency or MODEL_CONCURRENCY
+    model_names = model_names or models
+    in_flight = asyncio.Semaphore(max_in_flight)
+    errors = []
+    progress = tqdm(total=len(markdown_files) * len(model_names) * len(question_types_list), desc='Jobs')
+
+    workers, producers, queues = [], [], []
+    for model in model_names:
+        llm = init_llm(model)
+        queue = asyncio.Queue(maxsize=4 * model_concurrency.get(model, 1))
+        queues.append(queue)
+        producers.append(asyncio.create_task(produce(model, markdown_files, output_folder, queue, progress)))
+        for _ in range(model_concurrency.get(model, 1)):
+            workers.append(asyncio.create_task(consume(llm, queue, in_flight, progress, errors)))
+
+    await asyncio.gather(*producers)
+    for queue in queues:
+        await queue.join()
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    progress.close()
+
+    return errors
@@ -0,0 +1,101 @@
+import re
+import math
+from functools import lru_cache
+from .config import (TOKENIZER, TOKEN_ESTIMATE_SCALE, TOKEN_CACHE_SIZE, CONTEXT_TOKENS,
+                     QUESTION_TOKENS, RESPONSE_TOKENS_PER_QUESTION, METADATA_TOKENS,
+                     models, question_types_list, fewshot_prompts)
+
+# Runs the estimator prices differently: letters, digits (BPE vocabularies group at most 3)
+# and symbol runs (table rules and markdown markup); whitespace is absorbed by the next token
+ESTIMATE_PATTERN = re.compile(r'(?P<word>[^\W\d_]+)|(?P<digits>\d+)|(?P<symbols>[^\w\s]+)')
+
+def estimate_tokens(text):
+    """
+    Offline token estimate for BPE tokenizers, scaled by TOKEN_ESTIMATE_SCALE.
+    """
+    total = 0
+    for match in ESTIMATE_PATTERN.finditer(text):
+        length = match.end() - match.start()
+        kind = match.lastgroup
+        if kind == 'word':
+            total += math.ceil(length / 5)
+        elif kind == 'digits':
+            total += math.ceil(length / 3)
+        else:
+            total += math.ceil(length / 2)
+    return math.ceil(total * TOKEN_ESTIMATE_SCALE)
+
+@lru_cache(maxsize=None)
+def get_encoder():
+    """
+    Returns the local tiktoken encoder, or None when TOKENIZER is 'estimate' or the encoding is not cached locally.
+    """
+    if TOKENIZER != 'tiktoken':
+        return None
+    try:
+        import tiktoken
+        return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        print(f"tiktoken unavailable ({e.__class__.__name__}), falling back to the token estimator")
+        return None
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def count_tokens(text):
+    """
+    Counts the tokens of a text with the configured tokenizer. Results are cached because
+    chunking counts the same sections and paragraphs repeatedly.
+    """
+    encoder = get_encoder()
+    if encoder is None:
+        return estimate_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+def calibrate_estimate(texts, count):
+    """
+    Returns the TOKEN_ESTIMATE_SCALE that makes the estimator match a reference counter
+    (e.g. a model's own tokenizer) over sample texts.
+    """
+    estimated = sum(estimate_tokens(text) for text in texts) / TOKEN_ESTIMATE_SCALE
+    return sum(count(text) for text in texts) / estimated
+
+@lru_cache(maxsize=None)
+def prompt_overhead():
+    """
+    Upper bound on the token count of a generation prompt without its text: instructions, the
+    additional instructions of each question type and policy type, and the longest few-shot examples
+    of that group, as many as configured for the question type, plus METADATA_TOKENS of headroom
+    for titles and states.
+    """
+    from . import config
+    from .prompts import return_prompt
+    from .examples import get_example_pool
+
+    overhead = 0
+    for question_type in question_types_list:
+        fewshot_examples = max(fewshot_prompts[(model, question_type)] for model in models)
+        for program_type in config.policy_types:
+            prompt = return_prompt('', '', program_type, '', '', question_type, 0, 99, 0)
+            examples = get_example_pool().longest(fewshot_examples, question_type, program_type, count_tokens)
+            overhead = max(overhead, count_tokens(prompt) + count_tokens(examples))
+    return overhead + METADATA_TOKENS
+
+@lru_cache(maxsize=None)
+def chunk_token_budget():
+    """
+    Chunk size in tokens such that the prompt overhead, the chunk and the expected response
+    (RESPONSE_TOKENS_PER_QUESTION for each of its `question_count` questions, rounded up) fit in CONTEXT_TOKENS.
+    """
+    available = CONTEXT_TOKENS - prompt_overhead()
+    questions = available // (QUESTION_TOKENS + RESPONSE_TOKENS_PER_QUESTION)
+    budget = questions * QUESTION_TOKENS
+    # Tokens past the last full question still fit if the extra question's response does too
+    budget += max(0, available - questions * (QUESTION_TOKENS + RESPONSE_TOKENS_PER_QUESTION) - RESPONSE_TOKENS_PER_QUESTION)
+    if budget < QUESTION_TOKENS:
+        raise ValueError(f'CONTEXT_TOKENS={CONTEXT_TOKENS} leaves only {budget} tokens per chunk after the prompt overhead')
+    return budget
+
+def question_count(chunk):
+    """
+    Number of questions to ask for a chunk in token mode.
+    """
+    return math.ceil(count_tokens(chunk) / QUESTION_TOKENS)
@@ -0,0 +1,76 @@
+"""
+Scaling of near-duplicate clustering: pairwise cosine + union-find versus the blocked matrix pass.
+
+Run from the repository root: python -m benchmarks.bench_dedup [max_pairwise_n]
+"""
+import sys
+import time
+import numpy as np
+from Filtering.similarity import similarity_clusters
+
+def pairwise_clusters(embeddings, threshold=0.95):
+    """
+    The previous per-pair loop, with torch's cosine similarity when it is installed.
+    """
+    try:
+        import torch
+        from sentence_transformers import util
+
+        def cos_sim(a, b):
+            return util.pytorch_cos_sim(torch.tensor(a).unsqueeze(0), torch.tensor(b).unsqueeze(0)).item()
+    except ImportError:
+        def cos_sim(a, b):
+            a, b = np.asarray(a, dtype=np.float32), np.asarray(b, dtype=np.float32)
+            return float(a @ b / max(np.linalg.norm(a) * np.linalg.norm(b), 1e-12))
+
+    n = len(embeddings)
+    parent = list(range(n))
+
+    def find(x):
+        if parent[x] != x:
+            parent[x] = find(parent[x])
+        return parent[x]
+
+    for i in range(n):
+        for j in range(i + 1, n):
+            if cos_sim(embeddings[i], embeddings[j]) >= threshold:
+                root_i, root_j = find(i), find(j)
+                if root_i != root_j:
+                    parent[root_j] = root_i
+
+    clusters = {}
+    for i in range(n):
+        clusters.setdefault(find(i), []).append(i)
+    return list(clusters.values())
+
+def make_embeddings(n, dim=4096, duplicate_rate=0.3, seed=0):
+    """
+    Random embeddings where roughly `duplicate_rate` of the rows are small perturbations of an earlier row.
+    """
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((n, dim)).astype(np.float32)
+    for i in range(1, n):
+        if rng.random() < duplicate_rate:
+            source = rng.integers(0, i)
+            matrix[i] = matrix[source] + 0.05 * rng.standard_normal(dim).astype(np.float32)
+    return matrix.tolist()
+
+if __name__ == "__main__":
+    max_pairwise_n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    print(f'{"n":>6} {"pairwise (s)":>13} {"matrix (s)":>11} {"clusters":>9} match')
+    for n in [10, 100, 1000, 10000]:
+        embeddings = make_embeddings(n, dim=1024 if n > 1000 else 4096)
+
+        start = time.perf_counter()
+        clusters = similarity_clusters(embeddings)
+        matrix_time = time.perf_counter() - start
+
+        if n <= max_pairwise_n:
+            start = time.perf_counter()
+            expected = pairwise_clusters(embeddings)
+            pairwise = f'{time.perf_counter() - start:13.3f}'
+            match = 'yes' if clusters == expected else 'NO'
+        else:
+            pairwise, match = f'{"skipped":>13}', '-'
+
+        print(f'{n:>6} {pairwise} {matrix_time:11.3f} {len(clusters):>9} {match}')
@@ -0,0 +1,53 @@
+"""
+Prompts/sec for few-shot example sampling before and after the pre-grouped example pools.
+
+Run from the repository root: python -m benchmarks.bench_examples [n_prompts]
+"""
+import sys
+import time
+from itertools import product
+from Generation import config
+from Generation import prompts
+from Generation.config import models, question_types_list, fewshot_prompts
+
+def legacy_return_examples(cnt, question_type, program_type, seed=None):
+    context_df = config.context_df
+    temp_df = context_df[
+        (context_df['policy_type'] == program_type) &
+        (context_df['question_type'] == question_type)
+    ].sample(n=cnt)
+
+    temp_df = temp_df[['question', 'answer', 'condition', 'context', 'q_rating', 'a_rating']]
+    temp_df['rating'] = temp_df.apply(lambda row: 0.5 * row['q_rating'] + 0.5 * row['a_rating'], axis=1)
+    temp_df = temp_df.sort_values(by='rating', ascending=False).to_numpy()
+
+    data = []
+    for i in range(cnt):
+        data.append({
+            'question': temp_df[i][0],
+            'answer': temp_df[i][1],
+            'conditions': temp_df[i][2],
+            'context': temp_df[i][3]
+        })
+    return f'{data}'
+
+def run(n_prompts, return_examples):
+    prompts.return_examples = return_examples
+    jobs = list(product(config.policy_types, models, question_types_list))
+    text = 'Sample policy text. ' * 200
+
+    start = time.perf_counter()
+    for i in range(n_prompts):
+        program_type, model, q = jobs[i % len(jobs)]
+        prompts.return_prompt('Title', 'State', program_type, 'Residential', text, q, fewshot_prompts[(model, q)], 4, seed=i)
+    return n_prompts / (time.perf_counter() - start)
+
+if __name__ == "__main__":
+    n_prompts = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    pooled = prompts.return_examples
+    pooled(1, question_types_list[0], config.policy_types[0])  # build the pool outside the timed loop
+
+    before = run(n_prompts, legacy_return_examples)
+    after = run(n_prompts, pooled)
+    print(f'legacy pandas sample+apply: {before:,.0f} prompts/sec')
+    print(f'pre-grouped example pools:  {after:,.0f} prompts/sec ({after / before:.1f}x)')
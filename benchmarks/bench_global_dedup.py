@@ -0,0 +1,71 @@
+"""
+Dataset-wide near-duplicate search: LSH candidate pairs versus the exact blocked matrix pass, on anisotropic
+embeddings whose mean pairwise cosine is about that of real sentence embeddings (~0.6).
+
+Run from the repository root: python -m benchmarks.bench_global_dedup [max_exact_n]
+"""
+import sys
+import time
+import numpy as np
+from Filtering import global_dedup
+from Filtering.similarity import normalize, similar_pairs
+from Filtering.config import SIMILARITY_THRESHOLD
+
+def make_embeddings(n, dim=768, shared=1.6, topics=200, duplicate_rate=0.2, seed=0):
+    """
+    Rows share a common direction (scaled by `shared`) plus one of `topics` topic directions and noise;
+    roughly `duplicate_rate` of them are small perturbations of an earlier row.
+    """
+    rng = np.random.default_rng(seed)
+    common = rng.standard_normal(dim).astype(np.float32)
+    centers = rng.standard_normal((topics, dim)).astype(np.float32) * 0.6
+    matrix = shared * common + centers[rng.integers(0, topics, n)] + rng.standard_normal((n, dim)).astype(np.float32)
+    for i in np.flatnonzero(rng.random(n) < duplicate_rate):
+        if i:
+            matrix[i] = matrix[rng.integers(0, i)] + 0.35 * rng.standard_normal(dim).astype(np.float32)
+    return normalize(matrix)
+
+def counted_lsh(matrix, threshold):
+    """
+    Runs lsh_pairs while counting the exact checks its buckets cost and the largest bucket compared.
+    """
+    stats = {'checks': 0, 'largest': 0}
+    exact = global_dedup.similar_pairs
+
+    def counting(bucket, *args, **kwargs):
+        stats['checks'] += len(bucket) * (len(bucket) - 1) // 2
+        stats['largest'] = max(stats['largest'], len(bucket))
+        return exact(bucket, *args, **kwargs)
+
+    global_dedup.similar_pairs = counting
+    try:
+        rows, cols = global_dedup.lsh_pairs(matrix, threshold)
+    finally:
+        global_dedup.similar_pairs = exact
+    return rows, cols, stats
+
+if __name__ == "__main__":
+    max_exact_n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    threshold = SIMILARITY_THRESHOLD
+    print(f'{"n":>6} {"mean cos":>8} {"lsh (s)":>8} {"largest":>8} {"checks/n^2":>10} {"exact (s)":>9} {"recall":>7}')
+    for n in [1000, 10000, 50000]:
+        matrix = make_embeddings(n)
+        sample = matrix[:2000]
+        mean_cos = float((sample @ sample.T).mean())
+
+        start = time.perf_counter()
+        rows, cols, stats = counted_lsh(matrix, threshold)
+        lsh_time = time.perf_counter() - start
+
+        if n <= max_exact_n:
+            start = time.perf_counter()
+            r, c = similar_pairs(matrix, threshold)
+            exact_time = f'{time.perf_counter() - start:9.2f}'
+            expected = set(zip(r.tolist(), c.tolist()))
+            found = set(zip(rows.tolist(), cols.tolist()))
+            recall = f'{len(found & expected) / max(len(expected), 1):7.4f}'
+        else:
+            exact_time, recall = f'{"skipped":>9}', f'{"-":>7}'
+
+        print(f'{n:>6} {mean_cos:8.2f} {lsh_time:8.2f} {stats["largest"]:>8} {stats["checks"] / n ** 2:10.4f} '
+              f'{exact_time} {recall}')
@@ -0,0 +1,111 @@
+"""
+Throughput and scaling of the QA response parser before and after the single-pass tokenizer.
+
+The corpus is synthetic responses (well-formed, label variants and malformed pairs) plus every
+real response in the LLM response cache when one exists.
+
+Run from the repository root: python -m benchmarks.bench_parser [n_responses]
+"""
+import os
+import re
+import sys
+import random
+import sqlite3
+import time
+from collections import defaultdict
+from Common.config import RESPONSE_CACHE_PATH
+from Generation.parser import parse_pairs
+
+def legacy_extract_pairs(text):
+    def remove_whitespaces(temp): return re.sub(r"^[\s\-:]+", "", temp)
+
+    res = []
+    qString, aString, cString, csString = '**Question**', '**Answer**', '**Context**', '**Conditions**'
+    for key in ['question', 'answer', 'context', 'conditions']:
+        for variant in [f"{key}:", f"{key}-", f"{key} -", f"{key.upper()}:", f"{key.upper()}-", f"{key.upper()} -"]:
+            text = text.replace(variant, key.capitalize())
+
+    while text:
+        pairs = defaultdict(str)
+        qStart = text.find(qString)
+        temp = remove_whitespaces(text[qStart + len(qString):])
+        aStart = temp.find(aString)
+        pairs['question'] = temp[:aStart].strip()
+        temp = remove_whitespaces(temp[aStart + len(aString):])
+        csStart = temp.find(csString)
+        pairs['answer'] = temp[:csStart].strip()
+        temp = remove_whitespaces(temp[csStart + len(csString):])
+        cStart = temp.find(cString)
+        pairs['conditions'] = temp[:cStart].strip()
+        temp = temp[cStart + len(cString):]
+        aStart = temp.find('###')
+        pairs['context'] = temp[:aStart].strip()
+        text = temp[aStart:]
+        res.append(pairs)
+        if aStart == -1: break
+    return res
+
+WORDS = 'the program offers a rebate for solar heat pump installations in residential buildings up to $500 per unit'.split()
+LABELS = {
+    'question': ['**Question** -', '**Question**:', '**question:**', '**QUESTION** -'],
+    'answer': ['**Answer** -', '**Answer**:', '**answer:**'],
+    'conditions': ['**Conditions** -', '**Conditions**:'],
+    'context': ['**Context** -', '**Context**:', '**context:**'],
+}
+
+def sentence(rng, n=12):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize() + '.'
+
+def synthetic_response(rng, n_pairs, malformed_rate=0.0):
+    parts = ['Here are the QA pairs:']
+    for i in range(n_pairs):
+        fields = ['question', 'answer', 'conditions', 'context']
+        if rng.random() < malformed_rate:
+            fields.remove(rng.choice(['answer', 'context']))
+        parts.append(f'### {i + 1}')
+        for field in fields:
+            value = f'[{sentence(rng, 6)}]' if field == 'conditions' else sentence(rng)
+            parts.append(f'{rng.choice(LABELS[field])} {value}')
+        parts.append('')
+    return '\n'.join(parts)
+
+def cached_responses():
+    if not RESPONSE_CACHE_PATH or not os.path.exists(RESPONSE_CACHE_PATH):
+        return []
+    with sqlite3.connect(RESPONSE_CACHE_PATH) as conn:
+        return [row[0] for row in conn.execute('SELECT response FROM responses') if '**' in row[0]]
+
+def throughput(parse, corpus):
+    start = time.perf_counter()
+    pairs = 0
+    for text in corpus:
+        pairs += len(parse(text))
+    return len(corpus) / (time.perf_counter() - start), pairs
+
+def garbage(pairs):
+    return sum(1 for p in pairs if not p['question'] or not p['answer'] or not p['context'] or '**' in ''.join(p.values()))
+
+if __name__ == "__main__":
+    n_responses = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    rng = random.Random(0)
+    real = cached_responses()
+    corpus = real + [synthetic_response(rng, rng.randint(2, 8), malformed_rate=0.1) for _ in range(n_responses)]
+    print(f'corpus: {len(real)} cached responses + {n_responses} synthetic')
+
+    new = lambda text: parse_pairs(text).pairs
+    before, legacy_pairs = throughput(legacy_extract_pairs, corpus)
+    after, new_pairs = throughput(new, corpus)
+    legacy_garbage = sum(garbage(legacy_extract_pairs(text)) for text in corpus)
+    malformed = sum(len(parse_pairs(text).malformed) for text in corpus)
+    print(f'legacy find/replace:  {before:,.0f} responses/sec, {legacy_pairs} pairs ({legacy_garbage} with missing fields or label residue)')
+    print(f'single-pass parser:   {after:,.0f} responses/sec, {new_pairs} pairs ({malformed} malformed reported) ({after / before:.1f}x)')
+
+    print(f'\n{"pairs":>6} {"legacy (ms)":>12} {"parser (ms)":>12}')
+    for n_pairs in (10, 100, 1000, 5000):
+        text = synthetic_response(random.Random(n_pairs), n_pairs)
+        timings = []
+        for parse in (legacy_extract_pairs, new):
+            start = time.perf_counter()
+            parse(text)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f'{n_pairs:>6} {timings[0]:>12.2f} {timings[1]:>12.2f}')
@@ -0,0 +1,236 @@
+"""
+End-to-end pipeline throughput against the mock Ollama server.
+
+Runs generation, evaluation, local filtering and the global filter as separate processes on the
+first `--docs` documents of data/final, inside a scratch directory (fresh caches and outputs).
+Each stage reports its wall time, peak RSS and the LLM/embedding requests the mock server saw.
+The JSON result also records docs/sec and LLM calls per generated QA pair; write it with
+--output to compare runs across commits. With --endpoints N the stages talk to N mock servers
+through the endpoint pool, the first --bad-endpoints of them failing every LLM request.
+
+Run from the repository root: python -m benchmarks.bench_pipeline [--docs 2] [--output bench.json]
+"""
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_FILES = ['final_df.json', 'context.csv']
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def fetch_json(url):
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return json.load(response)
+
+def fetch_stats(urls):
+    """
+    Sums the counters of several mock servers; 'endpoints' holds each server's LLM request count.
+    """
+    total = {"requests": {}, "endpoints": {}}
+    for url in urls:
+        stats = fetch_json(f'{url}/mock/stats')
+        for route, count in stats['requests'].items():
+            total['requests'][route] = total['requests'].get(route, 0) + count
+        total['endpoints'][url] = stats['requests'].get('chat', 0) + stats['requests'].get('generate', 0)
+        for field in ('prompt_tokens', 'cached_tokens', 'eval_tokens', 'prompt_eval_s'):
+            total[field] = total.get(field, 0) + stats[field]
+    return total
+
+def start_mock(port, args, error_rate=None):
+    command = [sys.executable, '-m', 'benchmarks.mock_ollama', '--port', str(port),
+               '--llm-latency', args.llm_latency, '--embed-latency', args.embed_latency,
+               '--token-rate', str(args.token_rate), '--na-rate', str(args.na_rate),
+               '--error-rate', str(args.error_rate if error_rate is None else error_rate), '--hang-rate', str(args.hang_rate), '--hang-seconds', str(args.hang_seconds),
+               '--kv-slots', str(args.kv_slots), '--prompt-rate', str(args.prompt_rate),
+               '--load-seconds', str(args.load_seconds)]
+    if args.loaded:
+        command += ['--loaded', args.loaded]
+    if args.recorded:
+        command += ['--recorded', os.path.abspath(args.recorded)]
+    process = subprocess.Popen(command, cwd=REPO, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            fetch_json(f'http://127.0.0.1:{port}/api/version')
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('mock Ollama server did not start')
+
+def scratch_tree(docs):
+    """
+    Builds a scratch working directory with the first `docs` documents and the metadata tables.
+    """
+    workdir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    os.makedirs(os.path.join(workdir, 'data', 'final'))
+    for name in DATA_FILES:
+        os.symlink(os.path.join(REPO, 'data', name), os.path.join(workdir, 'data', name))
+    documents = sorted(os.listdir(os.path.join(REPO, 'data', 'final')))[:docs]
+    for name in documents:
+        os.symlink(os.path.join(REPO, 'data', 'final', name), os.path.join(workdir, 'data', 'final', name))
+    return workdir, documents
+
+def run_stage(name, command, workdir, env, mock_urls, log):
+    """
+    Runs one stage to completion and returns its wall time, peak RSS and mock request counts.
+    """
+    before = fetch_stats(mock_urls)
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-m'] + command, cwd=workdir, env=env, stdout=log, stderr=log)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    wall = time.perf_counter() - start
+    after = fetch_stats(mock_urls)
+
+    requests = {route: count - before['requests'].get(route, 0) for route, count in after['requests'].items()}
+    llm_calls = requests.get('chat', 0) + requests.get('generate', 0)
+    embed_calls = requests.get('embed', 0) + requests.get('embeddings', 0)
+    print(f'{name:>12}: {wall:8.1f}s  {usage.ru_maxrss / 1024:7.0f} MB  {llm_calls:6d} LLM  {embed_calls:5d} embed  exit {process.returncode}')
+    return {
+        "wall_s": round(wall, 3),
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "llm_calls": llm_calls,
+        "embed_calls": embed_calls,
+        "requests": requests,
+        "endpoint_llm_calls": {url: count - before['endpoints'][url] for url, count in after['endpoints'].items()},
+        "prompt_tokens": after['prompt_tokens'] - before['prompt_tokens'],
+        "cached_prompt_tokens": after['cached_tokens'] - before['cached_tokens'],
+        "prompt_eval_s": round(after['prompt_eval_s'] - before['prompt_eval_s'], 3),
+        "eval_tokens": after['eval_tokens'] - before['eval_tokens'],
+        "returncode": process.returncode,
+    }
+
+def count_qa_pairs(folder):
+    total = 0
+    for root, _, files in os.walk(folder):
+        for file in files:
+            if file.endswith('.json'):
+                with open(os.path.join(root, file), 'r', encoding='utf-8') as f:
+                    total += sum(len(block.get('response') or []) for block in json.load(f))
+    return total
+
+def output_models(folder, block_key, field):
+    """
+    Returns the model names recorded in the JSON outputs under folder, e.g. each QA pair's 'model'.
+    """
+    found = set()
+    for root, _, files in os.walk(folder):
+        for file in files:
+            if file.endswith('.json'):
+                with open(os.path.join(root, file), 'r', encoding='utf-8') as f:
+                    for block in json.load(f):
+                        found.update(item[field] for item in block.get(block_key) or [] if field in item)
+                        if field in block:
+                            found.add(block[field])
+    return found
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(args):
+    ports = [free_port() for _ in range(args.endpoints)]
+    mocks = [start_mock(port, args, 1.0 if i < args.bad_endpoints else None) for i, port in enumerate(ports)]
+    mock_urls = [f'http://127.0.0.1:{port}' for port in ports]
+    workdir, documents = scratch_tree(args.docs)
+    env = dict(os.environ, OLLAMA_HOST=mock_urls[-1], PYTHONPATH=REPO)
+    if args.endpoints > 1:
+        env['QA_OLLAMA_ENDPOINTS'] = json.dumps({url: [] for url in mock_urls})
+
+    generation = ['Generation.main', 'data/final', 'output', '0', '--prompt-layout', args.prompt_layout]
+    generation += ['--concurrent'] if args.concurrent else []
+    stages = [
+        ('generation', generation),
+        ('evaluation', ['Evaluation.main', 'output/final/qa-gen', 'output', '0', '--mode', args.eval_mode,
+                        '--pairs-per-call', str(args.pairs_per_call), '--prompt-layout', args.prompt_layout]),
+        ('local_filter', ['Filtering.local_filtering', 'output/final_kri/qa-eval', 'output/local', '0',
+                          '--workers', str(args.workers)]),
+        ('global_filter', ['Filtering.global_filter', 'output/local', 'output/global'] + (['--stream'] if args.stream else [])),
+    ]
+
+    results = {}
+    print(f'{len(documents)} documents in {workdir}')
+    try:
+        with open(os.path.join(workdir, 'pipeline.log'), 'w') as log:
+            for name, command in stages:
+                results[name] = run_stage(name, command, workdir, env, mock_urls, log)
+                if results[name]['returncode'] != 0:
+                    print(f'{name} failed, see {log.name}')
+                    break
+        qa_pairs = count_qa_pairs(os.path.join(workdir, 'output', 'final', 'qa-gen'))
+        generated_models = output_models(os.path.join(workdir, 'output', 'final', 'qa-gen'), 'response', 'llm')
+        filtered_models = output_models(os.path.join(workdir, 'output', 'local'), 'result', 'model')
+    finally:
+        for mock in mocks:
+            mock.terminate()
+            mock.wait()
+
+    total_wall = sum(stage['wall_s'] for stage in results.values())
+    llm_calls = sum(stage['llm_calls'] for stage in results.values())
+    report = {
+        "commit": git_commit(),
+        "config": vars(args),
+        "documents": len(documents),
+        "qa_pairs": qa_pairs,
+        "total_wall_s": round(total_wall, 3),
+        "docs_per_sec": round(len(documents) / total_wall, 4) if total_wall else None,
+        "llm_calls": llm_calls,
+        "llm_calls_per_qa_pair": round(llm_calls / qa_pairs, 3) if qa_pairs else None,
+        "peak_rss_mb": max((stage['peak_rss_mb'] for stage in results.values()), default=None),
+        # Generation models with no QA pair in the local filter output, i.e. outputs it failed to find
+        "models_missing_after_local_filter": sorted(generated_models - filtered_models),
+        "stages": results,
+    }
+    print(json.dumps(report, indent=2))
+    if report['models_missing_after_local_filter'] and 'local_filter' in results:
+        print(f"Local filtering dropped every QA pair of {', '.join(report['models_missing_after_local_filter'])}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.keep:
+        print(f'Outputs kept in {workdir}')
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark against a mock Ollama server")
+    parser.add_argument("--docs", type=int, default=2, help="Number of data/final documents to process")
+    parser.add_argument("--llm-latency", default='fixed:0.01', help="Mock chat/generate latency distribution")
+    parser.add_argument("--embed-latency", default='fixed:0.002', help="Mock embedding latency distribution")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Mock generated tokens per second (0 disables)")
+    parser.add_argument("--na-rate", type=float, default=0.02, help="Share of generation prompts answered with 'NA'")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of mock LLM requests failing with HTTP 500")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Share of mock LLM requests delayed by --hang-seconds")
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    parser.add_argument("--kv-slots", type=int, default=0, help="Mock prompt cache slots per model (0 disables)")
+    parser.add_argument("--prompt-rate", type=float, default=0.0, help="Mock evaluated prompt tokens per second (0 disables)")
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="Mock delay of the first request for each model")
+    parser.add_argument("--loaded", help="Comma-separated models every mock server starts with loaded")
+    parser.add_argument("--endpoints", type=int, default=1, help="Mock servers, used through the endpoint pool when above 1")
+    parser.add_argument("--bad-endpoints", type=int, default=0, help="Mock servers failing every LLM request")
+    parser.add_argument("--prompt-layout", choices=['legacy', 'prefix'], default='legacy',
+                        help="Prompt layout for generation and evaluation")
+    parser.add_argument("--recorded", help="JSONL of recorded {\"prompt\", \"response\"} pairs to replay")
+    parser.add_argument("--concurrent", action="store_true", help="Run generation with the asyncio scheduler")
+    parser.add_argument("--eval-mode", choices=['single', 'batched', 'cascade', 'tiered'], default='single')
+    parser.add_argument("--pairs-per-call", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=2, help="Local filtering worker processes")
+    parser.add_argument("--stream", action="store_true", help="Run the global filter in streaming mode")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+
+    main(parser.parse_args())
@@ -0,0 +1,371 @@
+"""
+Local stand-in for an Ollama server, for measuring pipeline throughput without GPU-backed models.
+
+Speaks /api/chat, /api/generate, /api/embed, /api/embeddings, /api/show, /api/tags and /api/ps. Responses are
+recorded ones (JSONL of {"prompt", "response"} looked up by prompt) or canned ones shaped for each
+pipeline prompt: QA pairs for generation prompts and JSON scores for evaluation prompts. Canned
+responses and embeddings are deterministic functions of the request. GET /mock/stats returns
+request counters.
+
+Latency specs: fixed:S, uniform:LO,HI, lognormal:MEDIAN,SIGMA, exp:MEAN (seconds).
+--error-rate answers that share of chat/generate requests with HTTP 500 and --hang-rate delays
+that share by --hang-seconds, for exercising timeouts and retries.
+
+--kv-slots models Ollama's prompt cache: each model keeps the last N prompts, a request only evaluates
+the part of its prompt after the longest prefix shared with one of them, and prompt_eval_count counts
+those tokens alone. With --prompt-rate the evaluated tokens also cost time.
+
+--serve limits the models the server knows (others get Ollama's 404), and --load-seconds delays the
+first request for each model, which from then on is listed by /api/ps (--loaded starts with
+some already loaded). Start several servers on
+different ports to stand in for a pool of hosts.
+
+Run from the repository root: python -m benchmarks.mock_ollama [--port 11434] [--llm-latency lognormal:0.05,0.5]
+"""
+import os
+import re
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import defaultdict, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORD_PATTERN = re.compile(r'\w+')
+SENTENCE_PATTERN = re.compile(r'[^.!?\n|#*]{30,}[.!?]')
+
+def parse_latency(spec):
+    """
+    Returns a function of a random.Random that samples one latency in seconds.
+    """
+    kind, _, args = spec.partition(':')
+    values = [float(value) for value in args.split(',')] if args else []
+    if kind == 'fixed':
+        return lambda rng: values[0]
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == 'exp':
+        return lambda rng: rng.expovariate(1 / values[0])
+    raise ValueError(f'Unknown latency distribution: {spec}')
+
+def prompt_rng(*parts):
+    digest = hashlib.sha1('\x00'.join(parts).encode('utf-8')).digest()
+    return random.Random(int.from_bytes(digest[:8], 'big'))
+
+def generation_response(prompt, rng, na_rate):
+    """
+    QA pairs in the generation output format, built from sentences of the prompt's text.
+    """
+    if rng.random() < na_rate:
+        return 'NA'
+    match = re.search(r'Generate at most (\d+) questions', prompt)
+    n_questions = int(match.group(1)) if match else 3
+    text = prompt.split('## Text:', 1)[-1].split('\n## Task:', 1)[0]
+    sentences = [s.strip() for s in SENTENCE_PATTERN.findall(text)] or ['The policy text does not state this.']
+
+    pairs = []
+    for i in range(1, min(n_questions, 6) + 1):
+        sentence = rng.choice(sentences)
+        pairs.append(f"""### {i}
+**Question** - According to the policy, is it true that {sentence[:1].lower()}{sentence[1:-1]}?
+**Answer** - Yes. {sentence}
+**Conditions** - []
+**Context** - {sentence}
+""")
+    return '\n'.join(pairs)
+
+def score(rng):
+    return {"score": rng.choice([5, 6, 7, 7, 8, 8, 8, 9, 9, 10]), "reason": "Mock judgement."}
+
+def evaluation_response(prompt, rng):
+    if '"results"' not in prompt:
+        return json.dumps(score(rng))
+    metrics = re.findall(r'^### (\w+)$', prompt.split('## QA Pairs', 1)[0], re.MULTILINE)
+    n_pairs = len(re.findall(r'^### \d+$', prompt.split('## QA Pairs', 1)[-1], re.MULTILINE))
+    return json.dumps({"results": [dict({"pair": i}, **{metric: score(rng) for metric in metrics})
+                                   for i in range(1, n_pairs + 1)]})
+
+def embedding(text, dim):
+    """
+    Hashed bag-of-words vector, so texts sharing words get similar embeddings.
+    """
+    vector = [0.0] * dim
+    for word in WORD_PATTERN.findall(text.lower()):
+        h = int.from_bytes(hashlib.md5(word.encode('utf-8')).digest()[:4], 'big')
+        vector[h % dim] += 1.0 if h & 1 << 31 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+class MockOllama:
+    def __init__(self, llm_latency='fixed:0.02', embed_latency='fixed:0.002', token_rate=0.0,
+                 na_rate=0.02, dim=256, recorded=None, seed=0, error_rate=0.0, hang_rate=0.0, hang_seconds=60.0,
+                 kv_slots=0, prompt_rate=0.0, serve=None, load_seconds=0.0, loaded=None):
+        self.llm_latency = parse_latency(llm_latency)
+        self.embed_latency = parse_latency(embed_latency)
+        self.token_rate = token_rate
+        self.na_rate = na_rate
+        self.dim = dim
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.prompt_rate = prompt_rate
+        self.kv_cache = defaultdict(lambda: deque(maxlen=kv_slots)) if kv_slots else None
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.models = set()
+        self.serve = set(serve) if serve else None
+        self.load_seconds = load_seconds
+        self.loaded = set(loaded or [])
+        self.stats = {"requests": {}, "models": {}, "prompt_tokens": 0, "cached_tokens": 0, "eval_tokens": 0,
+                      "prompt_eval_s": 0.0, "recorded_hits": 0}
+        self.recorded = {}
+        if recorded:
+            with open(recorded, 'r', encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        item = json.loads(line)
+                        key = item.get('prompt_sha1') or hashlib.sha1(item['prompt'].encode('utf-8')).hexdigest()
+                        self.recorded[key] = item['response']
+
+    def count(self, route, model, prompt_tokens=0, eval_tokens=0, cached_tokens=0):
+        with self.lock:
+            self.stats['requests'][route] = self.stats['requests'].get(route, 0) + 1
+            self.stats['models'][model] = self.stats['models'].get(model, 0) + 1
+            self.stats['prompt_tokens'] += prompt_tokens
+            self.stats['cached_tokens'] += cached_tokens
+            self.stats['eval_tokens'] += eval_tokens
+            self.models.add(model)
+
+    def sleep(self, latency):
+        with self.lock:
+            seconds = latency(self.rng)
+        time.sleep(max(0.0, seconds))
+        return seconds
+
+    def fault(self):
+        """
+        Returns 'error', 'hang' or None for the next completion request.
+        """
+        with self.lock:
+            draw = self.rng.random()
+        if draw < self.error_rate:
+            return 'error'
+        if draw < self.error_rate + self.hang_rate:
+            return 'hang'
+        return None
+
+    def load(self, model):
+        """
+        Pays --load-seconds the first time a model is used.
+        """
+        with self.lock:
+            loading = model not in self.loaded
+            self.loaded.add(model)
+        if loading and self.load_seconds:
+            time.sleep(self.load_seconds)
+
+    def cached_prefix(self, model, prompt):
+        """
+        Characters of the prompt already in the model's cache, then caches the prompt.
+        """
+        if self.kv_cache is None:
+            return 0
+        with self.lock:
+            slots = self.kv_cache[model]
+            cached = max((len(os.path.commonprefix([prompt, previous])) for previous in slots), default=0)
+            slots.append(prompt)
+        return cached
+
+    def complete(self, route, model, prompt, json_mode):
+        """
+        Returns (text, Ollama timing/count fields) for a completion request.
+        """
+        self.load(model)
+        key = hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+        rng = prompt_rng(model, prompt)
+        if key in self.recorded:
+            text = self.recorded[key]
+            with self.lock:
+                self.stats['recorded_hits'] += 1
+        elif 'QA dataset generator' in prompt:
+            text = generation_response(prompt, rng, self.na_rate)
+        elif 'expert evaluator' in prompt or json_mode:
+            text = evaluation_response(prompt, rng)
+        else:
+            text = 'OK'
+
+        cached_tokens = self.cached_prefix(model, prompt) // 4
+        prompt_tokens, eval_tokens = max(1, len(prompt) // 4 - cached_tokens), max(1, len(text) // 4)
+        seconds = self.sleep(self.llm_latency)
+        prompt_seconds = seconds / 4
+        if self.prompt_rate:
+            prompt_seconds = prompt_tokens / self.prompt_rate
+            time.sleep(prompt_seconds)
+            seconds += prompt_seconds
+        if self.token_rate:
+            time.sleep(eval_tokens / self.token_rate)
+            seconds += eval_tokens / self.token_rate
+        self.count(route, model, prompt_tokens, eval_tokens, cached_tokens)
+        with self.lock:
+            self.stats['prompt_eval_s'] += prompt_seconds
+        nanos, prompt_nanos = int(seconds * 1e9), int(prompt_seconds * 1e9)
+        return text, {
+            "total_duration": nanos, "load_duration": 0,
+            "prompt_eval_count": prompt_tokens, "prompt_eval_duration": prompt_nanos,
+            "eval_count": eval_tokens, "eval_duration": nanos - prompt_nanos,
+        }
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients abandon timed-out and hedged requests; that is expected here
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, payload, status=200):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_result(self, request, payload):
+            if request.get('stream', True):
+                # Ollama streams NDJSON by default; the whole answer goes in one final chunk
+                body = (json.dumps(payload) + '\n').encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_json(payload)
+
+        def model_list(self, models):
+            return {"models": [{"name": model, "model": model, "size": 0, "digest": hashlib.sha1(model.encode()).hexdigest(),
+                                "details": {}} for model in sorted(models)]}
+
+        def do_GET(self):
+            if self.path == '/api/tags':
+                self.send_json(self.model_list(mock.models | (mock.serve or set())))
+            elif self.path == '/api/ps':
+                with mock.lock:
+                    self.send_json(self.model_list(set(mock.loaded)))
+            elif self.path == '/mock/stats':
+                with mock.lock:
+                    self.send_json(json.loads(json.dumps(mock.stats)))
+            elif self.path in ('/', '/api/version'):
+                self.send_json({"version": "mock"})
+            else:
+                self.send_json({"error": "not found"}, 404)
+
+        def do_HEAD(self):
+            self.send_response(200)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+            model = request.get('model', '')
+            created_at = datetime.now(timezone.utc).isoformat()
+            json_mode = bool(request.get('format'))
+
+            if mock.serve is not None and model not in mock.serve:
+                mock.count('not_found', model)
+                self.send_json({"error": f"model '{model}' not found"}, 404)
+                return
+
+            if self.path in ('/api/chat', '/api/generate'):
+                fault = mock.fault()
+                if fault == 'error':
+                    mock.count('error', model)
+                    self.send_json({"error": "mock failure"}, 500)
+                    return
+                if fault == 'hang':
+                    mock.count('hang', model)
+                    time.sleep(mock.hang_seconds)
+
+            if self.path == '/api/chat':
+                prompt = '\n'.join(message.get('content') or '' for message in request.get('messages', []))
+                text, timings = mock.complete('chat', model, prompt, json_mode)
+                self.send_result(request, dict({"model": model, "created_at": created_at, "done": True, "done_reason": "stop",
+                                                "message": {"role": "assistant", "content": text}}, **timings))
+            elif self.path == '/api/generate':
+                text, timings = mock.complete('generate', model, request.get('prompt', ''), json_mode)
+                self.send_result(request, dict({"model": model, "created_at": created_at, "done": True, "done_reason": "stop",
+                                                "response": text}, **timings))
+            elif self.path == '/api/embed':
+                texts = request.get('input', [])
+                texts = [texts] if isinstance(texts, str) else texts
+                mock.load(model)
+                mock.sleep(mock.embed_latency)
+                mock.count('embed', model, sum(len(text) // 4 for text in texts))
+                self.send_json({"model": model, "embeddings": [embedding(text, mock.dim) for text in texts]})
+            elif self.path == '/api/show':
+                # llama_index reads the context window from model_info
+                mock.count('show', model)
+                self.send_json({"modelfile": "", "parameters": "", "template": "", "details": {"family": "mock"},
+                                "model_info": {"general.architecture": "mock", "mock.context_length": 8192}})
+            elif self.path == '/api/embeddings':
+                mock.load(model)
+                mock.sleep(mock.embed_latency)
+                mock.count('embeddings', model, len(request.get('prompt', '')) // 4)
+                self.send_json({"embedding": embedding(request.get('prompt', ''), mock.dim)})
+            else:
+                self.send_json({"error": "not found"}, 404)
+
+    return Handler
+
+def serve(port=11434, host='127.0.0.1', **options):
+    """
+    Starts the mock server in a background thread and returns it; call shutdown() to stop it.
+    """
+    server = MockServer((host, port), make_handler(MockOllama(**options)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Ollama server")
+    parser.add_argument("--host", default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--llm-latency", default='fixed:0.02', help="Latency of chat/generate requests")
+    parser.add_argument("--embed-latency", default='fixed:0.002', help="Latency of embedding requests")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Generated tokens per second (0 disables)")
+    parser.add_argument("--na-rate", type=float, default=0.02, help="Share of generation prompts answered with 'NA'")
+    parser.add_argument("--dim", type=int, default=256, help="Embedding dimension")
+    parser.add_argument("--recorded", help="JSONL of recorded {\"prompt\", \"response\"} pairs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of chat/generate requests answered with HTTP 500")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Share of chat/generate requests delayed by --hang-seconds")
+    parser.add_argument("--hang-seconds", type=float, default=60.0)
+    parser.add_argument("--kv-slots", type=int, default=0, help="Cached prompts kept per model for prefix reuse (0 disables)")
+    parser.add_argument("--prompt-rate", type=float, default=0.0, help="Evaluated prompt tokens per second (0 disables)")
+    parser.add_argument("--serve", help="Comma-separated models this server knows (default: any)")
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="Delay of the first request for each model")
+    parser.add_argument("--loaded", help="Comma-separated models loaded from the start")
+
+    args = parser.parse_args()
+    server = MockServer((args.host, args.port), make_handler(MockOllama(
+        args.llm_latency, args.embed_latency, args.token_rate, args.na_rate, args.dim, args.recorded, args.seed,
+        args.error_rate, args.hang_rate, args.hang_seconds, args.kv_slots, args.prompt_rate,
+        args.serve.split(',') if args.serve else None, args.load_seconds,
+        args.loaded.split(',') if args.loaded else None)))
+    print(f'Mock Ollama listening on http://{args.host}:{server.server_port}', flush=True)
+    server.serve_forever()